@@ -0,0 +1,148 @@
+import glob
+import os
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import yaml
+
+TABLE_FILE_NAME = "runs.csv"
+# every refresh saves curves of its new runs in a new part, files of earlier parts are never rewritten
+CURVES_FILE_NAME_FORMAT = "cumulative_regrets_{part}.npy"
+CURVES_STEPS_FILE_NAME_FORMAT = "cumulative_regrets_steps_{part}.npy"
+# stores created before curves were saved in parts hold all curves in one part with these files
+LEGACY_CURVES_PART = -1
+LEGACY_CURVES_FILE_NAME = "cumulative_regrets.npy"
+LEGACY_CURVES_STEPS_FILE_NAME = "cumulative_regrets_steps.npy"
+
+
+def _load_yaml(file_path: str) -> Dict:
+    with open(file_path, 'r') as f:
+        return yaml.safe_load(f)
+
+
+def is_finished(run_path: str) -> bool:
+    return os.path.exists(os.path.join(run_path, "regrets")) or \
+        bool(glob.glob(os.path.join(run_path, "regrets_*.npy"))) or \
+        bool(glob.glob(os.path.join(run_path, "cumulative_regrets_*.npy")))
+
+
+def _curves_paths(store_directory: str, part: int) -> Tuple[str, str]:
+    if part == LEGACY_CURVES_PART:
+        return (os.path.join(store_directory, LEGACY_CURVES_FILE_NAME),
+                os.path.join(store_directory, LEGACY_CURVES_STEPS_FILE_NAME))
+    return (os.path.join(store_directory, CURVES_FILE_NAME_FORMAT.format(part=part)),
+            os.path.join(store_directory, CURVES_STEPS_FILE_NAME_FORMAT.format(part=part)))
+
+
+def _save_array(array: np.array, file_path: str) -> None:
+    # writing to a temporary file first and swapping it in, so that readers never see a partially written file
+    with open(file_path + ".tmp", "wb") as f:
+        np.save(f, array)
+    os.replace(file_path + ".tmp", file_path)
+
+
+def load_regrets(run_path: str) -> Dict[str, np.array]:
+    """Loads regrets of every model from .npy files or, for older runs, from the YAML file regrets"""
+    file_paths = sorted(glob.glob(os.path.join(run_path, "regrets_*.npy")))
+    if file_paths:
+        return {os.path.basename(p)[len("regrets_"):-len(".npy")]: np.load(p) for p in file_paths}
+    regrets = _load_yaml(os.path.join(run_path, "regrets"))
+    return {model_name: np.asarray(model_regrets, dtype=float) for model_name, model_regrets in regrets.items()}
+
+
+def load_cumulative_regrets(run_path: str) -> Dict[str, Tuple[np.array, np.array]]:
+    """
+    Returns steps and cumulative regrets after them of every model: after every step or, for runs with
+    --record checkpoints, only after their checkpoint steps
+    """
+    file_paths = sorted(glob.glob(os.path.join(run_path, "cumulative_regrets_*.npy")))
+    if file_paths:
+        steps = np.load(os.path.join(run_path, "checkpoint_steps.npy"))
+        return {os.path.basename(p)[len("cumulative_regrets_"):-len(".npy")]: (steps, np.load(p)) for p in file_paths}
+    return {model_name: (np.arange(1, len(regrets) + 1), np.cumsum(regrets))
+            for model_name, regrets in load_regrets(run_path).items()}
+
+
+def load_run(run_path: str) -> List[Dict]:
+    """Returns one record per model with environment and model arguments, total and cumulative regret"""
+    environment_kwargs = _load_yaml(os.path.join(run_path, "environment_kwargs"))
+    records = []
+    for model_name, (steps, cumulative_regret) in load_cumulative_regrets(run_path).items():
+        model_kwargs = _load_yaml(os.path.join(run_path, f"{model_name}_kwargs"))
+        record = dict(environment_kwargs)
+        record.update({argument: value for argument, value in model_kwargs.items() if argument != "X"})
+        record["run_name"] = os.path.basename(os.path.normpath(run_path))
+        record["path"] = run_path
+        record["model_name"] = model_name
+        record["total_regret"] = float(cumulative_regret[-1]) if len(cumulative_regret) else 0.
+        record["cumulative_regret"] = cumulative_regret
+        record["cumulative_regret_steps"] = steps
+        records.append(record)
+    return records
+
+
+def load_runs(run_paths: List[str], processes: Optional[int] = None) -> List[Dict]:
+    with Pool(processes) as pool:
+        return [record for run_records in pool.map(load_run, run_paths) for record in run_records]
+
+
+def load_store(store_directory: str) -> pd.DataFrame:
+    """
+    Loads the store: one row per (run, model) with cumulative_regret column holding slices of memory-mapped curves
+    and cumulative_regret_steps column holding steps of their values
+    """
+    table_path = os.path.join(store_directory, TABLE_FILE_NAME)
+    if not os.path.exists(table_path):
+        return pd.DataFrame()
+    table = pd.read_csv(table_path, float_precision="round_trip")
+    if "curve_part" not in table.columns:
+        table["curve_part"] = LEGACY_CURVES_PART
+    curves, curves_steps = {}, {}
+    for part in table.curve_part.unique():
+        curves_path, steps_path = _curves_paths(store_directory, part)
+        curves[part] = np.load(curves_path, mmap_mode="r")
+        # stores created before runs with --record checkpoints hold curves of all steps without their steps
+        curves_steps[part] = np.load(steps_path, mmap_mode="r") if os.path.exists(steps_path) else None
+    rows = list(zip(table.curve_part, table.curve_start, table.curve_length))
+    table["cumulative_regret"] = [curves[part][start:start + length] for part, start, length in rows]
+    table["cumulative_regret_steps"] = [np.arange(1, length + 1) if curves_steps[part] is None
+                                        else curves_steps[part][start:start + length] for part, start, length in rows]
+    return table
+
+
+def refresh_store(runs_directory: str, store_directory: str, processes: Optional[int] = None) -> pd.DataFrame:
+    """
+    Adds finished runs from runs_directory, which are not yet in the store, to the store and returns the whole store.
+    The store consists of a table with one row per (run, model) and cumulative regret curves and their steps
+    concatenated in two arrays per refresh (part); curve_part, curve_start and curve_length columns point to
+    the curve of each row. Curves of runs already in the store are not rewritten, so stores loaded earlier
+    (with memory-mapped curves) stay valid; the new table is swapped in last.
+    """
+    os.makedirs(store_directory, exist_ok=True)
+    table = load_store(store_directory)
+    known_run_names = set(table.run_name) if len(table) else set()
+    new_run_paths = [p for p in sorted(glob.glob(os.path.join(runs_directory, "*")))
+                     if os.path.basename(p) not in known_run_names and os.path.isdir(p) and is_finished(p)]
+    if not new_run_paths:
+        return table
+
+    records = load_runs(new_run_paths, processes)
+    new_curves = [record.pop("cumulative_regret") for record in records]
+    new_curves_steps = [record.pop("cumulative_regret_steps") for record in records]
+    new_table = pd.DataFrame.from_records(records)
+    part = max(int(table.curve_part.max()) + 1, 0) if len(table) else 0
+    new_table["curve_part"] = part
+    new_table["curve_length"] = [len(curve) for curve in new_curves]
+    new_table["curve_start"] = np.cumsum([0] + new_table.curve_length.tolist()[:-1])
+
+    curves_path, steps_path = _curves_paths(store_directory, part)
+    _save_array(np.concatenate(new_curves), curves_path)
+    _save_array(np.concatenate(new_curves_steps).astype(np.int64), steps_path)
+    table = pd.concat([table.drop(columns=["cumulative_regret", "cumulative_regret_steps"], errors="ignore"),
+                       new_table], ignore_index=True)
+    table_path = os.path.join(store_directory, TABLE_FILE_NAME)
+    table.to_csv(table_path + ".tmp", index=False)
+    os.replace(table_path + ".tmp", table_path)
+    return load_store(store_directory)
@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import yaml
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from models.linear_gaussian_sampling import LinearGaussianSampling
+from models.linear_semi_parametric_sampling import LinearSemiParametricSampling
+from simulation.log_saver import LogSaver
+from simulation.runner import run
+
+MODELS = {"LinearGaussianSampling": (LinearGaussianSampling, {"v": 1}),
+          "LinearSemiParametricSampling": (LinearSemiParametricSampling,
+                                           {"sigma_1": 1, "sigma_2": 0.1, "sigma_3": 0.1})}
+
+
+def get_args(args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Compare regret and time of choosing arms of linear models with "
+                                                 "a scan of all arms and with MipsIndex")
+    parser.add_argument("--models", type=str, nargs="+", default=list(MODELS.keys()), choices=list(MODELS.keys()),
+                        help="Names of the model classes")
+    parser.add_argument("--arms_nb", type=int, nargs="+", default=[100000], help="Numbers of arms")
+    parser.add_argument("--d", type=int, nargs="+", default=[5, 20], help="Dimensionalities of linear parameter vector")
+    parser.add_argument("--steps", type=int, default=500, help="Number of steps of every run")
+    parser.add_argument("--clusters_nb", type=int, required=False,
+                        help="Number of clusters of the index, by default square root of the number of arms")
+    parser.add_argument("--max_clusters", type=int, nargs="*", default=[1, 4, 16],
+                        help="Values of mips_max_clusters of approximate searches compared besides the exact one")
+    parser.add_argument("--reward_distribution", type=str, default="normal", choices=["binomial", "normal"],
+                        help="Distribution of rewards")
+    parser.add_argument("--a", type=float, default=0.5, help="Parameter a of the environment")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed of the environment and models")
+    parser.add_argument("--output_path", type=str, required=False, help="Path of the JSON file with results")
+    return parser.parse_args(args)
+
+
+def run_search(model_name: str, environment_kwargs: Dict, steps: int, mips_clusters_nb: Optional[int],
+               mips_max_clusters: Optional[int]) -> Dict[str, Any]:
+    model_class, hyperparameters = MODELS[model_name]
+    model_kwargs = {"arms_nb": environment_kwargs["N"], "d": environment_kwargs["d"], "X": None,
+                    "seed": environment_kwargs["seed"], "mips_clusters_nb": mips_clusters_nb,
+                    "mips_max_clusters": mips_max_clusters, **hyperparameters}
+    with tempfile.TemporaryDirectory() as directory:
+        log_saver = LogSaver("run", directory, None, save_every=steps + 1)
+        regrets = run(steps, environment_kwargs, {model_class: model_kwargs}, log_saver, profile=True)
+        with open(os.path.join(log_saver.path, "profile")) as f:
+            profile = yaml.safe_load(f)
+        arms = np.load(os.path.join(log_saver.path, f"arms_{model_name}.npy"))
+    return {"total_regret": float(regrets[model_name].sum()), "arms": arms,
+            "choose_arm_mean_ms": profile["phases"][model_name]["choose_arm"]["mean_seconds"] * 1000,
+            "wall_time_seconds": profile["wall_time_seconds"]}
+
+
+def benchmark_configuration(model_name: str, N: int, d: int, args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Returns results of the scan of all arms, the exact search and approximate searches for one configuration"""
+    environment_kwargs = {"N": N, "a": args.a, "d": d, "reward_distribution": args.reward_distribution,
+                          "seed": args.seed}
+    clusters_nb = args.clusters_nb or int(np.ceil(np.sqrt(N)))
+    searches = [("scan", None, None), ("exact", clusters_nb, None)] + \
+        [(f"max_clusters={max_clusters}", clusters_nb, max_clusters) for max_clusters in args.max_clusters]
+    results = []
+    for search, mips_clusters_nb, mips_max_clusters in searches:
+        result = run_search(model_name, environment_kwargs, args.steps, mips_clusters_nb, mips_max_clusters)
+        scan_result = results[0] if results else result
+        results.append({"model": model_name, "arms_nb": N, "d": d, "search": search, **result,
+                        "regret_difference": result["total_regret"] - scan_result["total_regret"],
+                        "same_arms_fraction": float(np.mean(result["arms"] == scan_result["arms"]))})
+        print(f"{model_name} N={N} d={d} {search}: total regret {result['total_regret']:.2f} "
+              f"({results[-1]['regret_difference']:+.2f}), choose_arm {result['choose_arm_mean_ms']:.3f} ms, "
+              f"same arms as scan {results[-1]['same_arms_fraction']:.0%}")
+    for result in results:
+        del result["arms"]
+    return results
+
+
+def main(args: List[str]) -> List[Dict[str, Any]]:
+    """
+    LinearGaussianSampling with the exact search chooses the same arms as with the scan (up to rounding), so
+    differences of its regret come only from approximate searches. LinearSemiParametricSampling with the index draws
+    gammas differently, so its runs differ from the scan also with the exact search, but only by chance.
+    """
+    args = get_args(args)
+    results = [result for model_name in args.models for N in args.arms_nb for d in args.d
+               for result in benchmark_configuration(model_name, N, d, args)]
+    if args.output_path:
+        with open(args.output_path, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,150 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from models.beta_priors_sampling import BetaPriorsSampling
+from models.gaussian_priors_sampling import GaussianPriorsSampling
+from models.linear_gaussian_sampling import LinearGaussianSampling
+from models.linear_semi_parametric_sampling import LinearSemiParametricSampling
+
+MODELS = {"LinearSemiParametricSampling": lambda N, d, X: LinearSemiParametricSampling(N, d, X, 1, 1, 1, seed=1),
+          "LinearGaussianSampling": lambda N, d, X: LinearGaussianSampling(N, d, X, 1, seed=1),
+          "GaussianPriorsSampling": lambda N, d, X: GaussianPriorsSampling(N, seed=1),
+          "BetaPriorsSampling": lambda N, d, X: BetaPriorsSampling(N, seed=1)}
+LINEAR_MODELS = ["LinearSemiParametricSampling", "LinearGaussianSampling"]
+OPERATIONS = ["choose_arm", "observe_reward"]
+
+
+def get_args(args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark choose_arm and observe_reward of the models")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="Run benchmarks and save results to a JSON file")
+    run_parser.add_argument("--output_path", type=str, required=True, help="Path of the JSON file with results")
+    run_parser.add_argument("--models", type=str, nargs="+", default=list(MODELS.keys()), choices=list(MODELS.keys()),
+                            help="Names of the model classes")
+    run_parser.add_argument("--arms_nb", type=int, nargs="+", default=[10, 1000, 100000, 1000000],
+                            help="Numbers of arms")
+    run_parser.add_argument("--d", type=int, nargs="+", default=[5, 50, 500],
+                            help="Dimensionalities of linear parameter vector, used only by linear models")
+    run_parser.add_argument("--min_time", type=float, default=1,
+                            help="Minimal time in seconds of timing every operation")
+    run_parser.add_argument("--max_X_size", type=int, default=10 ** 8,
+                            help="Configurations with X of more elements are skipped")
+    compare_parser = subparsers.add_parser("compare", help="Compare results with a baseline and report regressions")
+    compare_parser.add_argument("baseline_path", type=str, help="Path of the JSON file with baseline results")
+    compare_parser.add_argument("results_path", type=str, help="Path of the JSON file with compared results")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="Relative decrease of ops/sec or increase of peak memory reported as regression")
+    return parser.parse_args(args)
+
+
+def time_operation(operation: Callable[[], Any], min_time: float) -> float:
+    """Returns operations per second of calling the operation repeatedly for at least min_time seconds"""
+    calls_nb = 0
+    start = time.perf_counter()
+    while True:
+        operation()
+        calls_nb += 1
+        elapsed_time = time.perf_counter() - start
+        if elapsed_time >= min_time and calls_nb >= 3:
+            return calls_nb / elapsed_time
+
+
+def benchmark_model(model_name: str, N: int, d: int, min_time: float) -> Dict[str, Any]:
+    generator = np.random.default_rng(0)
+    X = generator.uniform(size=(d, N)) if model_name in LINEAR_MODELS else None
+
+    def observe_reward():
+        reward = generator.integers(2) if model_name == "BetaPriorsSampling" else generator.normal()
+        model.observe_reward(generator.integers(N), reward)
+
+    # peak memory is measured in a separate pass, as tracing allocations slows the operations down
+    tracemalloc.start()
+    model = MODELS[model_name](N, d, X)
+    model.choose_arm()
+    observe_reward()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    model = MODELS[model_name](N, d, X)
+    result = {"model": model_name, "arms_nb": N, "d": d if model_name in LINEAR_MODELS else None,
+              "peak_memory_bytes": peak_memory}
+    result["choose_arm_ops_per_sec"] = time_operation(model.choose_arm, min_time)
+    result["observe_reward_ops_per_sec"] = time_operation(observe_reward, min_time)
+    return result
+
+
+def run_benchmarks(models: List[str], arms_nbs: List[int], ds: List[int], min_time: float,
+                   max_X_size: int) -> List[Dict[str, Any]]:
+    results = []
+    for model_name in models:
+        for N in arms_nbs:
+            # models without context features don't depend on d
+            for d in ds if model_name in LINEAR_MODELS else ds[:1]:
+                if model_name in LINEAR_MODELS and N * d > max_X_size:
+                    print(f"Skipping {model_name} for N={N}, d={d}: X larger than {max_X_size} elements")
+                    continue
+                result = benchmark_model(model_name, N, d, min_time)
+                print(f"{model_name} N={N} d={result['d']}: "
+                      f"choose_arm {result['choose_arm_ops_per_sec']:.1f} ops/s, "
+                      f"observe_reward {result['observe_reward_ops_per_sec']:.1f} ops/s, "
+                      f"peak memory {result['peak_memory_bytes'] / 2 ** 20:.1f} MiB")
+                results.append(result)
+    return results
+
+
+def compare_results(baseline: List[Dict[str, Any]], results: List[Dict[str, Any]], threshold: float) -> List[str]:
+    """Returns descriptions of regressions of results in comparison to the baseline"""
+    baseline_by_configuration = {(r["model"], r["arms_nb"], r["d"]): r for r in baseline}
+    regressions = []
+    for result in results:
+        configuration = (result["model"], result["arms_nb"], result["d"])
+        if configuration not in baseline_by_configuration:
+            continue
+        baseline_result = baseline_by_configuration[configuration]
+        description = f"{result['model']} N={result['arms_nb']} d={result['d']}"
+        for operation in OPERATIONS:
+            key = f"{operation}_ops_per_sec"
+            ratio = result[key] / baseline_result[key]
+            if ratio < 1 - threshold:
+                regressions.append(f"{description}: {operation} {baseline_result[key]:.1f} -> {result[key]:.1f} "
+                                   f"ops/s ({ratio - 1:+.0%})")
+        ratio = result["peak_memory_bytes"] / max(baseline_result["peak_memory_bytes"], 1)
+        if ratio > 1 + threshold:
+            regressions.append(f"{description}: peak memory {baseline_result['peak_memory_bytes']} -> "
+                               f"{result['peak_memory_bytes']} bytes ({ratio - 1:+.0%})")
+    return regressions
+
+
+def main(args: List[str]) -> int:
+    args = get_args(args)
+    if args.command == "run":
+        results = run_benchmarks(args.models, args.arms_nb, args.d, args.min_time, args.max_X_size)
+        metadata = {"date": datetime.now().isoformat(), "python": platform.python_version(),
+                    "numpy": np.__version__, "platform": platform.platform(), "processor": platform.processor()}
+        with open(args.output_path, "w") as f:
+            json.dump({"metadata": metadata, "results": results}, f, indent=2)
+        return 0
+
+    with open(args.baseline_path) as f:
+        baseline = json.load(f)["results"]
+    with open(args.results_path) as f:
+        results = json.load(f)["results"]
+    regressions = compare_results(baseline, results, args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    print(f"{len(regressions)} regressions found")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,82 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from benchmarks.models_benchmark import MODELS
+from serving.bandit_server import BanditServer
+from simulation.environment import Environment
+
+
+def get_args(args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Generate load of concurrent clients against a model served by "
+                                                 "BanditServer and report latency of choosing arms and throughput")
+    parser.add_argument("--model", type=str, required=True, choices=list(MODELS.keys()), help="Name of the model class")
+    parser.add_argument("--arms_nb", type=int, default=1000, help="Number of arms")
+    parser.add_argument("--d", type=int, default=20, help="Dimensionality of linear parameter vector")
+    parser.add_argument("--a", type=float, default=0.5, help="Parameter a of the environment")
+    parser.add_argument("--reward_distribution", type=str, default="binomial", choices=["binomial", "normal"],
+                        help="Distribution of rewards")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed of the environment")
+    parser.add_argument("--clients", type=int, default=64, help="Number of concurrent clients")
+    parser.add_argument("--requests", type=int, default=10000, help="Total number of requests of all clients")
+    parser.add_argument("--pool_size", type=int, default=64, help="Number of arms drawn at once from the posterior")
+    parser.add_argument("--max_staleness", type=float, required=False,
+                        help="Maximal age in seconds of the pool of drawn arms")
+    parser.add_argument("--refresh_after_rewards", type=int, required=False,
+                        help="Number of applied rewards after which the pool of drawn arms is drawn again")
+    parser.add_argument("--batch_size", type=int, default=256, help="Maximal number of rewards applied at once")
+    parser.add_argument("--batch_interval", type=float, default=0.001,
+                        help="Time in seconds for which the first reward of a batch waits for more rewards")
+    parser.add_argument("--output_path", type=str, required=False, help="Path of the JSON file with the report")
+    return parser.parse_args(args)
+
+
+async def run_client(server: BanditServer, env: Environment, requests_nb: int, latencies: List[float],
+                     regrets: List[float]) -> None:
+    for _ in range(requests_nb):
+        start = time.perf_counter()
+        arm = await server.choose_arm()
+        latencies.append(time.perf_counter() - start)
+        regrets.append(env.get_regret(arm))
+        await server.observe_reward(arm, env.get_reward(arm))
+
+
+async def generate_load(server: BanditServer, env: Environment, clients_nb: int, requests_nb: int) -> Dict[str, Any]:
+    """Runs clients, each choosing arms and sending their rewards one after another, and returns the report"""
+    latencies, regrets = [], []
+    start = time.perf_counter()
+    async with server:
+        await asyncio.gather(*[run_client(server, env, requests_nb // clients_nb + (i < requests_nb % clients_nb),
+                                          latencies, regrets) for i in range(clients_nb)])
+    elapsed_time = time.perf_counter() - start
+    latencies_ms = np.array(latencies) * 1000
+    return {"requests_nb": len(latencies), "requests_per_sec": len(latencies) / elapsed_time,
+            "p50_latency_ms": float(np.percentile(latencies_ms, 50)),
+            "p99_latency_ms": float(np.percentile(latencies_ms, 99)), "max_latency_ms": float(latencies_ms.max()),
+            "pools_nb": server.pools_nb, "reward_batches_nb": server.batches_nb, "total_regret": float(sum(regrets))}
+
+
+def main(args: List[str]) -> Dict[str, Any]:
+    args = get_args(args)
+    env = Environment(args.arms_nb, args.a, args.d, args.reward_distribution, args.seed)
+    server = BanditServer(MODELS[args.model](args.arms_nb, args.d, env.X), args.pool_size, args.max_staleness,
+                          args.refresh_after_rewards, args.batch_size, args.batch_interval)
+    report = asyncio.run(generate_load(server, env, args.clients, args.requests))
+    print(f"{args.model} N={args.arms_nb}: {report['requests_per_sec']:.1f} requests/s, "
+          f"latency p50 {report['p50_latency_ms']:.3f} ms, p99 {report['p99_latency_ms']:.3f} ms, "
+          f"total regret {report['total_regret']:.2f}")
+    if args.output_path:
+        with open(args.output_path, "w") as f:
+            json.dump({"arguments": vars(args), "report": report}, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
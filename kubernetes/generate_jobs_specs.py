@@ -77,7 +77,9 @@ def main(args):
     os.makedirs(specs_module.job_specs_path)
 
     for i, args in enumerate(possible_arguments):
-        additional_args = ["--name", specs_module.name_format_string.format(i=i)]
+        # jobs are resumed from their latest checkpoint in the bucket when their pods are rescheduled,
+        # names are stable, as they depend only on the position of the job
+        additional_args = ["--name", specs_module.name_format_string.format(i=i), "--resume"]
         complete_job_specs = combine_kubernetes_params_and_run_agrs(specs_module.kubernetes, additional_args + args,
                                                                     i=i)
         file_path = os.path.join(specs_module.job_specs_path, f"job_{i}.yaml")
@@ -0,0 +1,97 @@
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from typing import List, Optional, Tuple
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from kubernetes.generate_jobs_specs import generate_possible_arguments, import_module_from_path
+
+BLAS_THREADS_VARIABLES = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS"]
+LOGGING_DIRECTORY = "./logging"
+
+
+def get_args(args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run jobs from job specification input locally in a process pool")
+    parser.add_argument("--job_specs_input_path", type=str, required=True,
+                        help="Path to python file with defined options for jobs e.g. job_specs_input_hp_tuning.py")
+    parser.add_argument("--processes", type=int, required=False,
+                        help="Number of parallel processes, by default number of available cores")
+    parser.add_argument("--threads_per_process", type=int, required=False, default=1,
+                        help="Number of BLAS threads of every process")
+    parser.add_argument("--keep_gcs_bucket_path", action="store_true",
+                        help="Upload results to Google Cloud Storage as on the cluster instead of keeping them locally")
+    return parser.parse_args(args)
+
+
+def get_available_cores_nb() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
+def remove_option(args: List[str], option: str) -> List[str]:
+    if option not in args:
+        return args
+    i = args.index(option)
+    return args[:i] + args[i + 2:]
+
+
+def get_option(args: List[str], option: str) -> str:
+    return args[args.index(option) + 1]
+
+
+def is_already_done(name: str) -> bool:
+    from analysis.results_store import is_finished
+    from simulation.run import find_latest_experiment_name
+
+    experiment_name = find_latest_experiment_name(name, LOGGING_DIRECTORY)
+    return experiment_name is not None and is_finished(os.path.join(LOGGING_DIRECTORY, experiment_name))
+
+
+def run_job(args: List[str]) -> Tuple[int, float]:
+    from simulation.run import main as run_simulation
+
+    start = time.time()
+    run_simulation(args)
+    return int(get_option(args, "--steps")), time.time() - start
+
+
+def run_jobs(jobs_args: List[List[str]], processes: int, threads_per_process: int) -> None:
+    """Runs simulation.run.main for every arguments list in a pool of processes and prints throughput"""
+    # limiting BLAS threads before workers import numpy, to avoid oversubscription of cores
+    for variable in BLAS_THREADS_VARIABLES:
+        os.environ[variable] = str(threads_per_process)
+
+    start = time.time()
+    steps_nb = 0
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        for i, (job_steps_nb, job_time) in enumerate(pool.imap_unordered(run_job, jobs_args), start=1):
+            steps_nb += job_steps_nb
+            elapsed_time = time.time() - start
+            print(f"Finished {i}/{len(jobs_args)} jobs in {elapsed_time:.0f} s; last job took {job_time:.0f} s; "
+                  f"throughput: {i / elapsed_time * 3600:.1f} jobs/h, {steps_nb / elapsed_time:.0f} steps/s")
+
+
+def main(args: List[str], jobs_nb_limit: Optional[int] = None) -> None:
+    args = get_args(args)
+    specs_module = import_module_from_path(args.job_specs_input_path, "specs")
+    possible_arguments = generate_possible_arguments(specs_module)[:jobs_nb_limit]
+    jobs_args = []
+    for i, job_args in enumerate(possible_arguments):
+        name = specs_module.name_format_string.format(i=i)
+        if not args.keep_gcs_bucket_path:
+            job_args = remove_option(job_args, "--gcs_bucket_path")
+        if is_already_done(name):
+            continue
+        jobs_args.append(["--name", name] + [str(a) for a in job_args])
+
+    processes = args.processes or get_available_cores_nb()
+    print(f"Running {len(jobs_args)} jobs in {processes} processes, "
+          f"skipped {len(possible_arguments) - len(jobs_args)} already done")
+    run_jobs(jobs_args, processes, args.threads_per_process)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,105 @@
+import argparse
+import math
+import os
+import sys
+from typing import Dict, List, Tuple
+
+import yaml
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from kubernetes.generate_jobs_specs import generate_possible_arguments, import_module_from_path
+from kubernetes.run_jobs_locally import LOGGING_DIRECTORY, get_available_cores_nb, get_option, remove_option, run_jobs
+
+
+def get_args(args: List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Tune hyper-parameters from job specification input locally with "
+                                                 "successive halving")
+    parser.add_argument("--job_specs_input_path", type=str, required=True,
+                        help="Path to python file with defined options for jobs e.g. job_specs_input_hp_tuning.py")
+    parser.add_argument("--min_steps", type=int, required=True,
+                        help="Number of steps for which all configurations are run in the first round")
+    parser.add_argument("--reduction_factor", type=int, required=False, default=3,
+                        help="In every round only the best 1 / reduction_factor configurations are kept and run "
+                             "for reduction_factor times more steps, up to --steps of the job specification input")
+    parser.add_argument("--output_path", type=str, required=False, default="successive_halving_results",
+                        help="Path of the YAML file with total regrets of configurations in all rounds")
+    parser.add_argument("--processes", type=int, required=False,
+                        help="Number of parallel processes, by default number of available cores")
+    parser.add_argument("--threads_per_process", type=int, required=False, default=1,
+                        help="Number of BLAS threads of every process")
+    return parser.parse_args(args)
+
+
+def get_budgets(min_steps: int, max_steps: int, reduction_factor: int) -> List[int]:
+    budgets = [min(min_steps, max_steps)]
+    while budgets[-1] < max_steps:
+        budgets.append(min(budgets[-1] * reduction_factor, max_steps))
+    return budgets
+
+
+def get_configuration(job_args: List[str]) -> Tuple[Tuple[str, str, Tuple[str, ...]], str]:
+    """
+    Returns group of the job (reward distribution, a, models), in which configurations are compared,
+    and configuration of the job: models hyper-parameters, same for all seeds
+    """
+    args = remove_option(job_args, "--seed")
+    models_start = args.index("--models") + 1
+    models_end = next((i for i in range(models_start, len(args)) if args[i].startswith("--")), len(args))
+    group = (get_option(args, "--reward_distribution"), get_option(args, "--a"), tuple(args[models_start:models_end]))
+    return group, " ".join(args[models_end:])
+
+
+def get_total_regret(name: str, steps: int) -> float:
+    from analysis.results_store import load_regrets
+    from simulation.run import find_latest_experiment_name
+
+    regrets = load_regrets(os.path.join(LOGGING_DIRECTORY, find_latest_experiment_name(name, LOGGING_DIRECTORY)))
+    return float(sum(model_regrets[:steps].sum() for model_regrets in regrets.values()))
+
+
+def main(args: List[str]) -> Dict[Tuple, List[Dict]]:
+    """
+    Runs all configurations for --min_steps steps, then repeatedly drops the worst ones by mean total regret
+    over seeds in every group and continues runs of the rest, until they reach --steps of the job specification input.
+    Runs are continued with --resume, so an interrupted tuning can be restarted with the same arguments.
+    """
+    args = get_args(args)
+    specs_module = import_module_from_path(args.job_specs_input_path, "specs")
+    jobs = {}  # group -> configuration -> list of (name, arguments)
+    for i, job_args in enumerate(generate_possible_arguments(specs_module)):
+        job_args = remove_option([str(a) for a in job_args], "--gcs_bucket_path")
+        group, configuration = get_configuration(job_args)
+        name = specs_module.name_format_string.format(i=i)
+        jobs.setdefault(group, {}).setdefault(configuration, []).append((name, job_args))
+
+    max_steps = int(get_option(specs_module.args, "--steps"))
+    survivors = {group: list(configurations.keys()) for group, configurations in jobs.items()}
+    results = {group: [] for group in jobs.keys()}
+    for budget in get_budgets(args.min_steps, max_steps, args.reduction_factor):
+        jobs_args = [["--name", name] + remove_option(job_args, "--steps") + ["--steps", str(budget), "--resume"]
+                     for group, configurations in survivors.items() for configuration in configurations
+                     for name, job_args in jobs[group][configuration]]
+        print(f"Running {len(jobs_args)} jobs for {budget} steps")
+        run_jobs(jobs_args, args.processes or get_available_cores_nb(), args.threads_per_process)
+
+        for group, configurations in survivors.items():
+            scores = {configuration: sum(get_total_regret(name, budget) for name, _ in jobs[group][configuration]) /
+                      len(jobs[group][configuration]) for configuration in configurations}
+            configurations.sort(key=lambda configuration: scores[configuration])
+            results[group] = [{"parameters": configuration, "steps": budget, "mean_total_regret": scores[configuration]}
+                              for configuration in configurations] + \
+                             [result for result in results[group] if result["parameters"] not in scores]
+            del configurations[math.ceil(len(configurations) / args.reduction_factor):]
+
+    with open(args.output_path, "w") as f:
+        yaml.dump([{"reward_distribution": group[0], "a": group[1], "models": list(group[2]), "rank": rank,
+                    **result} for group, group_results in results.items()
+                   for rank, result in enumerate(group_results, start=1)], f, sort_keys=False)
+    for group, group_results in results.items():
+        print(f"Best configuration for {group}: {group_results[0]['parameters']} "
+              f"(mean total regret {group_results[0]['mean_total_regret']:.2f})")
+    return results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
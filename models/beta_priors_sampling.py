@@ -1,5 +1,9 @@
+from typing import List, Optional
+
 import numpy as np
-import pandas as pd
+from scipy.special import betaincinv
+
+from models.bound_pruning import BoundPrunedSampler
 
 
 class BetaPriorsSampling:
@@ -8,13 +12,26 @@ class BetaPriorsSampling:
     Near-optimal Regret Bounds for Thompson Sampling
     http://www.columbia.edu/~sa3305/j3.pdf
     """
-    def __init__(self, arms_nb: int, seed: int):
+    state_attributes = ("S", "F")
+
+    def __init__(self, arms_nb: int, seed: int, bound_tail_probability: Optional[float] = None):
         self.seed = seed
         self.generator = np.random.default_rng(self.seed)
         self.N = arms_nb
         self.S = np.zeros(self.N)
         self.F = np.zeros(self.N)
         self.theta = None # shape N
+        # with bound_tail_probability arms are chosen by BoundPrunedSampler, without drawing arms which can't win
+        self.bound_tail_probability = bound_tail_probability
+        self.sampler = BoundPrunedSampler(self.N, self._quantile, bound_tail_probability) \
+            if bound_tail_probability else None
+
+    def _quantile(self, arms: np.array, u: np.array) -> np.array:
+        return betaincinv(self.S[arms] + 1, self.F[arms] + 1, u)
+
+    def state_restored(self) -> None:
+        if self.sampler:
+            self.sampler.reset(np.flatnonzero(self.S + self.F))
 
     def _sample_theta(self) -> None:
         self.theta = self.generator.beta(self.S + 1, self.F + 1)
@@ -27,12 +44,74 @@ class BetaPriorsSampling:
         else:
             raise ValueError("Reward can be only 0 or 1 for Thompson sampling with Beta priors.")
         self.theta = None
+        if self.sampler:
+            self.sampler.arms_changed([i])
 
     def _get_best_arm(self):
         return np.argmax(self.theta)
 
     def choose_arm(self):
+        if self.sampler:
+            return self.sampler.sample_best_arm(self.generator)
         self._sample_theta()
         return self._get_best_arm()
 
+    def choose_arms(self, k: int) -> np.array:
+        if self.sampler:
+            return np.array([self.sampler.sample_best_arm(self.generator) for _ in range(k)])
+        theta = self.generator.beta(self.S + 1, self.F + 1, size=(k, self.N))
+        return np.argmax(theta, axis=1)
+
+    def observe_rewards(self, arms: np.array, rewards: np.array):
+        arms, rewards = np.asarray(arms), np.asarray(rewards)
+        if not np.all((rewards == 0) | (rewards == 1)):
+            raise ValueError("Reward can be only 0 or 1 for Thompson sampling with Beta priors.")
+        self.S += np.bincount(arms[rewards == 1], minlength=self.N)
+        self.F += np.bincount(arms[rewards == 0], minlength=self.N)
+        self.theta = None
+        if self.sampler:
+            self.sampler.arms_changed(np.unique(arms))
+
+
+class BatchedBetaPriorsSampling:
+    """
+    BetaPriorsSampling for many seeds (replicas) at once. State has a leading replica axis e.g. S of shape (R, N).
+    Each replica uses its own generator, so it reproduces the run of BetaPriorsSampling with the same seed.
+    """
+    replica_class = BetaPriorsSampling
+
+    def __init__(self, arms_nb: int, seeds: List[int]):
+        self.seeds = seeds
+        self.generators = [np.random.default_rng(seed) for seed in self.seeds]
+        self.R = len(self.seeds)
+        self.N = arms_nb
+        self.S = np.zeros((self.R, self.N))
+        self.F = np.zeros((self.R, self.N))
+        self.theta = None # shape (R, N)
+
+    def _sample_theta(self) -> None:
+        self.theta = np.stack([generator.beta(S + 1, F + 1)
+                               for generator, S, F in zip(self.generators, self.S, self.F)])
+
+    def observe_reward(self, i: np.array, r: np.array):
+        if not np.all((r == 0) | (r == 1)):
+            raise ValueError("Reward can be only 0 or 1 for Thompson sampling with Beta priors.")
+        replicas = np.arange(self.R)
+        self.S[replicas, i] += r == 1
+        self.F[replicas, i] += r == 0
+        self.theta = None
+
+    def _get_best_arm(self):
+        return np.argmax(self.theta, axis=1)
+
+    def choose_arm(self):
+        self._sample_theta()
+        return self._get_best_arm()
 
+    def replica(self, r: int) -> BetaPriorsSampling:
+        model = self.replica_class(self.N, self.seeds[r])
+        model.generator.bit_generator.state = self.generators[r].bit_generator.state
+        model.S = self.S[r].copy()
+        model.F = self.F[r].copy()
+        model.theta = None if self.theta is None else self.theta[r].copy()
+        return model
@@ -0,0 +1,121 @@
+from typing import Callable, Iterable
+
+import numpy as np
+
+MIN_CHUNK_SIZE = 64
+
+
+class BoundPrunedSampler:
+    """
+    Thompson sampling of the best arm for independent posteriors of arms, which draws only arms which can win.
+    Posterior of an arm is given by its quantile function quantile(arms, u), so a draw of the arm is quantile(arm, u)
+    for u uniform on (0, 1).
+    All arms which were never observed have the same posterior (the prior), so the maximum of their draws is drawn
+    at once as quantile(arm, v ** (1 / m)) for v uniform on (0, 1) and m such arms, and the arm is chosen uniformly.
+    Each observed arm has a bound quantile(arm, 1 - p), which its draw exceeds with probability p. Arms with draws
+    above their bounds are chosen first, each with probability p, and drawn from the tails of their posteriors.
+    The rest of observed arms are drawn below their bounds in decreasing order of the bounds, until no bound is
+    greater than the best draw. The chosen arm has the same distribution as the argmax of draws of all arms.
+    The order depends only on the current posteriors, so a model restored from a checkpoint draws the same arms.
+    Observed arms and their bounds are kept sorted in arrays of size N allocated once; when the bound of an arm
+    changes, only arms between its old and new position are shifted.
+    """
+    def __init__(self, arms_nb: int, quantile: Callable[[np.array, np.array], np.array], tail_probability: float):
+        self.N = arms_nb
+        self.quantile = quantile
+        self.tail_probability = tail_probability
+        self.reset(np.array([], dtype=int))
+
+    def _bounds(self, arms: np.array) -> np.array:
+        return self.quantile(arms, np.full(len(arms), 1 - self.tail_probability))
+
+    def reset(self, observed_arms: np.array) -> None:
+        """Sets arms with posteriors different from the prior, must be called if posteriors of many arms changed"""
+        self.observed = np.zeros(self.N, dtype=bool)
+        self.observed[observed_arms] = True
+        arms = np.flatnonzero(self.observed)
+        negative_bounds = -self._bounds(arms)
+        order = np.lexsort((arms, negative_bounds))
+        # observed arms sorted by decreasing bounds, arms with equal bounds by their numbers, in the first
+        # indexed_arms_nb elements
+        self.indexed_arms_nb = len(arms)
+        self.all_indexed_arms = np.empty(self.N, dtype=int)
+        self.all_negative_sorted_bounds = np.empty(self.N)
+        self.all_indexed_arms[:len(arms)] = arms[order]
+        self.all_negative_sorted_bounds[:len(arms)] = negative_bounds[order]
+        self.negative_bounds = np.zeros(self.N)
+        self.negative_bounds[arms] = negative_bounds
+
+    @property
+    def indexed_arms(self) -> np.array:
+        return self.all_indexed_arms[:self.indexed_arms_nb]
+
+    @property
+    def negative_sorted_bounds(self) -> np.array:
+        return self.all_negative_sorted_bounds[:self.indexed_arms_nb]
+
+    def _position(self, arm: int, negative_bound: float) -> int:
+        """Returns the number of indexed arms which precede the arm with the bound in the order"""
+        start = np.searchsorted(self.negative_sorted_bounds, negative_bound, side="left")
+        end = np.searchsorted(self.negative_sorted_bounds, negative_bound, side="right")
+        return int(start + np.searchsorted(self.indexed_arms[start:end], arm))
+
+    def _move(self, position: int, new_position: int, arm: int, negative_bound: float) -> None:
+        """Moves the arm from position (the end, for a new arm) to new_position, shifting arms between them"""
+        for array, value in [(self.all_indexed_arms, arm), (self.all_negative_sorted_bounds, negative_bound)]:
+            if new_position > position:
+                array[position:new_position] = array[position + 1:new_position + 1]
+            else:
+                array[new_position + 1:position + 1] = array[new_position:position]
+            array[new_position] = value
+
+    def arms_changed(self, arms: Iterable[int]) -> None:
+        for arm in arms:
+            negative_bound = -self._bounds(np.array([arm]))[0]
+            new_position = self._position(arm, negative_bound)
+            if self.observed[arm]:
+                position = self._position(arm, self.negative_bounds[arm])
+                # new_position was counted with the arm itself at position
+                new_position -= new_position > position
+            else:
+                position = self.indexed_arms_nb
+                self.indexed_arms_nb += 1
+                self.observed[arm] = True
+            self._move(position, new_position, arm, negative_bound)
+            self.negative_bounds[arm] = negative_bound
+
+    def _choose_prior_arm(self, generator: np.random.Generator) -> int:
+        """Returns an arm which was never observed, chosen uniformly"""
+        if len(self.indexed_arms) < self.N // 2:
+            while True:
+                arm = generator.integers(self.N)
+                if not self.observed[arm]:
+                    return arm
+        return generator.choice(np.flatnonzero(~self.observed))
+
+    def sample_best_arm(self, generator: np.random.Generator) -> int:
+        best_arm, best_value = -1, -np.inf
+        indexed_arms_nb = len(self.indexed_arms)
+        prior_arms_nb = self.N - indexed_arms_nb
+        if prior_arms_nb:
+            best_arm = self._choose_prior_arm(generator)
+            best_value = self.quantile(np.array([best_arm]), np.array([generator.uniform() ** (1 / prior_arms_nb)]))[0]
+
+        tail_arms = self.indexed_arms[generator.choice(indexed_arms_nb,
+                                                       generator.binomial(indexed_arms_nb, self.tail_probability),
+                                                       replace=False)]
+        if len(tail_arms):
+            values = self.quantile(tail_arms, generator.uniform(1 - self.tail_probability, 1, len(tail_arms)))
+            if np.max(values) > best_value:
+                best_arm, best_value = tail_arms[np.argmax(values)], np.max(values)
+
+        position, chunk_size = 0, MIN_CHUNK_SIZE
+        while position < indexed_arms_nb and -self.negative_sorted_bounds[position] > best_value:
+            arms = self.indexed_arms[position:position + chunk_size]
+            arms = arms[~np.isin(arms, tail_arms)]
+            values = self.quantile(arms, generator.uniform(0, 1 - self.tail_probability, len(arms)))
+            if len(arms) and np.max(values) > best_value:
+                best_arm, best_value = arms[np.argmax(values)], np.max(values)
+            position += chunk_size
+            chunk_size *= 2
+        return int(best_arm)
@@ -0,0 +1,51 @@
+import numpy as np
+from scipy.linalg import cho_solve, solve_triangular
+
+
+def cholesky_rank_one_update(L: np.array, x: np.array, sign=1) -> None:
+    """
+    Updates lower triangular factor L in place, so that afterwards L @ L.T is equal to
+    the previous L @ L.T + sign * x @ x.T. Sign equal to -1 gives a downdate.
+    Costs O(d^2) instead of O(d^3) of a new factorization.
+    L can be a stack of factors of shape (R, d, d), then x has shape (R, d) and sign is a scalar or has shape (R,).
+    """
+    x = np.array(x, dtype=float).reshape(L.shape[:-1])
+    sign = np.asarray(sign)
+    for k in range(x.shape[-1]):
+        r_squared = L[..., k, k] ** 2 + sign * x[..., k] ** 2
+        if np.any(r_squared <= 0):
+            raise np.linalg.LinAlgError("Downdated matrix is not positive definite")
+        r = np.sqrt(r_squared)
+        c = r / L[..., k, k]
+        s = x[..., k] / L[..., k, k]
+        L[..., k, k] = r
+        L[..., k + 1:, k] = (L[..., k + 1:, k] + (sign * s)[..., None] * x[..., k + 1:]) / c[..., None]
+        x[..., k + 1:] = c[..., None] * x[..., k + 1:] - s[..., None] * L[..., k + 1:, k]
+
+
+def cholesky_solve(L: np.array, b: np.array) -> np.array:
+    """Solves (L @ L.T) @ x = b"""
+    return cho_solve((L, True), b)
+
+
+def sample_from_precision_factor(generator: np.random.Generator, mean: np.array, L: np.array,
+                                 scale: float = 1, samples_nb: int = 1) -> np.array:
+    """
+    Samples from normal distribution with given mean (shape (d, 1)) and covariance scale^2 * (L @ L.T)^-1,
+    where L is the lower triangular Cholesky factor of the precision matrix. Returns samples as columns.
+    """
+    z = generator.standard_normal(size=(mean.shape[0], samples_nb))
+    return mean + scale * solve_triangular(L, z, lower=True, trans='T')
+
+
+def cholesky_update(L: np.array, M: np.array, sign: float = 1) -> np.array:
+    """
+    Returns lower triangular factor of L @ L.T + sign * M @ M.T for M of shape (d, m).
+    Uses m rank-one updates when it is cheaper than a new factorization.
+    """
+    if M.shape[1] < M.shape[0]:
+        L = L.copy()
+        for j in range(M.shape[1]):
+            cholesky_rank_one_update(L, M[:, j], sign)
+        return L
+    return np.linalg.cholesky(L @ L.T + sign * M @ M.T)
@@ -0,0 +1,74 @@
+from typing import Iterator, Union
+
+import numpy as np
+import scipy.sparse
+
+# context features X of shape (d, N) with more than CHUNK_ELEMENTS elements are processed in chunks of columns,
+# so that X can be memory-mapped and float32 X is converted to float64 only chunk by chunk.
+# X can be also a SciPy sparse matrix (CSC, so that its columns are cheap to take), which is never densified as
+# a whole: products with it take time proportional to its nonzeros and only taken columns are made dense.
+CHUNK_ELEMENTS = 2 ** 24
+
+
+def dense_columns(X: np.array, columns: Union[slice, np.array, list]) -> np.array:
+    """Returns the given columns of X as a dense float64 array of shape (d, columns number)"""
+    if scipy.sparse.issparse(X):
+        return X[:, columns].toarray().astype(np.float64, copy=False)
+    return np.asarray(X[:, columns], dtype=np.float64)
+
+
+def column_chunks(X: np.array) -> Iterator[slice]:
+    d, N = X.shape
+    columns_nb = max(1, CHUNK_ELEMENTS // max(d, 1))
+    for start in range(0, N, columns_nb):
+        yield slice(start, start + columns_nb)
+
+
+def row_chunks(d: int, N: int) -> Iterator[slice]:
+    rows_nb = max(1, CHUNK_ELEMENTS // max(N, 1))
+    for start in range(0, d, rows_nb):
+        yield slice(start, min(start + rows_nb, d))
+
+
+def left_multiply(A: np.array, X: np.array) -> np.array:
+    """Returns A @ X computed in float64"""
+    if scipy.sparse.issparse(X):
+        return np.asarray((X.T @ A.T).T, dtype=np.float64)
+    if X.size <= CHUNK_ELEMENTS:
+        return A @ X
+    result = np.empty(A.shape[:-1] + (X.shape[1],))
+    for columns in column_chunks(X):
+        result[..., columns] = A @ np.asarray(X[:, columns], dtype=np.float64)
+    return result
+
+
+def weighted_gram(X: np.array, weights: np.array) -> np.array:
+    """Returns (X * weights) @ X.T computed in float64"""
+    if scipy.sparse.issparse(X):
+        return (X @ scipy.sparse.diags(weights) @ X.T).toarray().astype(np.float64, copy=False)
+    if X.size <= CHUNK_ELEMENTS:
+        return (X * weights) @ X.T
+    result = np.zeros((X.shape[0], X.shape[0]))
+    for columns in column_chunks(X):
+        X_chunk = np.asarray(X[:, columns], dtype=np.float64)
+        result += (X_chunk * weights[columns]) @ X_chunk.T
+    return result
+
+
+def right_multiply(X: np.array, v: np.array) -> np.array:
+    """Returns X @ v computed in float64"""
+    if scipy.sparse.issparse(X):
+        return np.asarray(X @ v, dtype=np.float64)
+    if X.size <= CHUNK_ELEMENTS:
+        return X @ v
+    result = np.zeros((X.shape[0],) + v.shape[1:])
+    for columns in column_chunks(X):
+        result += np.asarray(X[:, columns], dtype=np.float64) @ v[columns]
+    return result
+
+
+def max_column_norm(X: np.array) -> float:
+    if scipy.sparse.issparse(X):
+        return float(np.sqrt(np.asarray(X.multiply(X).sum(axis=0), dtype=np.float64)).max())
+    return max(np.linalg.norm(np.asarray(X[:, columns], dtype=np.float64), ord=2, axis=0).max()
+               for columns in column_chunks(X))
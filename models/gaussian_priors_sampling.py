@@ -1,4 +1,10 @@
+from typing import List, Optional
+
 import numpy as np
+from scipy.special import ndtri
+
+from models.bound_pruning import BoundPrunedSampler
+from models.variate_pool import VariatePool
 
 class GaussianPriorsSampling:
     """
@@ -6,27 +12,106 @@ class GaussianPriorsSampling:
     Near-optimal Regret Bounds for Thompson Sampling
     http://www.columbia.edu/~sa3305/j3.pdf
     """
-    def __init__(self, arms_nb: int, seed: int):
+    state_attributes = ("k", "mi")
+
+    def __init__(self, arms_nb: int, seed: int, bound_tail_probability: Optional[float] = None,
+                 variate_pool_size: Optional[int] = None):
         self.seed = seed
         self.generator = np.random.default_rng(self.seed)
+        # with variate_pool_size variates are taken from VariatePool drawn in blocks of that size
+        self.variate_pool_size = variate_pool_size
+        self.variate_pool = VariatePool(seed, variate_pool_size) if variate_pool_size else None
+        self.variates = self.variate_pool or self.generator
         self.N = arms_nb
         self.k = np.zeros(self.N)
         self.mi = np.zeros(self.N)
         self.theta = None # shape N
+        # with bound_tail_probability arms are chosen by BoundPrunedSampler, without drawing arms which can't win
+        self.bound_tail_probability = bound_tail_probability
+        self.sampler = BoundPrunedSampler(self.N, self._quantile, bound_tail_probability) \
+            if bound_tail_probability else None
+
+    def _quantile(self, arms: np.array, u: np.array) -> np.array:
+        return self.mi[arms] + (self.k[arms] + 1) ** -0.5 * ndtri(u)
+
+    def state_restored(self) -> None:
+        if self.sampler:
+            self.sampler.reset(np.flatnonzero(self.k))
 
     def _sample_theta(self) -> None:
-        self.theta = self.generator.normal(self.mi, (self.k + 1) ** -0.5)
+        self.theta = self.variates.normal(self.mi, (self.k + 1) ** -0.5)
 
     def observe_reward(self, i: int, r: float):
         self.mi[i] = (self.mi[i] * (self.k[i] + 1) + r) / (self.k[i] + 2)
         self.k[i] += 1
         self.theta = None
+        if self.sampler:
+            self.sampler.arms_changed([i])
 
     def _get_best_arm(self):
         return np.argmax(self.theta)
 
     def choose_arm(self):
+        if self.sampler:
+            return self.sampler.sample_best_arm(self.generator)
         self._sample_theta()
         return self._get_best_arm()
 
+    def choose_arms(self, k: int) -> np.array:
+        if self.sampler:
+            return np.array([self.sampler.sample_best_arm(self.generator) for _ in range(k)])
+        theta = self.variates.normal(self.mi, (self.k + 1) ** -0.5, size=(k, self.N))
+        return np.argmax(theta, axis=1)
+
+    def observe_rewards(self, arms: np.array, rewards: np.array):
+        observed_arms = np.unique(arms)
+        rewards_sum = np.bincount(arms, weights=rewards, minlength=self.N)[observed_arms]
+        rewards_nb = np.bincount(arms, minlength=self.N)[observed_arms]
+        k = self.k[observed_arms]
+        self.mi[observed_arms] = (self.mi[observed_arms] * (k + 1) + rewards_sum) / (k + 1 + rewards_nb)
+        self.k[observed_arms] += rewards_nb
+        self.theta = None
+        if self.sampler:
+            self.sampler.arms_changed(observed_arms)
+
+
+class BatchedGaussianPriorsSampling:
+    """
+    GaussianPriorsSampling for many seeds (replicas) at once. State has a leading replica axis e.g. mi of shape (R, N).
+    Each replica uses its own generator, so it reproduces the run of GaussianPriorsSampling with the same seed.
+    """
+    replica_class = GaussianPriorsSampling
+
+    def __init__(self, arms_nb: int, seeds: List[int]):
+        self.seeds = seeds
+        self.generators = [np.random.default_rng(seed) for seed in self.seeds]
+        self.R = len(self.seeds)
+        self.N = arms_nb
+        self.k = np.zeros((self.R, self.N))
+        self.mi = np.zeros((self.R, self.N))
+        self.theta = None # shape (R, N)
+
+    def _sample_theta(self) -> None:
+        self.theta = np.stack([generator.normal(mi, (k + 1) ** -0.5)
+                               for generator, mi, k in zip(self.generators, self.mi, self.k)])
+
+    def observe_reward(self, i: np.array, r: np.array):
+        replicas = np.arange(self.R)
+        self.mi[replicas, i] = (self.mi[replicas, i] * (self.k[replicas, i] + 1) + r) / (self.k[replicas, i] + 2)
+        self.k[replicas, i] += 1
+        self.theta = None
+
+    def _get_best_arm(self):
+        return np.argmax(self.theta, axis=1)
+
+    def choose_arm(self):
+        self._sample_theta()
+        return self._get_best_arm()
 
+    def replica(self, r: int) -> GaussianPriorsSampling:
+        model = self.replica_class(self.N, self.seeds[r])
+        model.generator.bit_generator.state = self.generators[r].bit_generator.state
+        model.k = self.k[r].copy()
+        model.mi = self.mi[r].copy()
+        model.theta = None if self.theta is None else self.theta[r].copy()
+        return model
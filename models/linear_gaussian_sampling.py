@@ -1,5 +1,11 @@
+from typing import List, Optional, Union
+
 import numpy as np
 
+from models.cholesky import cholesky_rank_one_update, cholesky_solve, cholesky_update, sample_from_precision_factor
+from models.context_features import dense_columns, left_multiply
+from models.mips_index import MipsIndex
+
 
 class LinearGaussianSampling:
     """
@@ -7,7 +13,10 @@ class LinearGaussianSampling:
     Thompson Sampling for Contextual Bandits with Linear Payoffs
     http://proceedings.mlr.press/v28/agrawal13.pdf
     """
-    def __init__(self, arms_nb: int, d: int, X: np.array, v: float, seed: int):
+    state_attributes = ("B", "L", "f", "mi_dashed", "observations_nb")
+
+    def __init__(self, arms_nb: int, d: int, X: np.array, v: float, seed: int, refresh_every: Optional[int] = None,
+                 mips_clusters_nb: Optional[int] = None, mips_max_clusters: Optional[int] = None):
         self.seed = seed
         self.generator = np.random.default_rng(self.seed)
 
@@ -15,31 +24,62 @@ class LinearGaussianSampling:
         self.d = d
         self.X = X
         self.v = v
+        # L is updated with rank-one updates; every refresh_every observations it is computed from B from scratch
+        # to limit floating-point drift (None or 0 disables it)
+        self.refresh_every = refresh_every
+        self.observations_nb = 0
 
         self.B = np.eye(d)
+        self.L = np.eye(d)  # lower triangular Cholesky factor of B
         self.f = np.zeros((d, 1))
         self.mi_dashed = np.zeros((d, 1))
 
         self.mi = None
         self.exp_reward = None
+        # with mips_clusters_nb the best arm for sampled mi is found with MipsIndex instead of a scan of all arms,
+        # which gives the same arms (exact search) or approximately the best ones (with mips_max_clusters)
+        self.mips_clusters_nb = mips_clusters_nb
+        self.mips_max_clusters = mips_max_clusters
+        self.mips_index = MipsIndex(X, mips_clusters_nb, mips_max_clusters) if mips_clusters_nb else None
 
     def _update_exp_reward(self) -> np.array:
-        self.exp_reward = self.mi.T @ self.X
+        self.exp_reward = left_multiply(self.mi.T, self.X)
 
     def _estimate_mi_cov(self) -> np.array:
-        return self.v ** 2 * np.linalg.inv(self.B)
+        return self.v ** 2 * cholesky_solve(self.L, np.eye(self.d))
 
     def _sample_mi(self) -> None:
-        mean = self.mi_dashed
-        cov = self._estimate_mi_cov()
-        mi_flat = self.generator.multivariate_normal(mean.flatten(), cov)
-        self.mi = np.expand_dims(mi_flat, axis=1)
+        self.mi = sample_from_precision_factor(self.generator, self.mi_dashed, self.L, scale=self.v)
+
+    def _count_observations(self, observations_nb: int) -> bool:
+        """Returns True if the Cholesky factor should be computed from scratch after these observations"""
+        previous_observations_nb = self.observations_nb
+        self.observations_nb += observations_nb
+        return bool(self.refresh_every) and \
+            self.observations_nb // self.refresh_every > previous_observations_nb // self.refresh_every
 
     def observe_reward(self, i: int, r: float):
-        X_i = np.take(self.X, [i], 1)
+        X_i = dense_columns(self.X, [i])
         self.B += X_i @ X_i.T
         self.f += X_i * r
-        self.mi_dashed = np.linalg.inv(self.B) @ self.f
+        if self._count_observations(1):
+            self.L = np.linalg.cholesky(self.B)
+        else:
+            cholesky_rank_one_update(self.L, X_i)
+        self.mi_dashed = cholesky_solve(self.L, self.f)
+
+        self.mi = None
+        self.exp_reward = None
+
+    def observe_rewards(self, arms: np.array, rewards: np.array):
+        X_arms = dense_columns(self.X, arms)
+        self.B += X_arms @ X_arms.T
+        self.f += X_arms @ np.expand_dims(rewards, axis=1)
+        if self._count_observations(len(arms)):
+            self.L = np.linalg.cholesky(self.B)
+        else:
+            self.L = cholesky_update(self.L, X_arms)
+        self.mi_dashed = cholesky_solve(self.L, self.f)
 
         self.mi = None
         self.exp_reward = None
@@ -49,7 +89,87 @@ class LinearGaussianSampling:
 
     def choose_arm(self):
         self._sample_mi()
+        if self.mips_index:
+            return self.mips_index.max_score(self.mi)[0]
         self._update_exp_reward()
         return self._get_best_arm()
 
+    def choose_arms(self, k: int) -> np.array:
+        mi = sample_from_precision_factor(self.generator, self.mi_dashed, self.L, scale=self.v, samples_nb=k)
+        if self.mips_index:
+            return np.array([self.mips_index.max_score(mi[:, j])[0] for j in range(k)])
+        return np.argmax(left_multiply(mi.T, self.X), axis=1)
+
+
+class BatchedLinearGaussianSampling:
+    """
+    LinearGaussianSampling for many seeds (replicas) at once. State has a leading replica axis e.g. B of shape (R, d, d)
+    and X of shape (R, d, N). Each replica uses its own generator, so it reproduces the run of LinearGaussianSampling
+    with the same seed. Sampling and triangular solves are done per replica, everything else for all replicas at once.
+    v can be given per replica, so that many of its values can be evaluated in one run (X can then be a read-only
+    broadcast view of shared features).
+    """
+    replica_class = LinearGaussianSampling
+    # shared with single models, so that replicas refresh factors at the same steps
+    _count_observations = LinearGaussianSampling._count_observations
+
+    def __init__(self, arms_nb: int, d: int, X: np.array, v: Union[float, List[float]], seeds: List[int],
+                 refresh_every: Optional[int] = None):
+        self.seeds = seeds
+        self.generators = [np.random.default_rng(seed) for seed in self.seeds]
+        self.R = len(self.seeds)
+
+        self.N = arms_nb
+        self.d = d
+        self.X = X
+        self.v = np.broadcast_to(np.asarray(v, dtype=float), (self.R,))  # shape (R,)
+        self.refresh_every = refresh_every
+        self.observations_nb = 0
+
+        self.B = np.stack([np.eye(d)] * self.R)
+        self.L = np.stack([np.eye(d)] * self.R)
+        self.f = np.zeros((self.R, d, 1))
+        self.mi_dashed = np.zeros((self.R, d, 1))
+
+        self.mi = None
+        self.exp_reward = None
+
+    def _update_exp_reward(self) -> np.array:
+        self.exp_reward = self.mi.transpose(0, 2, 1) @ self.X
+
+    def _sample_mi(self) -> None:
+        self.mi = np.stack([sample_from_precision_factor(generator, mi_dashed, L, scale=v)
+                            for generator, mi_dashed, L, v in zip(self.generators, self.mi_dashed, self.L, self.v)])
+
+    def observe_reward(self, i: np.array, r: np.array):
+        X_i = np.expand_dims(self.X[np.arange(self.R), :, i], axis=2)
+        self.B += X_i @ X_i.transpose(0, 2, 1)
+        self.f += X_i * np.reshape(r, (self.R, 1, 1))
+        if self._count_observations(1):
+            self.L = np.stack([np.linalg.cholesky(B) for B in self.B])
+        else:
+            cholesky_rank_one_update(self.L, X_i)
+        self.mi_dashed = np.stack([cholesky_solve(L, f) for L, f in zip(self.L, self.f)])
+
+        self.mi = None
+        self.exp_reward = None
+
+    def _get_best_arm(self):
+        return np.argmax(self.exp_reward[:, 0, :], axis=1)
+
+    def choose_arm(self):
+        self._sample_mi()
+        self._update_exp_reward()
+        return self._get_best_arm()
 
+    def replica(self, r: int) -> LinearGaussianSampling:
+        model = self.replica_class(self.N, self.d, self.X[r], self.v[r], self.seeds[r], self.refresh_every)
+        model.generator.bit_generator.state = self.generators[r].bit_generator.state
+        model.observations_nb = self.observations_nb
+        model.B = self.B[r].copy()
+        model.L = self.L[r].copy()
+        model.f = self.f[r].copy()
+        model.mi_dashed = self.mi_dashed[r].copy()
+        model.mi = None if self.mi is None else self.mi[r].copy()
+        model.exp_reward = None if self.exp_reward is None else self.exp_reward[r].copy()
+        return model
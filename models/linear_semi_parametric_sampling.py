@@ -1,8 +1,23 @@
+from typing import List, Optional, Union
+
 import numpy as np
+from scipy.special import ndtri
+
+from models.cholesky import cholesky_rank_one_update, cholesky_solve, cholesky_update, sample_from_precision_factor
+from models.context_features import dense_columns, left_multiply, right_multiply, weighted_gram
+from models.mips_index import MipsIndex
+
+# probability that gamma of an arm which was never observed is drawn from the tail of its prior in searches with
+# MipsIndex; the rest of gammas of such arms exceed theta @ x by at most sigma_2 * ndtri(1 - GAMMA_TAIL_PROBABILITY)
+GAMMA_TAIL_PROBABILITY = 1e-3
 
 
 class LinearSemiParametricSampling:
-    def __init__(self, arms_nb: int, d: int, X: np.array, sigma_1: float, sigma_2: float, sigma_3: float, seed: int):
+    state_attributes = ("n", "r_avg", "A", "b", "L", "observations_nb")
+
+    def __init__(self, arms_nb: int, d: int, X: np.array, sigma_1: float, sigma_2: float, sigma_3: float, seed: int,
+                 refresh_every: Optional[int] = None, mips_clusters_nb: Optional[int] = None,
+                 mips_max_clusters: Optional[int] = None):
         self.seed = seed
         self.generator = np.random.default_rng(self.seed)
         self.N = arms_nb
@@ -13,12 +28,28 @@ class LinearSemiParametricSampling:
         self.sigma_1 = sigma_1
         self.sigma_2 = sigma_2
         self.sigma_3 = sigma_3
+        # A and b are kept as running sums; every refresh_every observations they are rebuilt from scratch
+        # to limit floating-point drift (None or 0 disables the rebuild)
+        self.refresh_every = refresh_every
+        self.observations_nb = 0
 
         self.A = self._initial_A()
         self.b = self._initial_b()
+        self.L = np.linalg.cholesky(self.A)  # lower triangular Cholesky factor of A
 
-        self.theta = None  # shape (d, 1)
-        self.gamma = None  # shape (N, 1)
+        self.theta = None  # shape (d, 1), (d, k) after choose_arms
+        self.gamma = None  # shape (N, 1), (k, N) after choose_arms
+        # with mips_clusters_nb gammas are drawn only for arms which can be the best (see _sample_best_arm_with_index)
+        self.mips_clusters_nb = mips_clusters_nb
+        self.mips_max_clusters = mips_max_clusters
+        self.mips_index = MipsIndex(X, mips_clusters_nb, mips_max_clusters) if mips_clusters_nb else None
+        # with mips_index, arms observed at least once in increasing order, kept up to date by observe_reward(s),
+        # so that searches take time proportional to the observed arms, not to all arms
+        self.observed_arms = np.flatnonzero(self.n) if self.mips_index else None
+
+    def state_restored(self) -> None:
+        if self.mips_index:
+            self.observed_arms = np.flatnonzero(self.n)
 
     def _initial_A(self) -> np.array:
         return 1 / (self.sigma_3 ** 2) * np.identity(self.d)
@@ -26,22 +57,18 @@ class LinearSemiParametricSampling:
     def _initial_b(self) -> np.array:
         return np.zeros((self.d, 1))
 
+    def _weight(self, n: np.array) -> np.array:
+        return n / (self.sigma_1 ** 2 + n * (self.sigma_2 ** 2))
+
     def _delta_A(self) -> np.array:
-        delta_A = np.zeros((self.d, self.d))
-        for i in range(self.N):
-            x = np.expand_dims(self.X[:, i], axis=1)
-            delta_A += self.n[i] / (self.sigma_1 ** 2 + self.n[i] * (self.sigma_2 ** 2)) * (x @ x.T)
-        return delta_A
+        return weighted_gram(self.X, self._weight(self.n))
 
     def _delta_b(self) -> np.array:
-        delta_b = np.zeros((self.d, 1))
-        for i in range(self.N):
-            x = np.expand_dims(self.X[:, i], axis=1)
-            delta_b += (self.n[i] * self.r_avg[i]) / (self.sigma_1 ** 2 + self.n[i] * (self.sigma_2 ** 2)) * x
-        return delta_b
+        return right_multiply(self.X, np.expand_dims(self._weight(self.n) * self.r_avg, axis=1))
 
     def _estimate_gamma_mean(self) -> np.array:
-        numerator = (self.sigma_2 ** 2) * self.n * self.r_avg + (self.sigma_1 ** 2) * self.theta.T @ self.X
+        linear_part = left_multiply((self.sigma_1 ** 2) * self.theta.T, self.X)
+        numerator = (self.sigma_2 ** 2) * self.n * self.r_avg + linear_part
         denominator = self.sigma_1 ** 2 + self.n * (self.sigma_2 ** 2)
         return numerator / denominator
 
@@ -49,46 +76,277 @@ class LinearSemiParametricSampling:
         return (self.sigma_1 * self.sigma_2) ** 2 / (self.sigma_1 ** 2 + self.n * self.sigma_2 ** 2)
 
     def _estimate_theta_mean(self) -> np.array:
-        A_inv = np.linalg.inv(self.A)
-        return A_inv @ self.b
+        return cholesky_solve(self.L, self.b)
 
     def _estimate_theta_cov(self) -> np.array:
-        A_inv = np.linalg.inv(self.A)
-        return A_inv
+        return cholesky_solve(self.L, np.identity(self.d))
 
     def _sample_theta(self) -> None:
         mean = self._estimate_theta_mean()
-        mean_flat = mean.flatten()
-        cov = self._estimate_theta_cov()
-        theta_flat = self.generator.multivariate_normal(mean_flat, cov)
-        self.theta = np.expand_dims(theta_flat, axis=1)
+        self.theta = sample_from_precision_factor(self.generator, mean, self.L)
 
     def _sample_gamma(self) -> None:
         mean = self._estimate_gamma_mean()
         mean_flat = mean.flatten()
         gamma_var = self._estimate_gamma_var()
-        self.gamma = self.generator.multivariate_normal(mean_flat, np.diag(gamma_var))
+        # gammas are independent, so they are sampled per arm without building N x N covariance matrix
+        self.gamma = self.generator.normal(mean_flat, np.sqrt(gamma_var))
+
+    def _choose_unobserved_arms(self, arms_nb: int) -> np.array:
+        """Returns arms_nb distinct arms which were never observed, chosen uniformly"""
+        if len(self.observed_arms) > self.N // 2:
+            return self.generator.choice(np.flatnonzero(self.n == 0), arms_nb, replace=False)
+        arms = np.empty(0, dtype=int)
+        while len(arms) < arms_nb:
+            candidates = self.generator.integers(self.N, size=arms_nb)
+            arms = np.concatenate([arms, candidates[self.n[candidates] == 0]])
+            # keeping the first draw of every arm, which gives uniformly chosen distinct arms
+            _, first_draws = np.unique(arms, return_index=True)
+            arms = arms[np.sort(first_draws)]
+        return arms[:arms_nb]
+
+    def _sample_best_arm_with_index(self, theta: np.array) -> int:
+        """
+        Returns the arm with the greatest gamma sampled for theta, drawing gammas only for arms which can be the best.
+        Gammas of observed arms are drawn directly. Gamma of an arm which was never observed is theta @ x + sigma_2 * z
+        for standard normal z; z is drawn above ndtri(1 - p) for a binomial number of such arms (each with
+        probability p) and below it for the rest, which are searched with MipsIndex only while they can exceed
+        the best gamma. The chosen arm has the same distribution as the argmax of gammas of all arms
+        (with mips_max_clusters the search can miss it).
+        """
+        theta = np.ravel(theta)
+        best_arm, best_gamma = -1, -np.inf
+        observed_arms = self.observed_arms
+        if len(observed_arms):
+            n, r_avg = self.n[observed_arms], self.r_avg[observed_arms]
+            linear_part = (self.sigma_1 ** 2) * (theta @ dense_columns(self.X, observed_arms))
+            denominator = self.sigma_1 ** 2 + n * (self.sigma_2 ** 2)
+            mean = ((self.sigma_2 ** 2) * n * r_avg + linear_part) / denominator
+            gamma = self.generator.normal(mean, np.sqrt((self.sigma_1 * self.sigma_2) ** 2 / denominator))
+            best_arm, best_gamma = int(observed_arms[np.argmax(gamma)]), gamma.max()
+
+        tail_arms = self._choose_unobserved_arms(self.generator.binomial(self.N - len(observed_arms),
+                                                                         GAMMA_TAIL_PROBABILITY))
+        if len(tail_arms):
+            gamma = theta @ dense_columns(self.X, tail_arms) + self.sigma_2 * \
+                ndtri(self.generator.uniform(1 - GAMMA_TAIL_PROBABILITY, 1, len(tail_arms)))
+            if gamma.max() > best_gamma:
+                best_arm, best_gamma = int(tail_arms[np.argmax(gamma)]), gamma.max()
+
+        def score(arms: np.array, values: np.array) -> np.array:
+            gamma = values + self.sigma_2 * ndtri(self.generator.uniform(0, 1 - GAMMA_TAIL_PROBABILITY, len(arms)))
+            gamma[(self.n[arms] > 0) | np.isin(arms, tail_arms)] = -np.inf
+            return gamma
+
+        return self.mips_index.max_score(theta, score, self.sigma_2 * ndtri(1 - GAMMA_TAIL_PROBABILITY),
+                                         best_arm, best_gamma)[0]
 
     def _update_parameters(self) -> None:
         self.A = self._initial_A() + self._delta_A()
         self.b = self._initial_b() + self._delta_b()
+        self.L = np.linalg.cholesky(self.A)
+        self.theta = None
+        self.gamma = None
+
+    def _update_parameters_for_arm(self, i: int, previous_n: float, previous_r_avg: float) -> None:
+        x = dense_columns(self.X, [i])
+        previous_weight = self._weight(previous_n)
+        weight = self._weight(self.n[i])
+        delta_weight = weight - previous_weight
+        self.A += delta_weight * (x @ x.T)
+        cholesky_rank_one_update(self.L, np.sqrt(np.abs(delta_weight)) * x, np.sign(delta_weight))
+        self.b += (weight * self.r_avg[i] - previous_weight * previous_r_avg) * x
+        self.theta = None
+        self.gamma = None
+
+    def _update_parameters_for_arms(self, arms: np.array, previous_n: np.array, previous_r_avg: np.array) -> None:
+        X_arms = dense_columns(self.X, arms)
+        previous_weight = self._weight(previous_n)
+        weight = self._weight(self.n[arms])
+        # weights grow with n, so the factor only needs updates
+        delta_weight = weight - previous_weight
+        self.A += (X_arms * delta_weight) @ X_arms.T
+        self.L = cholesky_update(self.L, X_arms * np.sqrt(delta_weight))
+        self.b += X_arms @ np.expand_dims(weight * self.r_avg[arms] - previous_weight * previous_r_avg, axis=1)
         self.theta = None
         self.gamma = None
 
     def _update_average(self, current_average: float, current_weight: float, new_value: float) -> float:
         return (current_average * current_weight + new_value) / (current_weight + 1)
 
+    def _count_observations(self, observations_nb: int) -> bool:
+        """Returns True if the parameters should be rebuilt from scratch after these observations"""
+        previous_observations_nb = self.observations_nb
+        self.observations_nb += observations_nb
+        return bool(self.refresh_every) and \
+            self.observations_nb // self.refresh_every > previous_observations_nb // self.refresh_every
+
     def observe_reward(self, i: int, r: float):
+        previous_n, previous_r_avg = self.n[i], self.r_avg[i]
         self.r_avg[i] = self._update_average(self.r_avg[i], self.n[i], r)
         self.n[i] += 1
-        self._update_parameters()
+        if self.mips_index and previous_n == 0:
+            self.observed_arms = np.insert(self.observed_arms, np.searchsorted(self.observed_arms, i), i)
+        if self._count_observations(1):
+            self._update_parameters()
+        else:
+            self._update_parameters_for_arm(i, previous_n, previous_r_avg)
+
+    def observe_rewards(self, arms: np.array, rewards: np.array):
+        observed_arms = np.unique(arms)
+        rewards_sum = np.bincount(arms, weights=rewards, minlength=self.N)[observed_arms]
+        rewards_nb = np.bincount(arms, minlength=self.N)[observed_arms]
+        previous_n, previous_r_avg = self.n[observed_arms], self.r_avg[observed_arms]
+        self.r_avg[observed_arms] = (previous_r_avg * previous_n + rewards_sum) / (previous_n + rewards_nb)
+        self.n[observed_arms] += rewards_nb
+        if self.mips_index:
+            new_arms = observed_arms[previous_n == 0]
+            self.observed_arms = np.insert(self.observed_arms, np.searchsorted(self.observed_arms, new_arms), new_arms)
+        if self._count_observations(len(arms)):
+            self._update_parameters()
+        else:
+            self._update_parameters_for_arms(observed_arms, previous_n, previous_r_avg)
 
     def _get_best_arm(self):
         return np.argmax(self.gamma)
 
     def choose_arm(self):
         self._sample_theta()
+        if self.mips_index:
+            return self._sample_best_arm_with_index(self.theta)
         self._sample_gamma()
         return self._get_best_arm()
 
+    def choose_arms(self, k: int) -> np.array:
+        self.theta = sample_from_precision_factor(self.generator, self._estimate_theta_mean(), self.L, samples_nb=k)
+        if self.mips_index:
+            return np.array([self._sample_best_arm_with_index(self.theta[:, j]) for j in range(k)])
+        self.gamma = self.generator.normal(self._estimate_gamma_mean(), np.sqrt(self._estimate_gamma_var()))
+        return np.argmax(self.gamma, axis=1)
+
+
+class BatchedLinearSemiParametricSampling:
+    """
+    LinearSemiParametricSampling for many seeds (replicas) at once. State has a leading replica axis e.g. A of shape
+    (R, d, d) and X of shape (R, d, N). Each replica uses its own generator, so it reproduces the run of
+    LinearSemiParametricSampling with the same seed. Sampling, triangular solves and full rebuilds are done per replica,
+    everything else for all replicas at once. Hyper-parameters can be given per replica, so that many hyper-parameter
+    values can be evaluated in one run (X can then be a read-only broadcast view of shared features).
+    """
+    replica_class = LinearSemiParametricSampling
+    # shared with single models, so that replicas rebuild parameters at the same steps
+    _count_observations = LinearSemiParametricSampling._count_observations
+
+    def __init__(self, arms_nb: int, d: int, X: np.array, sigma_1: Union[float, List[float]],
+                 sigma_2: Union[float, List[float]], sigma_3: Union[float, List[float]], seeds: List[int],
+                 refresh_every: Optional[int] = None):
+        self.seeds = seeds
+        self.generators = [np.random.default_rng(seed) for seed in self.seeds]
+        self.R = len(self.seeds)
+        self.N = arms_nb
+        self.d = d
+        self.X = X  # shape (R, d, N)
+        self.n = np.zeros((self.R, self.N))
+        self.r_avg = np.zeros((self.R, self.N))
+        # hyper-parameters of each replica, shape (R,)
+        self.sigma_1 = np.broadcast_to(np.asarray(sigma_1, dtype=float), (self.R,))
+        self.sigma_2 = np.broadcast_to(np.asarray(sigma_2, dtype=float), (self.R,))
+        self.sigma_3 = np.broadcast_to(np.asarray(sigma_3, dtype=float), (self.R,))
+        self.refresh_every = refresh_every
+        self.observations_nb = 0
+
+        self.A = np.stack([self._initial_A(r) for r in range(self.R)])
+        self.b = np.stack([self._initial_b()] * self.R)
+        self.L = np.linalg.cholesky(self.A)
+
+        self.theta = None  # shape (R, d, 1)
+        self.gamma = None  # shape (R, N)
+
+    def _per_replica(self, values: np.array, ndim: int) -> np.array:
+        """Reshapes values of shape (R,) to broadcast against arrays of ndim dimensions with a leading replica axis"""
+        return np.reshape(values, (self.R,) + (1,) * (ndim - 1))
+
+    def _initial_A(self, r: int) -> np.array:
+        return 1 / (self.sigma_3[r] ** 2) * np.identity(self.d)
+
+    def _initial_b(self) -> np.array:
+        return np.zeros((self.d, 1))
+
+    def _weight(self, n: np.array) -> np.array:
+        sigma_1, sigma_2 = self._per_replica(self.sigma_1, n.ndim), self._per_replica(self.sigma_2, n.ndim)
+        return n / (sigma_1 ** 2 + n * (sigma_2 ** 2))
+
+    def _estimate_gamma_mean(self) -> np.array:
+        sigma_1, sigma_2 = self._per_replica(self.sigma_1, 2), self._per_replica(self.sigma_2, 2)
+        linear_part = ((self._per_replica(self.sigma_1, 3) ** 2) * self.theta.transpose(0, 2, 1) @ self.X)[:, 0, :]
+        numerator = (sigma_2 ** 2) * self.n * self.r_avg + linear_part
+        denominator = sigma_1 ** 2 + self.n * (sigma_2 ** 2)
+        return numerator / denominator
+
+    def _estimate_gamma_var(self):
+        sigma_1, sigma_2 = self._per_replica(self.sigma_1, 2), self._per_replica(self.sigma_2, 2)
+        return (sigma_1 * sigma_2) ** 2 / (sigma_1 ** 2 + self.n * sigma_2 ** 2)
+
+    def _sample_theta(self) -> None:
+        self.theta = np.stack([sample_from_precision_factor(generator, cholesky_solve(L, b), L)
+                               for generator, L, b in zip(self.generators, self.L, self.b)])
+
+    def _sample_gamma(self) -> None:
+        mean = self._estimate_gamma_mean()
+        gamma_std = np.sqrt(self._estimate_gamma_var())
+        self.gamma = np.stack([generator.normal(mean_r, std_r)
+                               for generator, mean_r, std_r in zip(self.generators, mean, gamma_std)])
+
+    def _update_parameters(self) -> None:
+        weight = self._weight(self.n)
+        for r in range(self.R):
+            self.A[r] = self._initial_A(r) + (self.X[r] * weight[r]) @ self.X[r].T
+            self.b[r] = self._initial_b() + self.X[r] @ np.expand_dims(weight[r] * self.r_avg[r], axis=1)
+            self.L[r] = np.linalg.cholesky(self.A[r])
+        self.theta = None
+        self.gamma = None
+
+    def _update_parameters_for_arms(self, i: np.array, previous_n: np.array, previous_r_avg: np.array) -> None:
+        replicas = np.arange(self.R)
+        x = np.expand_dims(self.X[replicas, :, i], axis=2)
+        previous_weight = self._weight(previous_n)
+        weight = self._weight(self.n[replicas, i])
+        delta_weight = weight - previous_weight
+        self.A += np.reshape(delta_weight, (self.R, 1, 1)) * (x @ x.transpose(0, 2, 1))
+        cholesky_rank_one_update(self.L, np.reshape(np.sqrt(np.abs(delta_weight)), (self.R, 1, 1)) * x,
+                                 np.sign(delta_weight))
+        self.b += np.reshape(weight * self.r_avg[replicas, i] - previous_weight * previous_r_avg, (self.R, 1, 1)) * x
+        self.theta = None
+        self.gamma = None
+
+    def observe_reward(self, i: np.array, r: np.array):
+        replicas = np.arange(self.R)
+        previous_n, previous_r_avg = self.n[replicas, i], self.r_avg[replicas, i]
+        self.r_avg[replicas, i] = (previous_r_avg * previous_n + r) / (previous_n + 1)
+        self.n[replicas, i] += 1
+        if self._count_observations(1):
+            self._update_parameters()
+        else:
+            self._update_parameters_for_arms(i, previous_n, previous_r_avg)
+
+    def _get_best_arm(self):
+        return np.argmax(self.gamma, axis=1)
+
+    def choose_arm(self):
+        self._sample_theta()
+        self._sample_gamma()
+        return self._get_best_arm()
 
+    def replica(self, r: int) -> LinearSemiParametricSampling:
+        model = self.replica_class(self.N, self.d, self.X[r], self.sigma_1[r], self.sigma_2[r], self.sigma_3[r],
+                                   self.seeds[r], self.refresh_every)
+        model.generator.bit_generator.state = self.generators[r].bit_generator.state
+        model.observations_nb = self.observations_nb
+        model.n = self.n[r].copy()
+        model.r_avg = self.r_avg[r].copy()
+        model.A = self.A[r].copy()
+        model.b = self.b[r].copy()
+        model.L = self.L[r].copy()
+        model.theta = None if self.theta is None else self.theta[r].copy()
+        model.gamma = None if self.gamma is None else self.gamma[r].copy()
+        return model
@@ -0,0 +1,123 @@
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+from models.context_features import CHUNK_ELEMENTS, column_chunks, dense_columns, left_multiply
+
+MIN_SAMPLE_COLUMNS_PER_CLUSTER = 32
+# when scanned clusters, or the clusters which can still contain a better arm, have more than this fraction of arms,
+# they are scanned at once (with a pass over all columns of X unless max_clusters limits the search)
+DENSE_SCAN_FRACTION = 0.25
+
+
+class MipsIndex:
+    """
+    Index of columns of context features X of shape (d, N) for maximum inner product search.
+    Columns are partitioned into clusters_nb clusters with k-means (on a sample of columns). Inner products of columns
+    of a cluster with theta are bounded by the smaller of theta @ center + |theta| * radius and the maximum of
+    theta @ x over the bounding box of the cluster. A search computes bounds of all clusters, O(d * clusters_nb),
+    and scans clusters in decreasing order of bounds only while they can contain a better arm, so it returns the
+    same arm as a scan of all columns (up to rounding of inner products). With max_clusters at most that many
+    clusters are scanned, which bounds the time of a search, but can miss the best arm.
+    The index keeps only the permutation of arms sorted by clusters and offsets of clusters in it (not a copy of X),
+    so it works also for memory-mapped X; columns of scanned clusters are gathered from X.
+    The index depends only on X and seed, so it is rebuilt, not saved, when a model is restored from a checkpoint.
+    """
+    def __init__(self, X: np.array, clusters_nb: int, max_clusters: Optional[int] = None, seed: int = 0,
+                 iterations_nb: int = 10):
+        self.X = X
+        self.d, self.N = X.shape
+        self.clusters_nb = max(1, min(clusters_nb, self.N))
+        self.max_clusters = max_clusters
+        generator = np.random.default_rng(seed)
+        sample_size = min(self.N, MIN_SAMPLE_COLUMNS_PER_CLUSTER * self.clusters_nb)
+        sample = dense_columns(X, np.sort(generator.choice(self.N, sample_size, replace=False)))
+        self.centers = sample[:, generator.choice(sample_size, self.clusters_nb, replace=False)]
+        for _ in range(iterations_nb):
+            labels = self._nearest_centers(sample)
+            counts = np.bincount(labels, minlength=self.clusters_nb)
+            sums = np.stack([np.bincount(labels, weights=row, minlength=self.clusters_nb) for row in sample])
+            nonempty = counts > 0
+            self.centers[:, nonempty] = sums[:, nonempty] / counts[nonempty]
+
+        # distances to all centers of CHUNK_ELEMENTS / clusters_nb columns at a time
+        step = max(1, CHUNK_ELEMENTS // self.clusters_nb)
+        labels = np.concatenate([self._nearest_centers(dense_columns(X, slice(start, start + step)))
+                                 for start in range(0, self.N, step)])
+        # arms sorted by clusters, arms of cluster c are arms[offsets[c]:offsets[c + 1]]
+        self.arms = np.argsort(labels, kind="stable")
+        self.sizes = np.bincount(labels, minlength=self.clusters_nb)
+        self.offsets = np.concatenate([[0], np.cumsum(self.sizes)])
+        self._compute_bounding_regions(labels)
+
+    def _nearest_centers(self, columns: np.array) -> np.array:
+        distances = (self.centers ** 2).sum(axis=0) - 2 * columns.T @ self.centers
+        return np.argmin(distances, axis=1)
+
+    def _compute_bounding_regions(self, labels: np.array) -> None:
+        self.radii = np.zeros(self.clusters_nb)
+        self.lower = np.full((self.d, self.clusters_nb), np.inf)
+        self.upper = np.full((self.d, self.clusters_nb), -np.inf)
+        for columns in column_chunks(self.X):
+            chunk_labels = labels[columns]
+            order = np.argsort(chunk_labels, kind="stable")
+            chunk_labels = chunk_labels[order]
+            X_chunk = dense_columns(self.X, columns)[:, order]
+            clusters, starts = np.unique(chunk_labels, return_index=True)
+            distances = np.linalg.norm(X_chunk - self.centers[:, chunk_labels], axis=0)
+            self.radii[clusters] = np.maximum(self.radii[clusters], np.maximum.reduceat(distances, starts))
+            self.lower[:, clusters] = np.minimum(self.lower[:, clusters], np.minimum.reduceat(X_chunk, starts, axis=1))
+            self.upper[:, clusters] = np.maximum(self.upper[:, clusters], np.maximum.reduceat(X_chunk, starts, axis=1))
+
+    def cluster_bounds(self, theta: np.array) -> np.array:
+        """Returns upper bounds of inner products of theta of shape (d,) with columns of every cluster"""
+        ball_bounds = theta @ self.centers + np.linalg.norm(theta) * self.radii
+        box_bounds = np.maximum(theta[:, np.newaxis] * self.lower, theta[:, np.newaxis] * self.upper).sum(axis=0)
+        bounds = np.minimum(ball_bounds, box_bounds)
+        bounds[self.sizes == 0] = -np.inf
+        return bounds
+
+    def _cluster_values(self, theta: np.array, clusters: np.array) -> Tuple[np.array, np.array]:
+        """Returns arms of the clusters and their inner products with theta"""
+        if self.sizes[clusters].sum() > DENSE_SCAN_FRACTION * self.N:
+            if self.max_clusters is None:
+                # arms of the other clusters cannot beat the best score, scoring them is cheaper than leaving them out
+                return np.arange(self.N), left_multiply(theta, self.X)
+            in_clusters = np.zeros(self.clusters_nb, dtype=bool)
+            in_clusters[clusters] = True
+            arms = self.arms[np.repeat(in_clusters, self.sizes)]
+            return arms, left_multiply(theta, self.X)[arms]
+        arms = np.concatenate([self.arms[self.offsets[c]:self.offsets[c + 1]] for c in clusters])
+        return arms, left_multiply(theta, dense_columns(self.X, arms))
+
+    def max_score(self, theta: np.array, score: Optional[Callable[[np.array, np.array], np.array]] = None,
+                  slack: float = 0., best_arm: int = -1, best_score: float = -np.inf) -> Tuple[int, float]:
+        """
+        Returns the arm with the greatest score and the score, starting from the given best arm and score.
+        Scores of arms are score(arms, theta @ X[:, arms]), by default inner products, and must not exceed
+        inner products by more than slack. Of arms with equal scores the one with the lowest number is returned.
+        """
+        theta = np.ravel(theta)
+        bounds = self.cluster_bounds(theta)
+        clusters = np.argsort(-bounds, kind="stable")[:self.max_clusters]
+        position, group_size = 0, 1
+        while position < len(clusters) and bounds[clusters[position]] + slack >= best_score:
+            remaining_clusters = clusters[position:]
+            remaining_clusters = remaining_clusters[bounds[remaining_clusters] + slack >= best_score]
+            group = remaining_clusters[:group_size]
+            # gathering columns of clusters costs more per arm than a dense pass, so once the clusters which can still
+            # beat the best score hold many arms they are scored at once
+            candidates_nb = self.sizes[remaining_clusters].sum() if best_score > -np.inf else 0
+            if max(self.sizes[group].sum(), candidates_nb) > DENSE_SCAN_FRACTION * self.N:
+                group = remaining_clusters
+                group_size = len(clusters)
+            arms, values = self._cluster_values(theta, group)
+            scores = values if score is None else score(arms, values)
+            if len(arms):
+                group_best_score = scores.max()
+                group_best_arm = int(arms[scores == group_best_score].min())
+                if group_best_score > best_score or (group_best_score == best_score and group_best_arm < best_arm):
+                    best_arm, best_score = group_best_arm, group_best_score
+            position += group_size
+            group_size *= 2
+        return best_arm, best_score
@@ -0,0 +1,74 @@
+import importlib
+from typing import Dict, List
+
+# entry point group of third-party models, e.g. in pyproject.toml of a package with a model:
+# [project.entry-points."semi_parametric_sampling.models"]
+# MyModel = "my_package.my_model:MyModel"
+ENTRY_POINT_GROUP = "semi_parametric_sampling.models"
+
+# built-in models and their modules, which are imported only when a model is used
+BUILTIN_MODELS = {"LinearSemiParametricSampling": "models.linear_semi_parametric_sampling",
+                  "BetaPriorsSampling": "models.beta_priors_sampling",
+                  "GaussianPriorsSampling": "models.gaussian_priors_sampling",
+                  "LinearGaussianSampling": "models.linear_gaussian_sampling"}
+
+
+def _entry_points(group: str) -> list:
+    """
+    Returns entry points of the group with importlib.metadata (Python 3.8+), its backport importlib_metadata
+    or pkg_resources (Python 3.7), or no entry points if none of them is available
+    """
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        try:
+            from importlib_metadata import entry_points
+        except ImportError:
+            try:
+                from pkg_resources import iter_entry_points
+            except ImportError:
+                return []
+            return list(iter_entry_points(group))
+    all_entry_points = entry_points()
+    if hasattr(all_entry_points, "select"):
+        return list(all_entry_points.select(group=group))
+    # before Python 3.10 entry_points() returns a dict of groups
+    return list(all_entry_points.get(group, []))
+
+
+def _registered_models() -> Dict[str, object]:
+    """Returns entry points of third-party models by their names, without built-in models which take precedence"""
+    return {entry_point.name: entry_point for entry_point in _entry_points(ENTRY_POINT_GROUP)
+            if entry_point.name not in BUILTIN_MODELS}
+
+
+def get_model_names() -> List[str]:
+    """Returns names of built-in and registered models without importing them"""
+    return list(_registered_models().keys()) + list(BUILTIN_MODELS.keys())
+
+
+def is_model_name(name: str) -> bool:
+    """Checks names of built-in models without loading entry points, which are loaded only for other names"""
+    return name in BUILTIN_MODELS or name in _registered_models()
+
+
+def get_model_class(name: str, batched: bool = False) -> type:
+    """
+    Imports the model class with the given name. The batched variant of a model (for --replicas and --sweep)
+    is the class Batched<name> of the module of the model.
+    """
+    if name in BUILTIN_MODELS:
+        model_class = getattr(importlib.import_module(BUILTIN_MODELS[name]), name)
+    else:
+        registered_models = _registered_models()
+        if name not in registered_models:
+            raise ValueError(f"Unknown model {name}, available models: {', '.join(get_model_names())}.")
+        model_class = registered_models[name].load()
+    if not batched:
+        return model_class
+    module = importlib.import_module(model_class.__module__)
+    batched_class_name = "Batched" + model_class.__name__
+    if not hasattr(module, batched_class_name):
+        raise ValueError(f"Model {name} does not support --replicas and --sweep (no class {batched_class_name} "
+                         f"in {module.__name__}).")
+    return getattr(module, batched_class_name)
@@ -0,0 +1,68 @@
+import json
+from typing import Dict, Tuple, Union
+
+import numpy as np
+
+# spawn key of generators of pools, distinguishing them from the generator of the model with the same seed
+VARIATE_POOL_SPAWN_KEY = 1_000_003
+KINDS = ("standard_normal",)
+
+
+class VariatePool:
+    """
+    Standard normal variates drawn from their own generator in blocks of block_size, so that sampling pays the dispatch
+    overhead of the generator once per block instead of once per call; normal variates are made from them by location
+    and scale. It pays off for models drawing a few normal variates per arm in every step (GaussianPriorsSampling);
+    other distributions are left to the generator, whose samplers in C are faster than any built from blocks in Python.
+    Generators are derived from the seed, separately from the generator of a model. Variates are drawn one after
+    another, so they do not depend on block_size. State of a pool is saved with state of its model (see LogSaver),
+    so that a model restored from a checkpoint continues with the same variates.
+    Returned variates are read-only views of blocks, when they fit in the current block.
+    """
+    def __init__(self, seed: int, block_size: int = 2 ** 16):
+        self.block_size = block_size
+        self.generators = {kind: np.random.default_rng(np.random.SeedSequence(seed,
+                                                                             spawn_key=(VARIATE_POOL_SPAWN_KEY, i)))
+                           for i, kind in enumerate(KINDS)}
+        # for every kind: state of the generator before the current block, the block and position of the next variate
+        self.block_states: Dict[str, Dict] = {}
+        self.blocks: Dict[str, np.array] = {}
+        self.positions: Dict[str, int] = {}
+        for kind in KINDS:
+            self._draw_block(kind, 0)
+
+    def _draw_block(self, kind: str, position: int) -> None:
+        generator = self.generators[kind]
+        self.block_states[kind] = generator.bit_generator.state
+        self.blocks[kind] = getattr(generator, kind)(self.block_size)
+        self.blocks[kind].flags.writeable = False
+        self.positions[kind] = position
+
+    def _take(self, kind: str, size: Union[int, Tuple[int, ...]]) -> np.array:
+        count = int(np.prod(size))
+        position = self.positions[kind]
+        if position + count <= self.block_size:
+            self.positions[kind] = position + count
+            return self.blocks[kind][position:position + count].reshape(size)
+        variates = [self.blocks[kind][position:]]
+        count -= self.block_size - position
+        while count > 0:
+            self._draw_block(kind, min(count, self.block_size))
+            variates.append(self.blocks[kind][:count])
+            count -= self.block_size
+        return np.concatenate(variates).reshape(size)
+
+    def standard_normal(self, size: Union[int, Tuple[int, ...]]) -> np.array:
+        return self._take("standard_normal", size)
+
+    def normal(self, loc: np.array, scale: np.array, size: Union[int, Tuple[int, ...], None] = None) -> np.array:
+        size = np.broadcast(np.empty(np.shape(loc)), np.empty(np.shape(scale))).shape if size is None else size
+        return loc + scale * self.standard_normal(size)
+
+    def get_state(self) -> str:
+        return json.dumps({kind: [self.block_states[kind], self.positions[kind]] for kind in KINDS})
+
+    def set_state(self, state: str) -> None:
+        for kind, (generator_state, position) in json.loads(state).items():
+            self.generators[kind].bit_generator.state = generator_state
+            self._draw_block(kind, position)
@@ -0,0 +1,102 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+
+class BanditServer:
+    """
+    Serves arms chosen by a model (any class from models with choose_arms and observe_rewards) to many concurrent
+    clients in one event loop.
+    Arms are drawn from the current posterior in pools of pool_size arms with choose_arms, as in runs with delayed
+    feedback, and handed out one by one. The pool is drawn again when it is used up, when it is older than
+    max_staleness seconds or when refresh_after_rewards rewards were applied since it was drawn.
+    Rewards are queued and applied with observe_rewards in micro-batches of up to batch_size rewards; the first
+    reward of a batch waits batch_interval seconds for more. When max_queued_rewards rewards are queued,
+    observe_reward waits until they are applied.
+    The model is called only from one worker thread, so the event loop is not blocked while arms are drawn and
+    rewards applied, and the model does not need to be thread-safe.
+    """
+    def __init__(self, model: Any, pool_size: int = 64, max_staleness: Optional[float] = None,
+                 refresh_after_rewards: Optional[int] = None, batch_size: int = 256, batch_interval: float = 0.001,
+                 max_queued_rewards: int = 10000) -> None:
+        self.model = model
+        self.pool_size = pool_size
+        self.max_staleness = max_staleness
+        self.refresh_after_rewards = refresh_after_rewards
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.max_queued_rewards = max_queued_rewards
+        self.pool = []  # arms of the pool in reversed order, so that they are handed out with pop()
+        self.pool_time = -np.inf
+        self.rewards_since_refresh = 0
+        self.pools_nb = 0
+        self.batches_nb = 0
+
+    async def start(self) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._rewards = asyncio.Queue(self.max_queued_rewards)
+        self._refresh_lock = asyncio.Lock()
+        self._applier = asyncio.create_task(self._apply_rewards())
+
+    async def close(self) -> None:
+        """Applies all queued rewards and stops the server"""
+        await asyncio.wait([asyncio.create_task(self._rewards.join()), self._applier],
+                           return_when=asyncio.FIRST_COMPLETED)
+        if self._applier.done():
+            # applying rewards failed, raising its exception
+            self._applier.result()
+        self._applier.cancel()
+        try:
+            await self._applier
+        except asyncio.CancelledError:
+            pass
+        self._executor.shutdown()
+
+    async def __aenter__(self) -> "BanditServer":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exception_info) -> None:
+        await self.close()
+
+    async def _call_model(self, method: Callable, *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(method, *args))
+
+    def _is_pool_stale(self) -> bool:
+        return not self.pool or \
+            (self.max_staleness is not None and time.monotonic() - self.pool_time > self.max_staleness) or \
+            (self.refresh_after_rewards is not None and self.rewards_since_refresh >= self.refresh_after_rewards)
+
+    async def choose_arm(self) -> int:
+        if self._is_pool_stale():
+            # requests arriving during drawing of the pool wait for it instead of drawing their own pools
+            async with self._refresh_lock:
+                if self._is_pool_stale():
+                    arms = await self._call_model(self.model.choose_arms, self.pool_size)
+                    self.pool = [int(arm) for arm in arms[::-1]]
+                    self.pool_time = time.monotonic()
+                    self.rewards_since_refresh = 0
+                    self.pools_nb += 1
+        return self.pool.pop()
+
+    async def observe_reward(self, arm: int, reward: float) -> None:
+        """Queues the reward, it is applied to the model with the next micro-batch"""
+        await self._rewards.put((arm, reward))
+
+    async def _apply_rewards(self) -> None:
+        while True:
+            batch = [await self._rewards.get()]
+            if self.batch_interval:
+                await asyncio.sleep(self.batch_interval)
+            while len(batch) < self.batch_size and not self._rewards.empty():
+                batch.append(self._rewards.get_nowait())
+            arms, rewards = zip(*batch)
+            await self._call_model(self.model.observe_rewards, np.array(arms), np.array(rewards))
+            self.rewards_since_refresh += len(batch)
+            self.batches_nb += 1
+            for _ in batch:
+                self._rewards.task_done()
@@ -1,8 +1,35 @@
+import json
+from typing import List, Optional
+
 import numpy as np
+import scipy.sparse
+
+from models.context_features import column_chunks, left_multiply, max_column_norm, row_chunks
 
 
 class Environment:
-    def __init__(self, N: int, a: int, d: int, reward_distribution: str, seed: int):
+    """
+    Rewards can be drawn one by one with get_reward, from the environment generator, or for many arms at once
+    with get_rewards. The latter uses a separate random stream for every arm, generated in blocks of
+    reward_block_size variates. The j-th reward drawn with get_rewards for arm i depends only on the seed, i and j,
+    so it is the same for any block size and any order of pulling other arms. States of the streams
+    (reward_streams_state) are saved in checkpoints, so a restored environment continues them.
+    With X_path, context features X are generated in chunks into a .npy file and memory-mapped, so that X larger
+    than memory can be used. X_dtype float32 halves the memory of X. Expected rewards and regrets are still
+    computed in float64, but from X rounded to float32 (relative error below 6e-8 per feature), so they differ from
+    those of float64 X by up to about 4e-8 and runs can choose different arms when arms are that close.
+    With X_density, X is a SciPy CSC sparse matrix with this fraction of nonzero features (at random positions,
+    drawn from the standard normal distribution like dense features), which takes memory and time proportional
+    to its nonzeros.
+    """
+    state_attributes = ("reward_streams_state",)
+
+    def __init__(self, N: int, a: int, d: int, reward_distribution: str, seed: int, reward_block_size: int = 1024,
+                 X_path: Optional[str] = None, X_dtype: str = "float64", X_density: Optional[float] = None):
+        if reward_distribution not in ("normal", "binomial"):
+            raise ValueError(f"Unknown reward distribution: {reward_distribution}")
+        if X_path and X_density is not None:
+            raise ValueError("Sparse context features can't be memory-mapped.")
         self.N = N
         self.a = a
         self.d = d
@@ -10,7 +37,16 @@ class Environment:
         self.generator = np.random.default_rng(seed=self.seed)
 
         self.reward_distribution = reward_distribution
-        self.X = self.generator.normal(size=(d, N))
+        # the distribution is checked once here, not for every reward
+        self.normal_rewards = reward_distribution == "normal"
+        self.draw_reward = self._draw_normal_reward if self.normal_rewards else self._draw_binomial_reward
+        self.reward_block_size = reward_block_size
+        # arm -> (generator, its state before the current block, block of variates, position of the next variate)
+        self.reward_streams = {}
+        self.X_path = X_path
+        self.X_dtype = X_dtype
+        self.X_density = X_density
+        self.X = self._generate_context_features()
         self.X = self._prepare_context_features(self.X)
 
         self.theta = self.generator.normal(size=(d, 1))
@@ -19,13 +55,38 @@ class Environment:
         self.bias = self.generator.uniform(low=0, high=1-self.a, size=(1, N))
 
         self.expected_rewards = self._prepare_expected_rewards(self.theta, self.X, self.bias)
+        self.optimal_expected_reward = self.expected_rewards.max()
+        self.gaps = self.optimal_expected_reward - self.expected_rewards[0]
+
+    def _generate_context_features(self) -> np.array:
+        if self.X_density is not None:
+            return scipy.sparse.random(self.d, self.N, density=self.X_density, format="csc", dtype=self.X_dtype,
+                                       random_state=self.generator, data_rvs=self.generator.standard_normal)
+        if self.X_path:
+            X = np.lib.format.open_memmap(self.X_path, mode="w+", dtype=self.X_dtype, shape=(self.d, self.N))
+        else:
+            X = np.empty((self.d, self.N), dtype=self.X_dtype)
+        # rows are drawn in chunks, which gives the same values as drawing all of them at once
+        for rows in row_chunks(self.d, self.N):
+            X[rows] = self.generator.normal(size=(rows.stop - rows.start, self.N))
+        return X
 
     @staticmethod
     def _prepare_context_features(X: np.array) -> np.array:
-        result_X = np.abs(X)
-        max_norm = np.linalg.norm(result_X, ord=2, axis=0).max()
-        result_X = result_X / max_norm
-        return result_X
+        """Takes absolute values of X and divides them by the maximal norm of columns, in place for float X"""
+        if not np.issubdtype(X.dtype, np.floating):
+            X = X.astype(np.float64)
+        if scipy.sparse.issparse(X):
+            X = X.tocsc()
+            X.data = np.abs(X.data)
+            X.data /= max_column_norm(X)
+            return X
+        for columns in column_chunks(X):
+            X[:, columns] = np.abs(X[:, columns])
+        max_norm = max_column_norm(X)
+        for columns in column_chunks(X):
+            X[:, columns] = X[:, columns] / max_norm
+        return X
 
     @staticmethod
     def _prepare_linear_parameter_vector(theta: np.array, a: float) -> np.array:
@@ -36,19 +97,92 @@ class Environment:
 
     @staticmethod
     def _prepare_expected_rewards(theta: np.array, X: np.array, bias: np.array) -> np.array:
-        return theta.T @ X + bias
+        return left_multiply(theta.T, X) + bias
+
+    def _draw_normal_reward(self, expected_value: float) -> float:
+        return self.generator.normal(loc=expected_value)
+
+    def _draw_binomial_reward(self, expected_value: float) -> int:
+        return self.generator.binomial(n=1, p=expected_value)
 
     def get_reward(self, arm: int) -> float:
-        expected_value = self.expected_rewards[0, arm]
-        if self.reward_distribution == "normal":
-            return self.generator.normal(loc=expected_value)
-        elif self.reward_distribution == "binomial":
-            return self.generator.binomial(n=1, p=expected_value)
+        return self.draw_reward(self.expected_rewards[0, arm])
 
     def get_regret(self, arm: int) -> float:
-        expected_reward = self.expected_rewards[0, arm]
-        optimal_expected_reward = self.expected_rewards.max()
-        return optimal_expected_reward - expected_reward
+        return self.gaps[arm]
+
+    def _stream_generator(self, arm: int) -> np.random.Generator:
+        return np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(arm,)))
+
+    def _draw_block(self, generator: np.random.Generator) -> np.array:
+        if self.normal_rewards:
+            return generator.standard_normal(self.reward_block_size)
+        return generator.random(self.reward_block_size)
+
+    def _next_variates(self, arm: int, count: int) -> np.array:
+        if arm not in self.reward_streams:
+            self.reward_streams[arm] = (self._stream_generator(arm), None, np.empty(0), 0)
+        generator, block_state, block, position = self.reward_streams[arm]
+        variates = block[position:position + count]
+        position += count
+        while len(variates) < count:
+            block_state = generator.bit_generator.state
+            block = self._draw_block(generator)
+            position = count - len(variates)
+            variates = np.concatenate([variates, block[:position]])
+        self.reward_streams[arm] = (generator, block_state, block, position)
+        return variates
+
+    @property
+    def reward_streams_state(self) -> str:
+        """States of generators of reward streams before their current blocks and positions in the blocks"""
+        return json.dumps({arm: [block_state, position]
+                           for arm, (_, block_state, _, position) in self.reward_streams.items()})
+
+    @reward_streams_state.setter
+    def reward_streams_state(self, state: str) -> None:
+        self.reward_streams = {}
+        for arm, (block_state, position) in json.loads(state).items():
+            generator = self._stream_generator(int(arm))
+            generator.bit_generator.state = block_state
+            self.reward_streams[int(arm)] = (generator, block_state, self._draw_block(generator), position)
+
+    def get_rewards(self, arms: np.array) -> np.array:
+        """Draws rewards for the given arms; an arm repeated in arms gets consecutive rewards from its stream."""
+        arms = np.asarray(arms)
+        unique_arms, counts = np.unique(arms, return_counts=True)
+        variates = np.empty(len(arms))
+        variates[np.argsort(arms, kind="stable")] = np.concatenate(
+            [self._next_variates(int(arm), int(count)) for arm, count in zip(unique_arms, counts)])
+        expected_rewards = self.expected_rewards[0, arms]
+        if self.normal_rewards:
+            return expected_rewards + variates
+        return (variates < expected_rewards).astype(int)
+
+    def get_regrets(self, arms: np.array) -> np.array:
+        return self.gaps[arms]
+
+
+class BatchedEnvironment:
+    """
+    Environments for many seeds (replicas) at once. Each replica is an Environment with its own seed, so it behaves
+    exactly as a single run with that seed. X is stacked to shape (R, d, N) and expected rewards to shape (R, N).
+    """
+    def __init__(self, N: int, a: int, d: int, reward_distribution: str, seeds: List[int]):
+        self.N = N
+        self.a = a
+        self.d = d
+        self.seeds = seeds
+        self.R = len(self.seeds)
+        self.reward_distribution = reward_distribution
+        self.environments = [Environment(N, a, d, reward_distribution, seed) for seed in self.seeds]
 
+        self.X = np.stack([env.X for env in self.environments])
+        self.expected_rewards = np.vstack([env.expected_rewards for env in self.environments])
+        self.gaps = np.vstack([env.gaps for env in self.environments])
 
+    def get_reward(self, arms: np.array) -> np.array:
+        return np.array([env.get_reward(arm) for env, arm in zip(self.environments, arms)])
 
+    def get_regret(self, arms: np.array) -> np.array:
+        return self.gaps[np.arange(self.R), arms]
@@ -1,47 +1,165 @@
+import json
 import os
-import pickle
+import re
 import shutil
-import subprocess
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional, Union
 
 import numpy as np
+import scipy.sparse
 import yaml
 
+from simulation.results import Results, StreamingResults
+from simulation.storage import BackgroundUploader, get_storage
+
 
 class LogSaver:
-    def __init__(self, run_name: str, directory: str, gcs_directory: Optional[str], save_every: int = 1) -> None:
+    """
+    Saves files of a run in a local directory. If gcs_directory (a gs:// path or a directory standing in for it)
+    is given, every file is uploaded there in the background as soon as it is saved and its local copy is deleted;
+    a resumed run downloads its latest checkpoint from there (see latest_checkpoint_step).
+    """
+    def __init__(self, run_name: str, directory: str, gcs_directory: Optional[str], save_every: int = 1,
+                 resume: bool = False, yaml_output: bool = False, upload_queue_size: int = 16) -> None:
         self.save_every = save_every
+        self.yaml_output = yaml_output
         self.path = os.path.join(directory, run_name)
-        shutil.rmtree(self.path, ignore_errors=True)
+        if not resume:
+            shutil.rmtree(self.path, ignore_errors=True)
         os.makedirs(self.path, exist_ok=True)
+        # path of context features relative to path, if they are saved in another directory (see refer_to_X)
+        self.X_file_name = None
         if gcs_directory:
             self.gcs_directory = os.path.join(gcs_directory, run_name)
+            self.storage = get_storage(self.gcs_directory)
+            self.uploader = BackgroundUploader(self.storage, upload_queue_size)
         else:
             self.gcs_directory = None
+            self.storage = None
+            self.uploader = None
 
     def sync_with_gcs(self) -> None:
-        if self.gcs_directory:
-            subprocess.call(["gsutil", "-m", "cp", "-r", os.path.join(self.path, "*"), self.gcs_directory])
-            # removing everything to make space
-            shutil.rmtree(self.path, ignore_errors=True)
-            os.makedirs(self.path, exist_ok=True)
+        """Waits until all saved files are uploaded"""
+        if self.uploader:
+            self.uploader.close()
+            self.uploader = None
+
+    def file_saved(self, file_path: str) -> None:
+        """Uploads the saved file, if files are uploaded; can be also called for files written in path directly"""
+        if self.uploader:
+            self.uploader.submit(file_path, os.path.relpath(file_path, self.path))
 
     def save_dict(self, dictionary: Dict, file_name: str) -> None:
         file_path = os.path.join(self.path, file_name)
         with open(file_path, 'w') as f:
             yaml.dump(dictionary, f)
-
-    def save_class(self, class_instance: type, file_name: str) -> None:
-        file_path = os.path.join(self.path, file_name)
-        with open(file_path, 'wb') as f:
-            pickle.dump(class_instance, f)
-
-    def save_class_for_step(self, class_instance: type, file_name: str, step: int) -> None:
-        if step % self.save_every == 0:
-            file_name = file_name + f"_{step}"
-            self.save_class(class_instance, file_name)
+        self.file_saved(file_path)
 
     def save_list(self, list_: List, file_name: str) -> None:
         file_path = os.path.join(self.path, file_name)
         array = np.array(list_)
         np.savetxt(file_path, array)
+        self.file_saved(file_path)
+
+    def save_array(self, array: np.array, file_name: str) -> None:
+        file_path = os.path.join(self.path, file_name + ".npy")
+        np.save(file_path, array)
+        self.file_saved(file_path)
+
+    def save_sparse_matrix(self, matrix: scipy.sparse.spmatrix, file_name: str) -> None:
+        file_path = os.path.join(self.path, file_name + ".npz")
+        scipy.sparse.save_npz(file_path, matrix)
+        self.file_saved(file_path)
+
+    def refer_to_X(self, log_saver: "LogSaver", file_name: str = "X.npy") -> None:
+        """Makes checkpoints refer to context features saved by the given log saver instead of saving them again"""
+        self.X_file_name = os.path.relpath(os.path.join(log_saver.path, file_name), self.path)
+
+    def save_state(self, instance: Any, file_name: str) -> None:
+        """
+        Saves only mutable state of the instance: attributes listed in its state_attributes and state of its generator
+        (and of its variate pool, if it has one).
+        Context features X are not saved, the checkpoint refers to X.npy saved once per run with save_array
+        (or X.npz saved with save_sparse_matrix for sparse X), or to the file of another run given to refer_to_X.
+        """
+        state = {attribute: getattr(instance, attribute) for attribute in instance.state_attributes}
+        state["generator_state"] = json.dumps(instance.generator.bit_generator.state)
+        if getattr(instance, "variate_pool", None):
+            state["variate_pool_state"] = instance.variate_pool.get_state()
+        if hasattr(instance, "X"):
+            state["X_file_name"] = self.X_file_name or ("X.npz" if scipy.sparse.issparse(instance.X) else "X.npy")
+        self._save_npz(state, file_name)
+
+    def save_state_for_step(self, instance: Any, file_name: str, step: int, force: bool = False) -> None:
+        """Saves the state every save_every steps, or at any step with force (e.g. after the last step of a run)"""
+        if force or step % self.save_every == 0:
+            file_name = file_name + f"_{step}"
+            self.save_state(instance, file_name)
+
+    def _save_npz(self, arrays: Dict[str, Any], file_name: str) -> None:
+        # writing to a temporary file first, so a run killed while saving never leaves a truncated checkpoint
+        file_path = os.path.join(self.path, file_name + ".npz")
+        with open(file_path + ".tmp", 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(file_path + ".tmp", file_path)
+        self.file_saved(file_path)
+
+    def save_results(self, results: Union[Results, StreamingResults]) -> None:
+        """
+        Saves arrays of results, e.g. arms and regrets of every model, as separate .npy files,
+        which can be loaded with mmap_mode. With yaml_output they are also saved in YAML files e.g. arms and regrets.
+        """
+        for file_name, array in results.arrays().items():
+            self.save_array(array, file_name)
+        if self.yaml_output:
+            for file_name, dictionary in results.dicts().items():
+                self.save_dict(dictionary, file_name)
+
+    def save_progress_for_step(self, results: Union[Results, StreamingResults], step: int,
+                               force: bool = False) -> None:
+        """Saves results of all steps before the given one, so that a run can be resumed from it"""
+        if force or step % self.save_every == 0:
+            self._save_npz(results.progress(step), f"progress_{step}")
+
+    def load_progress(self, results: Union[Results, StreamingResults], step: int) -> None:
+        with np.load(os.path.join(self.path, f"progress_{step}.npz")) as progress_file:
+            results.restore_progress(dict(progress_file.items()), step)
+
+    def load_state_for_step(self, file_name: str, step: int) -> Dict[str, Any]:
+        return load_state(os.path.join(self.path, f"{file_name}_{step}.npz"))
+
+    def latest_checkpoint_step(self, file_names: List[str], max_step: Optional[int] = None) -> Optional[int]:
+        """
+        Returns the latest step, not later than max_step, for which progress and states of all given file names are
+        saved, locally or in the storage (where uploaded files are kept only). Files of the step which are only in
+        the storage are downloaded, so that they can be loaded as local files.
+        """
+        local_names = set(os.listdir(self.path))
+        saved_names = local_names | set(self.storage.list_names() if self.storage else [])
+        steps = []
+        for file_name in saved_names:
+            match = re.fullmatch(r"progress_(\d+)\.npz", file_name)
+            if match and (max_step is None or int(match.group(1)) <= max_step):
+                steps.append(int(match.group(1)))
+        for step in sorted(steps, reverse=True):
+            step_names = [f"progress_{step}.npz"] + [f"{name}_{step}.npz" for name in file_names]
+            if all(name in saved_names for name in step_names):
+                for name in set(step_names) - local_names:
+                    self.storage.download(name, os.path.join(self.path, name))
+                return step
+        return None
+
+
+def load_state(file_path: str) -> Dict[str, Any]:
+    with np.load(file_path) as state_file:
+        return {key: value.item() if value.ndim == 0 else value for key, value in state_file.items()}
+
+
+def restore_state(instance: Any, state: Dict[str, Any]) -> None:
+    for attribute in instance.state_attributes:
+        setattr(instance, attribute, state[attribute])
+    instance.generator.bit_generator.state = json.loads(state["generator_state"])
+    if "variate_pool_state" in state:
+        instance.variate_pool.set_state(state["variate_pool_state"])
+    # letting the instance rebuild what it derived from the previous state
+    if hasattr(instance, "state_restored"):
+        instance.state_restored()
@@ -0,0 +1,74 @@
+import math
+import resource
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, List, Tuple
+
+HISTOGRAM_BUCKETS_NB = 32  # latencies up to 2 ** 31 microseconds, longer ones are counted in the last bucket
+
+
+def get_peak_rss() -> int:
+    """Returns peak resident set size of the process in bytes"""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class PhaseStatistics:
+    def __init__(self) -> None:
+        self.calls_nb = 0
+        self.total_time = 0.
+        self.max_time = 0.
+        # histogram[i] counts latencies in [2 ** (i - 1), 2 ** i) microseconds, histogram[0] those below 1 microsecond
+        self.histogram = [0] * HISTOGRAM_BUCKETS_NB
+
+    def record(self, elapsed_time: float) -> None:
+        self.calls_nb += 1
+        self.total_time += elapsed_time
+        self.max_time = max(self.max_time, elapsed_time)
+        exponent = max(math.frexp(elapsed_time * 1e6)[1], 0)
+        self.histogram[min(exponent, HISTOGRAM_BUCKETS_NB - 1)] += 1
+
+    def summary(self) -> Dict[str, Any]:
+        return {"calls_nb": self.calls_nb, "total_seconds": self.total_time,
+                "mean_seconds": self.total_time / max(self.calls_nb, 1), "max_seconds": self.max_time,
+                "latency_histogram_us": {f"<{2 ** i}": count for i, count in enumerate(self.histogram) if count}}
+
+
+class Profiler:
+    """Cumulative time and latency histograms of phases of a run for every model, and peak RSS sampled during it"""
+    def __init__(self) -> None:
+        self.start_time = time.perf_counter()
+        self.phases: Dict[Tuple[str, str], PhaseStatistics] = {}
+        self.rss_samples: List[Tuple[int, int]] = []
+
+    @contextmanager
+    def measure(self, name: str, phase: str):
+        start = time.perf_counter()
+        yield
+        elapsed_time = time.perf_counter() - start
+        if (name, phase) not in self.phases:
+            self.phases[(name, phase)] = PhaseStatistics()
+        self.phases[(name, phase)].record(elapsed_time)
+
+    def sample_memory(self, step: int) -> None:
+        self.rss_samples.append((step, get_peak_rss()))
+
+    def summary(self) -> Dict[str, Any]:
+        phases = {}
+        for (name, phase), statistics in self.phases.items():
+            phases.setdefault(name, {})[phase] = statistics.summary()
+        return {"wall_time_seconds": time.perf_counter() - self.start_time, "peak_rss_bytes": get_peak_rss(),
+                "rss_samples": [{"step": step, "peak_rss_bytes": rss} for step, rss in self.rss_samples],
+                "phases": phases}
+
+
+class DisabledProfiler:
+    """Profiler doing nothing, so that a run without profiling has no measurable overhead"""
+    _null_context = nullcontext()
+
+    def measure(self, name: str, phase: str):
+        return self._null_context
+
+    def sample_memory(self, step: int) -> None:
+        pass
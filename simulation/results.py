@@ -0,0 +1,103 @@
+from typing import Dict, List
+
+import numpy as np
+
+
+class Results:
+    """
+    Arms chosen and regrets observed by every model in every step, kept in preallocated typed arrays.
+    Regrets are kept in float64, so that their sums are the same as sums of the regrets returned by the environment.
+    """
+    def __init__(self, model_names: List[str], steps: int):
+        self.steps = steps
+        self.arms = {name: np.zeros(steps, dtype=np.int32) for name in model_names}
+        self.regrets = {name: np.zeros(steps, dtype=np.float64) for name in model_names}
+
+    def record(self, model_name: str, step: int, arm: int, regret: float) -> None:
+        self.arms[model_name][step] = arm
+        self.regrets[model_name][step] = regret
+
+    def record_many(self, model_name: str, first_step: int, arms: np.array, regrets: np.array) -> None:
+        self.arms[model_name][first_step:first_step + len(arms)] = arms
+        self.regrets[model_name][first_step:first_step + len(regrets)] = regrets
+
+    def progress(self, step: int) -> Dict[str, np.array]:
+        """Returns arrays with results of all steps before the given one"""
+        arrays = {f"arms_{name}": arms[:step] for name, arms in self.arms.items()}
+        arrays.update({f"regrets_{name}": regrets[:step] for name, regrets in self.regrets.items()})
+        return arrays
+
+    def restore_progress(self, arrays: Dict[str, np.array], step: int) -> None:
+        for name in self.arms.keys():
+            self.arms[name][:step] = arrays[f"arms_{name}"]
+            self.regrets[name][:step] = arrays[f"regrets_{name}"]
+
+    def arrays(self) -> Dict[str, np.array]:
+        arrays = {f"arms_{name}": arms for name, arms in self.arms.items()}
+        arrays.update({f"regrets_{name}": regrets for name, regrets in self.regrets.items()})
+        return arrays
+
+    def dicts(self) -> Dict[str, Dict]:
+        return {"arms": {name: arms.tolist() for name, arms in self.arms.items()},
+                "regrets": {name: regrets.tolist() for name, regrets in self.regrets.items()}}
+
+
+def log_spaced_checkpoints(steps: int, checkpoints_nb: int = 100) -> List[int]:
+    return np.unique(np.round(np.logspace(0, np.log10(max(steps, 1)), checkpoints_nb)).astype(int)).tolist()
+
+
+class StreamingResults:
+    """
+    Total regret of every model, its cumulative regret after every checkpoint step and numbers of pulls of every arm,
+    kept in O(checkpoints + N) memory instead of O(steps) of Results. The last step is always a checkpoint.
+    Regrets are added one by one in float64, so totals are the same as the last cumulative sums of Results.
+    """
+    def __init__(self, model_names: List[str], steps: int, arms_nb: int, checkpoint_steps: List[int]):
+        self.steps = steps
+        self.checkpoint_steps = np.array(sorted({step for step in checkpoint_steps if 0 < step < steps} | {steps}))
+        self.total_regrets = {name: 0. for name in model_names}
+        self.cumulative_regrets = {name: np.zeros(len(self.checkpoint_steps)) for name in model_names}
+        self.arm_counts = {name: np.zeros(arms_nb, dtype=np.int64) for name in model_names}
+        self.next_checkpoint = {name: 0 for name in model_names}  # index of the next checkpoint step of every model
+
+    def record(self, model_name: str, step: int, arm: int, regret: float) -> None:
+        self.total_regrets[model_name] += regret
+        self.arm_counts[model_name][arm] += 1
+        checkpoint = self.next_checkpoint[model_name]
+        if checkpoint < len(self.checkpoint_steps) and self.checkpoint_steps[checkpoint] == step + 1:
+            self.cumulative_regrets[model_name][checkpoint] = self.total_regrets[model_name]
+            self.next_checkpoint[model_name] += 1
+
+    def record_many(self, model_name: str, first_step: int, arms: np.array, regrets: np.array) -> None:
+        cumulative_regrets = np.cumsum(np.concatenate([[self.total_regrets[model_name]], regrets]))
+        self.total_regrets[model_name] = cumulative_regrets[-1]
+        self.arm_counts[model_name] += np.bincount(arms, minlength=len(self.arm_counts[model_name]))
+        checkpoint = self.next_checkpoint[model_name]
+        end = np.searchsorted(self.checkpoint_steps, first_step + len(regrets), side="right")
+        self.cumulative_regrets[model_name][checkpoint:end] = \
+            cumulative_regrets[self.checkpoint_steps[checkpoint:end] - first_step]
+        self.next_checkpoint[model_name] = end
+
+    def progress(self, step: int) -> Dict[str, np.array]:
+        """Returns arrays with results of all steps before the given one"""
+        arrays = {f"total_regret_{name}": np.array(total) for name, total in self.total_regrets.items()}
+        arrays.update({f"cumulative_regrets_{name}": regrets for name, regrets in self.cumulative_regrets.items()})
+        arrays.update({f"arm_counts_{name}": counts for name, counts in self.arm_counts.items()})
+        return arrays
+
+    def restore_progress(self, arrays: Dict[str, np.array], step: int) -> None:
+        for name in self.total_regrets.keys():
+            self.total_regrets[name] = float(arrays[f"total_regret_{name}"])
+            self.cumulative_regrets[name][:] = arrays[f"cumulative_regrets_{name}"]
+            self.arm_counts[name][:] = arrays[f"arm_counts_{name}"]
+            self.next_checkpoint[name] = int(np.searchsorted(self.checkpoint_steps, step, side="right"))
+
+    def arrays(self) -> Dict[str, np.array]:
+        arrays = {"checkpoint_steps": self.checkpoint_steps}
+        arrays.update({f"cumulative_regrets_{name}": regrets for name, regrets in self.cumulative_regrets.items()})
+        arrays.update({f"arm_counts_{name}": counts for name, counts in self.arm_counts.items()})
+        return arrays
+
+    def dicts(self) -> Dict[str, Dict]:
+        return {"cumulative_regrets": {name: regrets.tolist() for name, regrets in self.cumulative_regrets.items()},
+                "checkpoint_steps": {"steps": self.checkpoint_steps.tolist()}}
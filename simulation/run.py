@@ -1,65 +1,35 @@
+import itertools
 import os
+import re
 import sys
-from collections import defaultdict
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, List, Optional
 from inspect import getfullargspec
 import argparse
 
-from tqdm import tqdm
-
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
-from models.linear_semi_parametric_sampling import LinearSemiParametricSampling
-from models.beta_priors_sampling import BetaPriorsSampling
-from models.gaussian_priors_sampling import GaussianPriorsSampling
-from models.linear_gaussian_sampling import LinearGaussianSampling
-from simulation.environment import Environment
-from simulation.log_saver import LogSaver
-
-
-def run(steps: int, environment_kwargs: Dict, models: Dict[type, Dict], log_saver: LogSaver) -> defaultdict:
-    env = Environment(**environment_kwargs)
-    log_saver.save_class(env, "environment")
-    models_instances = []
-    for model_class, model_kwargs in models.items():
-        if "X" in model_kwargs.keys():
-            model_kwargs["X"] = env.X
-        model = model_class(**model_kwargs)
-        models_instances.append(model)
-
-    regrets = defaultdict(list)
-    arms = defaultdict(list)
-    for t in tqdm(range(steps)):
-        selected_arms = {}
-        observed_rewards = {}
-        observed_regrets = {}
-        for model in models_instances:
-            arm = model.choose_arm()
-            selected_arms[model] = arm
-            log_saver.save_class_for_step(model, type(model).__name__, t)
-        for arm in set(selected_arms.values()):
-            observed_rewards[arm] = env.get_reward(arm)
-            observed_regrets[arm] = env.get_regret(arm)
-
-        for model in models_instances:
-            arm = selected_arms[model]
-            regret = observed_regrets[arm]
-            model.observe_reward(arm, observed_rewards[arm])
-            regrets[type(model).__name__].append(float(regret))
-            arms[type(model).__name__].append(int(arm))
-
-    log_saver.save_dict(dict(arms), "arms")
-    log_saver.save_dict(dict(regrets), "regrets")
-    return regrets
+from models.registry import BUILTIN_MODELS, get_model_class, get_model_names, is_model_name
+from simulation.storage import get_storage
+
+# models, simulation.runner and simulation.log_saver are imported only when a simulation is run, so that --help and
+# validation of arguments do not import NumPy
+
+HYPERPARAMETERS = ["sigma_1", "sigma_2", "sigma_3", "v"]
+
+
+def model_name(name: str) -> str:
+    if not is_model_name(name):
+        raise argparse.ArgumentTypeError(f"unknown model {name} (choose from {', '.join(get_model_names())})")
+    return name
 
 
 def get_args(args: List[str]) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Run simulation")
     parser.add_argument("--name", type=str, required=True, help="Experiment name")
     parser.add_argument("--steps", type=int, required=True, help="Number of steps")
-    parser.add_argument("--models", type=str, required=True, nargs="+", help="Names of the model classes",
-                        choices=["LinearSemiParametricSampling", "BetaPriorsSampling",
-                                 "GaussianPriorsSampling", "LinearGaussianSampling"])
+    parser.add_argument("--models", type=model_name, required=True, nargs="+",
+                        help="Names of the model classes: built-in " + ", ".join(BUILTIN_MODELS) + " or registered "
+                             "with entry points")
     parser.add_argument("--arms_nb", type=int, required=True, help="Number of arms")
     parser.add_argument("--a", type=float, required=True, help="Norm of linear parameter vector")
     parser.add_argument("--d", type=int, required=True, help="Dimensionality of linear parameter vector")
@@ -67,17 +37,75 @@ def get_args(args: List[str]) -> argparse.Namespace:
                         help="Dimensionality of linear parameter vector")
     parser.add_argument("--seed", type=int, required=True,
                         help="Random seed used in all randomized aspects of a simulation and model")
-    parser.add_argument("--sigma_1", type=float, required=False,
+    parser.add_argument("--replicas", type=int, required=False, default=1,
+                        help="Number of seeds (starting from --seed) simulated at once in one batched run, "
+                             "each saved as a separate experiment")
+    parser.add_argument("--sigma_1", type=float, required=False, nargs="+",
                         help="LSPS hyper-parameter: Standard deviation of reward (r) conditionally on expected reward (gamma)")
-    parser.add_argument("--sigma_2", type=float, required=False,
+    parser.add_argument("--sigma_2", type=float, required=False, nargs="+",
                         help="LSPS hyper-parameter: Standard deviation of expected reward (gamma) conditionally on linear paramter vector (theta)")
-    parser.add_argument("--sigma_3", type=float, required=False,
+    parser.add_argument("--sigma_3", type=float, required=False, nargs="+",
                         help="LSPS hyper-parameter: Standard deviation of linear paramter vector (theta)")
-    parser.add_argument("--v", type=float, required=False, help="Linear Gaussian sampling hyper-parameter")
-    parser.add_argument("--save_every", type=int, required=True, help="Save every specified number of steps")
+    parser.add_argument("--v", type=float, required=False, nargs="+",
+                        help="Linear Gaussian sampling hyper-parameter")
+    parser.add_argument("--sweep", action="store_true",
+                        help="Run all combinations of the given hyper-parameter values (many values can be given for "
+                             "--sigma_1, --sigma_2, --sigma_3 and --v) against one environment, "
+                             "each saved as a separate experiment <name>_<model>_<i>; context features are saved "
+                             "once, in experiment <name>")
+    parser.add_argument("--bound_tail_probability", type=float, required=False,
+                        help="Beta and Gaussian priors sampling: draw first arms whose draws are above their "
+                             "quantiles at 1 - bound_tail_probability, then the rest in decreasing order of the "
+                             "quantiles only while they can exceed the best draw (exact, faster for many arms)")
+    parser.add_argument("--memory_map_X", action="store_true",
+                        help="Generate context features X in chunks into X.npy in the experiment directory and "
+                             "memory-map it, so that X larger than memory can be used")
+    parser.add_argument("--X_dtype", type=str, choices=["float64", "float32"], default="float64",
+                        help="Type of context features X; float32 halves their memory, but changes expected rewards "
+                             "by up to about 4e-8, so runs can differ from runs with float64 X")
+    parser.add_argument("--X_density", type=float, required=False,
+                        help="Generate sparse context features X (SciPy CSC matrix) with this fraction of nonzero "
+                             "features, so that memory and time of operations on X grow with its nonzeros")
+    parser.add_argument("--refresh_every", type=int, required=False,
+                        help="Linear models: recompute posterior parameters from scratch every specified number of "
+                             "observations to limit floating-point drift of incremental updates")
+    parser.add_argument("--mips_clusters_nb", type=int, required=False,
+                        help="Linear models: find the best arm with an index of context features partitioned into "
+                             "this many clusters (e.g. square root of --arms_nb) instead of a scan of all arms")
+    parser.add_argument("--mips_max_clusters", type=int, required=False,
+                        help="Linear models with --mips_clusters_nb: scan at most this many clusters, which is faster, "
+                             "but can miss the best arm")
+    parser.add_argument("--variate_pool_size", type=int, required=False,
+                        help="GaussianPriorsSampling: take normal variates from a pool drawn in blocks of this size "
+                             "(e.g. 65536) instead of drawing them every step; runs differ from runs without pools, "
+                             "but are reproducible with the same seed")
+    parser.add_argument("--save_every", type=int, required=True,
+                        help="Save every specified number of steps (a multiple of --batch_size with delayed feedback)")
+    parser.add_argument("--batch_size", type=int, required=False, default=1,
+                        help="Number of arms chosen by each model before it observes their rewards (delayed feedback)")
+    parser.add_argument("--yaml_output", action="store_true",
+                        help="Save arms and regrets also in YAML files (they are always saved as .npy files)")
+    parser.add_argument("--record", type=str, choices=["full", "checkpoints"], default="full",
+                        help="full: save arm and regret of every step; checkpoints: save only cumulative regrets "
+                             "after checkpoint steps and numbers of pulls of every arm, in memory independent of steps")
+    parser.add_argument("--record_checkpoints", type=int, required=False, nargs="+",
+                        help="Steps after which cumulative regrets are saved with --record checkpoints, "
+                             "by default 100 log-spaced steps (the last step is always included)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue the latest experiment with the given name from its latest saved step")
+    parser.add_argument("--profile", action="store_true",
+                        help="Measure time of choosing arms, observing rewards, drawing rewards and saving states, "
+                             "and peak memory, and save their summary in the profile file")
     parser.add_argument("--gcs_bucket_path", type=str, required=False,
                         help="Google Cloud Storage path to save the results e.g. gs://semi-parametric-sampling-bucket")
-    return parser.parse_args(args)
+    parsed_args = parser.parse_args(args)
+    for name in HYPERPARAMETERS:
+        values = getattr(parsed_args, name)
+        if values is not None and not parsed_args.sweep:
+            if len(values) > 1:
+                parser.error(f"many values of --{name} can be given only with --sweep")
+            setattr(parsed_args, name, values[0])
+    return parsed_args
 
 
 def get_string_from_current_time() -> str:
@@ -88,11 +116,23 @@ def uniquize_experiment_name(name: str) -> str:
     return name + "_" + get_string_from_current_time()
 
 
-def prepare_models(args: argparse.Namespace) -> Dict[(str, Dict)]:
+def find_latest_experiment_name(name: str, directory: str, gcs_directory: Optional[str] = None) -> Optional[str]:
+    """
+    Returns the most recent name created by uniquize_experiment_name for the given name, if any, in the directory
+    or in the storage directory, where runs whose local files are gone (e.g. on a rescheduled pod) are kept
+    """
+    names = os.listdir(directory) if os.path.isdir(directory) else []
+    if gcs_directory:
+        names += get_storage(gcs_directory).list_names()
+    experiment_names = [n for n in names if re.fullmatch(re.escape(name) + r"_\d{8}_\d{12}", n)]
+    return max(experiment_names, default=None)
+
+
+def prepare_models(args: argparse.Namespace, batched: bool = False) -> Dict[(str, Dict)]:
     models = args.models
     models_prepared = {}
     for m in models:
-        model_class = globals()[m]
+        model_class = get_model_class(m, batched)
         model_init_argument_names = getfullargspec(model_class.__init__).args
         model_kwargs = {argument: vars(args).get(argument) for argument in model_init_argument_names if
                         argument != "self"}
@@ -100,19 +140,120 @@ def prepare_models(args: argparse.Namespace) -> Dict[(str, Dict)]:
     return models_prepared
 
 
+def main_batched(args: argparse.Namespace) -> None:
+    from simulation.log_saver import LogSaver
+    from simulation.runner import run_batched
+
+    if args.batch_size > 1:
+        raise ValueError("Runs with many replicas do not support delayed feedback (--batch_size).")
+    seeds = [args.seed + r for r in range(args.replicas)]
+    log_savers = []
+    for seed in seeds:
+        log_saver = LogSaver(uniquize_experiment_name(f"{args.name}_seed_{seed}"), "./logging", args.gcs_bucket_path,
+                             args.save_every, yaml_output=args.yaml_output)
+        replica_args = argparse.Namespace(**{**vars(args), "seed": seed})
+        log_saver.save_dict({"N": args.arms_nb, "a": args.a, "d": args.d,
+                             "reward_distribution": args.reward_distribution, "seed": seed}, "environment_kwargs")
+        [log_saver.save_dict(model_kwargs, f"{model.__name__}_kwargs") for model, model_kwargs in
+         prepare_models(replica_args).items()]
+        log_savers.append(log_saver)
+
+    environment_kwargs = {"N": args.arms_nb, "a": args.a, "d": args.d, "reward_distribution": args.reward_distribution,
+                          "seeds": seeds}
+    models_prepared = prepare_models(argparse.Namespace(**{**vars(args), "seeds": seeds}), batched=True)
+    regrets = run_batched(args.steps, environment_kwargs, models_prepared, log_savers)
+    for log_saver in log_savers:
+        log_saver.sync_with_gcs()
+
+
+def main_sweep(args: argparse.Namespace) -> None:
+    from simulation.log_saver import LogSaver
+    from simulation.runner import run_sweep
+
+    if args.replicas > 1 or args.batch_size > 1:
+        raise ValueError("Sweeps do not support --replicas and --batch_size.")
+    environment_kwargs = {"N": args.arms_nb, "a": args.a, "d": args.d, "reward_distribution": args.reward_distribution,
+                          "seed": args.seed}
+    models_prepared = {}
+    log_savers = {}
+    # the sweep root keeps X shared by all variants
+    root_log_saver = LogSaver(uniquize_experiment_name(args.name), "./logging", args.gcs_bucket_path, args.save_every)
+    root_log_saver.save_dict(environment_kwargs, "environment_kwargs")
+    for m in args.models:
+        model_class = get_model_class(m, batched=True)
+        hyperparameter_names = [name for name in HYPERPARAMETERS if name in getfullargspec(model_class.__init__).args]
+        variants = list(itertools.product(*[getattr(args, name) or [None] for name in hyperparameter_names]))
+        log_savers[model_class] = []
+        for i, variant in enumerate(variants):
+            variant_args = argparse.Namespace(**{**vars(args), "models": [m],
+                                                 **dict(zip(hyperparameter_names, variant))})
+            log_saver = LogSaver(uniquize_experiment_name(f"{args.name}_{m}_{i}"), "./logging", args.gcs_bucket_path,
+                                 args.save_every, yaml_output=args.yaml_output)
+            log_saver.save_dict(environment_kwargs, "environment_kwargs")
+            [log_saver.save_dict(model_kwargs, f"{model.__name__}_kwargs") for model, model_kwargs in
+             prepare_models(variant_args).items()]
+            log_savers[model_class].append(log_saver)
+        sweep_args = argparse.Namespace(**{**vars(args), "models": [m], "seeds": [args.seed] * len(variants),
+                                           **{name: [variant[j] for variant in variants]
+                                              for j, name in enumerate(hyperparameter_names)}})
+        models_prepared.update(prepare_models(sweep_args, batched=True))
+
+    regrets = run_sweep(args.steps, environment_kwargs, models_prepared, log_savers, root_log_saver)
+    for log_saver in itertools.chain([root_log_saver], *log_savers.values()):
+        log_saver.sync_with_gcs()
+
+
 def main(args: argparse.Namespace) -> None:
     args = get_args(args)
-    log_saver = LogSaver(uniquize_experiment_name(args.name), "./logging", args.gcs_bucket_path,
-                         args.save_every)
+    if args.resume and (args.replicas > 1 or args.batch_size > 1 or args.sweep):
+        raise ValueError("Only runs without --replicas, --batch_size and --sweep can be resumed.")
+    if args.profile and (args.replicas > 1 or args.batch_size > 1 or args.sweep):
+        raise ValueError("Only runs without --replicas, --batch_size and --sweep can be profiled.")
+    if (args.memory_map_X or args.X_dtype != "float64") and (args.replicas > 1 or args.sweep):
+        raise ValueError("Runs with --replicas and --sweep support only float64 X kept in memory.")
+    if args.record != "full" and (args.replicas > 1 or args.sweep):
+        raise ValueError("Runs with --replicas and --sweep support only --record full.")
+    if args.mips_clusters_nb and (args.replicas > 1 or args.sweep):
+        raise ValueError("Runs with --replicas and --sweep do not support --mips_clusters_nb.")
+    if args.bound_tail_probability is not None and (args.replicas > 1 or args.sweep):
+        raise ValueError("Runs with --replicas and --sweep do not support --bound_tail_probability.")
+    if args.variate_pool_size and (args.replicas > 1 or args.sweep):
+        raise ValueError("Runs with --replicas and --sweep do not support --variate_pool_size.")
+    if args.X_density is not None and (args.replicas > 1 or args.sweep or args.memory_map_X):
+        raise ValueError("Runs with --replicas, --sweep and --memory_map_X do not support sparse X (--X_density).")
+    if args.batch_size > 1 and args.save_every % args.batch_size != 0:
+        raise ValueError("Runs with delayed feedback save states only between batches, so --save_every must be a "
+                         "multiple of --batch_size.")
+    if args.sweep:
+        return main_sweep(args)
+    if args.replicas > 1:
+        return main_batched(args)
+    from simulation.log_saver import LogSaver
+    from simulation.results import log_spaced_checkpoints
+    from simulation.runner import run, run_with_delayed_feedback
+
+    experiment_name = find_latest_experiment_name(args.name, "./logging", args.gcs_bucket_path) if args.resume else None
+    resume = experiment_name is not None
+    log_saver = LogSaver(experiment_name or uniquize_experiment_name(args.name), "./logging", args.gcs_bucket_path,
+                         args.save_every, resume=resume, yaml_output=args.yaml_output)
 
     environment_kwargs = {"N": args.arms_nb, "a": args.a, "d": args.d, "reward_distribution": args.reward_distribution,
-                          "seed": args.seed}
+                          "seed": args.seed, "X_dtype": args.X_dtype, "X_density": args.X_density,
+                          "X_path": os.path.join(log_saver.path, "X.npy") if args.memory_map_X else None}
 
     models_prepared = prepare_models(args)
     log_saver.save_dict(environment_kwargs, "environment_kwargs")
     [log_saver.save_dict(model_kwargs, f"{model.__name__}_kwargs") for model, model_kwargs in models_prepared.items()]
 
-    regrets = run(args.steps, environment_kwargs, models_prepared, log_saver)
+    record_checkpoints = None
+    if args.record == "checkpoints":
+        record_checkpoints = args.record_checkpoints or log_spaced_checkpoints(args.steps)
+    if args.batch_size > 1:
+        regrets = run_with_delayed_feedback(args.steps, args.batch_size, environment_kwargs, models_prepared, log_saver,
+                                            record_checkpoints)
+    else:
+        regrets = run(args.steps, environment_kwargs, models_prepared, log_saver, resume=resume, profile=args.profile,
+                      record_checkpoints=record_checkpoints)
     log_saver.sync_with_gcs()
 
 
@@ -0,0 +1,240 @@
+import itertools
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import scipy.sparse
+from tqdm import tqdm
+
+from simulation.environment import Environment, BatchedEnvironment
+from simulation.log_saver import LogSaver, restore_state
+from simulation.profiler import DisabledProfiler, Profiler
+from simulation.results import Results, StreamingResults
+
+
+def save_context_features(env: Environment, log_saver: LogSaver) -> None:
+    if env.X_path:
+        # memory-mapped X is already saved in its file
+        log_saver.file_saved(env.X_path)
+    elif scipy.sparse.issparse(env.X):
+        log_saver.save_sparse_matrix(env.X, "X")
+    else:
+        log_saver.save_array(env.X, "X")
+
+
+def create_results(model_names: List[str], steps: int, arms_nb: int,
+                   record_checkpoints: Optional[List[int]]) -> Union[Results, StreamingResults]:
+    if record_checkpoints is None:
+        return Results(model_names, steps)
+    return StreamingResults(model_names, steps, arms_nb, record_checkpoints)
+
+
+def run(steps: int, environment_kwargs: Dict, models: Dict[type, Dict], log_saver: LogSaver,
+        resume: bool = False, profile: bool = False,
+        record_checkpoints: Optional[List[int]] = None) -> Dict[str, np.array]:
+    """
+    Returns regrets of every model in every step. With record_checkpoints, only cumulative regrets after these steps
+    (and the last one) and numbers of pulls of every arm are kept and saved, and the cumulative regrets are returned.
+    With profile, time of every phase of every step (per model) and peak RSS are measured
+    and their summary is saved in the profile file.
+    """
+    profiler = Profiler() if profile else DisabledProfiler()
+    env = Environment(**environment_kwargs)
+    save_context_features(env, log_saver)
+    models_instances = []
+    for model_class, model_kwargs in models.items():
+        if "X" in model_kwargs.keys():
+            model_kwargs["X"] = env.X
+        model = model_class(**model_kwargs)
+        models_instances.append(model)
+
+    model_names = [type(model).__name__ for model in models_instances]
+    results = create_results(model_names, steps, env.N, record_checkpoints)
+    start_step = 0
+    if resume:
+        # checkpoints after steps are skipped, e.g. of later rounds of successive halving restarted from the start
+        resume_step = log_saver.latest_checkpoint_step(["environment"] + model_names, steps)
+        if resume_step is not None:
+            restore_state(env, log_saver.load_state_for_step("environment", resume_step))
+            for model in models_instances:
+                restore_state(model, log_saver.load_state_for_step(type(model).__name__, resume_step))
+            log_saver.load_progress(results, resume_step)
+            start_step = resume_step
+
+    for t in tqdm(range(start_step, steps), initial=start_step, total=steps):
+        selected_arms = {}
+        observed_rewards = {}
+        observed_regrets = {}
+        if t % log_saver.save_every == 0:
+            profiler.sample_memory(t)
+        with profiler.measure("environment", "save_state"):
+            log_saver.save_progress_for_step(results, t)
+            log_saver.save_state_for_step(env, "environment", t)
+        for model in models_instances:
+            with profiler.measure(type(model).__name__, "save_state"):
+                log_saver.save_state_for_step(model, type(model).__name__, t)
+            with profiler.measure(type(model).__name__, "choose_arm"):
+                arm = model.choose_arm()
+            selected_arms[model] = arm
+        with profiler.measure("environment", "get_reward"):
+            for arm in set(selected_arms.values()):
+                observed_rewards[arm] = env.get_reward(arm)
+                observed_regrets[arm] = env.get_regret(arm)
+
+        for model in models_instances:
+            arm = selected_arms[model]
+            regret = observed_regrets[arm]
+            with profiler.measure(type(model).__name__, "observe_reward"):
+                model.observe_reward(arm, observed_rewards[arm])
+            results.record(type(model).__name__, t, arm, regret)
+
+    # saving also the state after the last step (even if it is not a multiple of save_every), so that the run can be
+    # extended to more steps with resume
+    log_saver.save_progress_for_step(results, steps, force=True)
+    log_saver.save_state_for_step(env, "environment", steps, force=True)
+    for model in models_instances:
+        log_saver.save_state_for_step(model, type(model).__name__, steps, force=True)
+    with profiler.measure("environment", "save_results"):
+        log_saver.save_results(results)
+    if profile:
+        log_saver.save_dict(profiler.summary(), "profile")
+    return results.regrets if record_checkpoints is None else results.cumulative_regrets
+
+
+def run_with_delayed_feedback(steps: int, batch_size: int, environment_kwargs: Dict, models: Dict[type, Dict],
+                              log_saver: LogSaver, record_checkpoints: Optional[List[int]] = None
+                              ) -> Dict[str, np.array]:
+    """
+    Runs simulation in which every model chooses batch_size arms from its current posterior
+    and observes rewards for all of them only after the whole batch. Rewards are drawn with get_rewards of the
+    environment. States are saved only between batches, so save_every must be a multiple of batch_size.
+    """
+    if log_saver.save_every % batch_size != 0:
+        raise ValueError(f"Runs with delayed feedback save states only between batches, so --save_every "
+                         f"({log_saver.save_every}) must be a multiple of --batch_size ({batch_size}).")
+    env = Environment(**environment_kwargs)
+    save_context_features(env, log_saver)
+    models_instances = []
+    for model_class, model_kwargs in models.items():
+        if "X" in model_kwargs.keys():
+            model_kwargs["X"] = env.X
+        model = model_class(**model_kwargs)
+        models_instances.append(model)
+
+    results = create_results([type(model).__name__ for model in models_instances], steps, env.N, record_checkpoints)
+    for t in tqdm(range(0, steps, batch_size)):
+        k = min(batch_size, steps - t)
+        selected_arms = {}
+        log_saver.save_state_for_step(env, "environment", t)
+        for model in models_instances:
+            log_saver.save_state_for_step(model, type(model).__name__, t)
+            selected_arms[model] = model.choose_arms(k)
+        # models which choose the same arm in the same step of the batch observe the same reward; rewards of the
+        # whole batch are drawn at once from the reward streams of arms
+        pulls = [(j, arm) for j in range(k) for arm in sorted(set(int(arms[j]) for arms in selected_arms.values()))]
+        rewards = env.get_rewards(np.array([arm for _, arm in pulls], dtype=np.int64))
+        observed_rewards = [{} for _ in range(k)]
+        for (j, arm), reward in zip(pulls, rewards):
+            observed_rewards[j][arm] = reward
+
+        for model in models_instances:
+            model_arms = selected_arms[model]
+            model.observe_rewards(model_arms, np.array([observed_rewards[j][arm] for j, arm in enumerate(model_arms)]))
+            results.record_many(type(model).__name__, t, model_arms, env.get_regrets(model_arms))
+
+    log_saver.save_state_for_step(env, "environment", steps)
+    for model in models_instances:
+        log_saver.save_state_for_step(model, type(model).__name__, steps)
+    log_saver.save_results(results)
+    return results.regrets if record_checkpoints is None else results.cumulative_regrets
+
+
+def run_batched(steps: int, environment_kwargs: Dict, models: Dict[type, Dict],
+                log_savers: List[LogSaver]) -> List[Dict[str, np.array]]:
+    """
+    Runs simulation for many seeds (replicas) at once, one log saver per replica.
+    Results of each replica are the same as results of run() with its seed.
+    """
+    env = BatchedEnvironment(**environment_kwargs)
+    for r, log_saver in enumerate(log_savers):
+        log_saver.save_array(env.X[r], "X")
+    models_instances = []
+    for model_class, model_kwargs in models.items():
+        if "X" in model_kwargs.keys():
+            model_kwargs["X"] = env.X
+        model = model_class(**model_kwargs)
+        models_instances.append(model)
+
+    results = [Results([model.replica_class.__name__ for model in models_instances], steps) for _ in log_savers]
+    for t in tqdm(range(steps)):
+        selected_arms = {}
+        for r, log_saver in enumerate(log_savers):
+            log_saver.save_state_for_step(env.environments[r], "environment", t)
+        for model in models_instances:
+            for r, log_saver in enumerate(log_savers):
+                if t % log_saver.save_every == 0:
+                    log_saver.save_state_for_step(model.replica(r), model.replica_class.__name__, t)
+            selected_arms[model] = model.choose_arm()
+        # rewards are drawn in the same order as in run() to keep random streams of replicas identical
+        observed_rewards = []
+        for r, environment in enumerate(env.environments):
+            observed_rewards.append({arm: environment.get_reward(arm)
+                                     for arm in set(int(arms_[r]) for arms_ in selected_arms.values())})
+
+        for model in models_instances:
+            arm = selected_arms[model]
+            regret = env.get_regret(arm)
+            model.observe_reward(arm, np.array([observed_rewards[r][a] for r, a in enumerate(arm)]))
+            for r in range(env.R):
+                results[r].record(model.replica_class.__name__, t, arm[r], regret[r])
+
+    for r, log_saver in enumerate(log_savers):
+        log_saver.save_results(results[r])
+    return [results_.regrets for results_ in results]
+
+
+def run_sweep(steps: int, environment_kwargs: Dict, models: Dict[type, Dict],
+              log_savers: Dict[type, List[LogSaver]],
+              root_log_saver: Optional[LogSaver] = None) -> Dict[type, List[Dict[str, np.array]]]:
+    """
+    Runs many hyper-parameter variants of every batched model against one environment, one log saver per variant.
+    Variants share X, which is passed to the models as a read-only broadcast view, and observe the same reward
+    when they choose the same arm in the same step, as models in run() do. X is saved once, by root_log_saver
+    (by default the log saver of the first variant), and checkpoints of the other variants refer to it.
+    """
+    env = Environment(**environment_kwargs)
+    root_log_saver = root_log_saver or next(itertools.chain(*log_savers.values()))
+    root_log_saver.save_array(env.X, "X")
+    for log_saver in itertools.chain(*log_savers.values()):
+        if log_saver is not root_log_saver:
+            log_saver.refer_to_X(root_log_saver)
+    models_instances = []
+    for model_class, model_kwargs in models.items():
+        if "X" in model_kwargs.keys():
+            model_kwargs["X"] = np.broadcast_to(env.X, (len(model_kwargs["seeds"]),) + env.X.shape)
+        model = model_class(**model_kwargs)
+        models_instances.append(model)
+
+    results = {model: [Results([model.replica_class.__name__], steps) for _ in log_savers[type(model)]]
+               for model in models_instances}
+    for t in tqdm(range(steps)):
+        selected_arms = {}
+        for log_saver in itertools.chain(*log_savers.values()):
+            log_saver.save_state_for_step(env, "environment", t)
+        for model in models_instances:
+            for r, log_saver in enumerate(log_savers[type(model)]):
+                if t % log_saver.save_every == 0:
+                    log_saver.save_state_for_step(model.replica(r), model.replica_class.__name__, t)
+            selected_arms[model] = model.choose_arm()
+        observed_rewards = {arm: env.get_reward(arm)
+                            for arm in set(int(arm) for arms in selected_arms.values() for arm in arms)}
+
+        for model in models_instances:
+            arms = selected_arms[model]
+            model.observe_reward(arms, np.array([observed_rewards[arm] for arm in arms]))
+            for r, arm in enumerate(arms):
+                results[model][r].record(model.replica_class.__name__, t, arm, env.get_regret(arm))
+
+    for model in models_instances:
+        for log_saver, model_results in zip(log_savers[type(model)], results[model]):
+            log_saver.save_results(model_results)
+    return {type(model): [model_results.regrets for model_results in results[model]] for model in models_instances}
@@ -0,0 +1,106 @@
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+from typing import List, Optional, Tuple
+
+
+class GCSStorage:
+    """Google Cloud Storage directory, files are uploaded with gsutil"""
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def upload(self, local_path: str, relative_path: str) -> None:
+        subprocess.run(["gsutil", "-q", "cp", local_path, self.directory + "/" + relative_path], check=True)
+
+    def download(self, relative_path: str, local_path: str) -> None:
+        subprocess.run(["gsutil", "-q", "cp", self.directory + "/" + relative_path, local_path], check=True)
+
+    def list_names(self) -> List[str]:
+        """Returns names of files and subdirectories in the directory, no names if it does not exist"""
+        process = subprocess.run(["gsutil", "ls", self.directory + "/"], capture_output=True, text=True)
+        if process.returncode != 0:
+            return []
+        return [path.rstrip("/").rsplit("/", 1)[-1] for path in process.stdout.split()]
+
+
+class DirectoryStorage:
+    """Local directory standing in for an object store, e.g. in tests or when running without the cloud"""
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def upload(self, local_path: str, relative_path: str) -> None:
+        path = os.path.join(self.directory, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # copying to a temporary file first, so that a file in the storage is always complete
+        shutil.copyfile(local_path, path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def download(self, relative_path: str, local_path: str) -> None:
+        shutil.copyfile(os.path.join(self.directory, relative_path), local_path)
+
+    def list_names(self) -> List[str]:
+        """Returns names of files and subdirectories in the directory, no names if it does not exist"""
+        if not os.path.isdir(self.directory):
+            return []
+        return [name for name in os.listdir(self.directory) if not name.endswith(".tmp")]
+
+
+def get_storage(directory: str):
+    if directory.startswith("gs://"):
+        return GCSStorage(directory)
+    return DirectoryStorage(directory)
+
+
+class BackgroundUploader:
+    """
+    Uploads files to the storage in a background thread and deletes their local copies after the upload succeeds.
+    Queue of files waiting for the upload is bounded, so submit blocks if uploading can't keep up with writing.
+    Failed uploads are retried with exponential backoff; files which still failed are kept locally and reported
+    by close.
+    """
+    def __init__(self, storage, queue_size: int = 16, retries: int = 3, retry_delay: float = 1) -> None:
+        self.storage = storage
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.failed_uploads: List[Tuple[str, Exception]] = []
+        self.thread = threading.Thread(target=self._upload_files, daemon=True)
+        self.thread.start()
+
+    def submit(self, local_path: str, relative_path: str) -> None:
+        self.queue.put((local_path, relative_path))
+
+    def _upload_files(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            local_path, relative_path = item
+            error = self._upload(local_path, relative_path)
+            if error is None:
+                os.remove(local_path)
+            else:
+                self.failed_uploads.append((local_path, error))
+            self.queue.task_done()
+
+    def _upload(self, local_path: str, relative_path: str) -> Optional[Exception]:
+        for attempt in range(self.retries + 1):
+            try:
+                self.storage.upload(local_path, relative_path)
+                return None
+            except Exception as error:
+                if attempt == self.retries:
+                    return error
+                time.sleep(self.retry_delay * 2 ** attempt)
+
+    def close(self) -> None:
+        """Waits until all submitted files are uploaded"""
+        self.queue.put(None)
+        self.thread.join()
+        if self.failed_uploads:
+            paths = ", ".join(path for path, _ in self.failed_uploads)
+            raise RuntimeError(f"Uploading failed for: {paths}") from self.failed_uploads[0][1]
@@ -0,0 +1,103 @@
+import numpy as np
+
+from analysis.results_store import load_store, refresh_store
+from models.gaussian_priors_sampling import GaussianPriorsSampling
+from models.linear_gaussian_sampling import LinearGaussianSampling
+from simulation.log_saver import LogSaver
+from simulation.runner import run
+
+
+def run_experiment(directory: str, run_name: str, seed: int, yaml_output: bool = False,
+                   record_checkpoints: list = None) -> dict:
+    log_saver = LogSaver(run_name, directory, None, save_every=100, yaml_output=yaml_output)
+    environment_kwargs = {"N": 10, "a": 0.5, "d": 3, "reward_distribution": "normal", "seed": seed}
+    models = {GaussianPriorsSampling: {"arms_nb": 10, "seed": seed},
+              LinearGaussianSampling: {"arms_nb": 10, "d": 3, "X": None, "v": 1, "seed": seed, "refresh_every": None}}
+    log_saver.save_dict(environment_kwargs, "environment_kwargs")
+    [log_saver.save_dict(model_kwargs, f"{model.__name__}_kwargs") for model, model_kwargs in models.items()]
+    return run(50, environment_kwargs, models, log_saver, record_checkpoints=record_checkpoints)
+
+
+def test_refresh_store(tmp_path):
+    # given
+    runs_directory, store_directory = str(tmp_path / "runs"), str(tmp_path / "store")
+    regrets = {"run_1": run_experiment(runs_directory, "run_1", seed=1),
+               "run_2": run_experiment(runs_directory, "run_2", seed=2, yaml_output=True)}
+
+    # when
+    refresh_store(runs_directory, store_directory, processes=2)
+    regrets["run_3"] = run_experiment(runs_directory, "run_3", seed=3)
+    refreshed_store = refresh_store(runs_directory, store_directory, processes=2)
+    store = load_store(store_directory)
+
+    # then
+    assert len(refreshed_store) == len(store) == 6
+    for _, row in store.iterrows():
+        model_regrets = regrets[row.run_name][row.model_name]
+        assert np.array_equal(row.cumulative_regret, np.cumsum(model_regrets))
+        assert row.total_regret == sum(model_regrets.tolist())
+        assert row.seed == int(row.run_name[-1])
+    assert np.isnan(store.query("model_name == 'GaussianPriorsSampling'").v).all()
+
+
+def test_refresh_store_with_runs_with_record_checkpoints(tmp_path):
+    # given
+    runs_directory, store_directory = str(tmp_path / "runs"), str(tmp_path / "store")
+    regrets = run_experiment(runs_directory, "full", seed=1)
+    cumulative_regrets = run_experiment(runs_directory, "checkpoints", seed=1, record_checkpoints=[5, 20])
+
+    # when
+    store = refresh_store(runs_directory, store_directory, processes=2)
+
+    # then
+    for _, row in store.iterrows():
+        if row.run_name == "full":
+            assert np.array_equal(row.cumulative_regret_steps, np.arange(1, 51))
+            assert np.array_equal(row.cumulative_regret, np.cumsum(regrets[row.model_name]))
+        else:
+            assert np.array_equal(row.cumulative_regret_steps, [5, 20, 50])
+            assert np.array_equal(row.cumulative_regret, cumulative_regrets[row.model_name])
+    assert store.groupby("model_name").total_regret.nunique().eq(1).all()
+
+
+def test_refresh_store_does_not_rewrite_curves_of_stored_runs(tmp_path):
+    # given
+    runs_directory, store_directory = tmp_path / "runs", tmp_path / "store"
+    run_experiment(str(runs_directory), "run_1", seed=1)
+    store = refresh_store(str(runs_directory), str(store_directory), processes=2)
+    curves_bytes = (store_directory / "cumulative_regrets_0.npy").read_bytes()
+    stored_curves = [curve.copy() for curve in store.cumulative_regret]
+    run_experiment(str(runs_directory), "run_2", seed=2)
+
+    # when
+    refreshed_store = refresh_store(str(runs_directory), str(store_directory), processes=2)
+
+    # then
+    assert (store_directory / "cumulative_regrets_0.npy").read_bytes() == curves_bytes
+    assert refreshed_store.curve_part.tolist() == [0, 0, 1, 1]
+    for curve, stored_curve in zip(store.cumulative_regret, stored_curves):
+        assert np.array_equal(curve, stored_curve)
+    assert not list(store_directory.glob("*.tmp"))
+
+
+def test_load_store_created_before_curves_were_saved_in_parts(tmp_path):
+    import pandas as pd
+
+    # given
+    runs_directory, store_directory = tmp_path / "runs", tmp_path / "store"
+    regrets = run_experiment(str(runs_directory), "run_1", seed=1)
+    refresh_store(str(runs_directory), str(store_directory), processes=2)
+    (store_directory / "cumulative_regrets_0.npy").rename(store_directory / "cumulative_regrets.npy")
+    (store_directory / "cumulative_regrets_steps_0.npy").unlink()
+    table = pd.read_csv(store_directory / "runs.csv")
+    table.drop(columns=["curve_part"]).to_csv(store_directory / "runs.csv", index=False)
+    run_experiment(str(runs_directory), "run_2", seed=2)
+
+    # when
+    store = refresh_store(str(runs_directory), str(store_directory), processes=2)
+
+    # then
+    assert store.curve_part.tolist() == [-1, -1, 0, 0]
+    for _, row in store[store.run_name == "run_1"].iterrows():
+        assert np.array_equal(row.cumulative_regret, np.cumsum(regrets[row.model_name]))
+        assert np.array_equal(row.cumulative_regret_steps, np.arange(1, 51))
@@ -0,0 +1,54 @@
+import json
+
+from benchmarks.models_benchmark import compare_results, main
+
+
+def test_run_saves_results_for_all_models(tmp_path):
+    # given
+    output_path = str(tmp_path / "results.json")
+
+    # when
+    main(["run", "--output_path", output_path, "--arms_nb", "10", "100", "--d", "5", "--min_time", "0.01"])
+
+    # then
+    with open(output_path) as f:
+        results = json.load(f)["results"]
+    assert len(results) == 8
+    assert all(result["choose_arm_ops_per_sec"] > 0 and result["observe_reward_ops_per_sec"] > 0
+               for result in results)
+    assert main(["compare", output_path, output_path]) == 0
+
+
+def test_compare_results():
+    # given
+    baseline = [{"model": "BetaPriorsSampling", "arms_nb": 10, "d": None, "choose_arm_ops_per_sec": 100,
+                 "observe_reward_ops_per_sec": 100, "peak_memory_bytes": 1000}]
+    results = [{**baseline[0], "choose_arm_ops_per_sec": 95, "observe_reward_ops_per_sec": 50,
+                "peak_memory_bytes": 2000},
+               {**baseline[0], "arms_nb": 100}]
+
+    # when
+    regressions = compare_results(baseline, results, threshold=0.1)
+
+    # then
+    assert len(regressions) == 2
+    assert "observe_reward" in regressions[0]
+    assert "peak memory" in regressions[1]
+
+
+def test_serving_load_test():
+    from benchmarks.serving_load_test import main as load_test_main
+
+    report = load_test_main(["--model", "LinearGaussianSampling", "--arms_nb", "50", "--d", "5", "--clients", "4",
+                             "--requests", "200", "--pool_size", "8"])
+    assert report["requests_nb"] == 200
+    assert report["requests_per_sec"] > 0
+    assert report["p50_latency_ms"] <= report["p99_latency_ms"]
+
+
+def test_mips_benchmark():
+    from benchmarks.mips_benchmark import main as mips_benchmark_main
+
+    results = mips_benchmark_main(["--arms_nb", "200", "--d", "3", "--steps", "20", "--max_clusters", "1"])
+    assert [result["search"] for result in results] == ["scan", "exact", "max_clusters=1"] * 2
+    assert results[1]["same_arms_fraction"] == 1 and results[1]["regret_difference"] == 0
@@ -0,0 +1,32 @@
+import os
+
+from analysis.results_store import is_finished
+from kubernetes.run_jobs_locally import main
+
+JOB_SPECS_INPUT = """
+args = ["--steps", "50", "--save_every", "10", "--arms_nb", "10", "--d", "3", "--gcs_bucket_path", "gs://bucket"]
+hp_tuning_parameters = {"LinearGaussianSampling": {"--v": ["0.1", "1"]}}
+environment_dependent_parameters = {}
+models_for_environment = {"normal": ["LinearGaussianSampling"]}
+reward_distributions = ["normal"]
+seeds = [1]
+a_values = ["0.5"]
+name_format_string = "local_job_{i}"
+"""
+
+
+def test_main_runs_jobs_and_skips_finished_ones(tmp_path, monkeypatch, capsys):
+    # given
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "specs.py").write_text(JOB_SPECS_INPUT)
+    args = ["--job_specs_input_path", "specs.py", "--processes", "2"]
+
+    # when
+    main(args)
+    main(args)
+
+    # then
+    runs = sorted(os.listdir(tmp_path / "logging"))
+    assert [run[:len("local_job_0")] for run in runs] == ["local_job_0", "local_job_1"]
+    assert all(is_finished(str(tmp_path / "logging" / run)) for run in runs)
+    assert "Running 0 jobs in 2 processes, skipped 2 already done" in capsys.readouterr().out
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import yaml
+
+from kubernetes.successive_halving import get_budgets, get_configuration, main
+from simulation.run import find_latest_experiment_name, main as run_simulation
+
+JOB_SPECS_INPUT = """
+args = ["--steps", "80", "--save_every", "20", "--arms_nb", "10", "--d", "3", "--gcs_bucket_path", "gs://bucket"]
+hp_tuning_parameters = {"LinearGaussianSampling": {"--v": ["0.01", "0.1", "1", "10"]}, "GaussianPriorsSampling": {}}
+environment_dependent_parameters = {}
+models_for_environment = {"normal": ["LinearGaussianSampling", "GaussianPriorsSampling"]}
+reward_distributions = ["normal"]
+seeds = ["1", "2"]
+a_values = ["0.5"]
+name_format_string = "halving_job_{i}"
+"""
+
+
+def load_regrets(name: str, model_name: str) -> np.array:
+    path = os.path.join("logging", find_latest_experiment_name(name, "logging"), f"regrets_{model_name}.npy")
+    return np.load(path)
+
+
+def test_get_budgets():
+    assert get_budgets(100, 25000, 3) == [100, 300, 900, 2700, 8100, 24300, 25000]
+    assert get_budgets(100, 900, 3) == [100, 300, 900]
+
+
+def test_get_configuration():
+    args = ["--steps", "80", "--reward_distribution", "normal", "--seed", "1", "--a", "0.5",
+            "--models", "LinearGaussianSampling", "--v", "0.1"]
+    assert get_configuration(args) == (("normal", "0.5", ("LinearGaussianSampling",)), "--v 0.1")
+
+
+def test_main_keeps_best_configurations(tmp_path, monkeypatch):
+    # given
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "specs.py").write_text(JOB_SPECS_INPUT)
+
+    # when
+    results = main(["--job_specs_input_path", "specs.py", "--min_steps", "20", "--reduction_factor", "2",
+                    "--processes", "2"])
+
+    # then
+    lgs_results = results[("normal", "0.5", ("LinearGaussianSampling",))]
+    assert [result["steps"] for result in lgs_results] == [80, 40, 20, 20]
+    assert lgs_results[2]["mean_total_regret"] <= lgs_results[3]["mean_total_regret"]
+    assert results[("normal", "0.5", ("GaussianPriorsSampling",))][0]["steps"] == 80
+    with open(tmp_path / "successive_halving_results") as f:
+        assert len(yaml.safe_load(f)) == 5
+    # job names follow the order of generate_possible_arguments: LinearGaussianSampling v values for seed 1 first
+    best_v = lgs_results[0]["parameters"].split(" ")[1]
+    best_job_name = f"halving_job_{['0.01', '0.1', '1', '10'].index(best_v)}"
+    assert len(load_regrets(best_job_name, "LinearGaussianSampling")) == 80
+    run_simulation(["--name", "uninterrupted", "--steps", "80", "--save_every", "20", "--arms_nb", "10", "--d", "3",
+                    "--reward_distribution", "normal", "--seed", "1", "--a", "0.5", "--models",
+                    "LinearGaussianSampling", "--v", best_v])
+    assert np.array_equal(load_regrets(best_job_name, "LinearGaussianSampling"),
+                          load_regrets("uninterrupted", "LinearGaussianSampling"))
+
+
+def test_main_restarted_with_the_same_arguments_gives_the_same_results(tmp_path, monkeypatch):
+    # given
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "specs.py").write_text(JOB_SPECS_INPUT)
+    args = ["--job_specs_input_path", "specs.py", "--min_steps", "20", "--reduction_factor", "2", "--processes", "2"]
+    results = main(args)
+
+    # when
+    # the first rounds resume from checkpoints of their budgets, not from the later ones left by the survivors
+    restarted_results = main(args)
+
+    # then
+    assert restarted_results == results
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+from scipy.special import ndtri
+from scipy.stats import chi2
+
+from models.bound_pruning import BoundPrunedSampler
+
+
+def normal_quantile(mean: np.array, std: np.array):
+    def quantile(arms: np.array, u: np.array) -> np.array:
+        return mean[arms] + std[arms] * ndtri(u)
+    return quantile
+
+
+@pytest.mark.parametrize("tail_probability", [0.001, 0.1])
+def test_sample_best_arm_has_distribution_of_argmax_of_all_draws(tail_probability):
+    # given
+    generator = np.random.default_rng(0)
+    mean = np.concatenate([np.zeros(10), generator.normal(size=20) * 0.3])
+    std = np.concatenate([np.ones(10), generator.uniform(0.1, 0.5, size=20)])
+    sampler = BoundPrunedSampler(30, normal_quantile(mean, std), tail_probability)
+    sampler.reset(np.arange(10, 30))
+    draws_nb = 20000
+
+    # when
+    pruned_counts = np.bincount([sampler.sample_best_arm(generator) for _ in range(draws_nb)], minlength=30)
+    full_counts = np.bincount(np.argmax(generator.normal(mean, std, size=(draws_nb, 30)), axis=1), minlength=30)
+
+    # then
+    observed = (pruned_counts + full_counts) > 0
+    statistic = np.sum((pruned_counts - full_counts)[observed] ** 2 / (pruned_counts + full_counts)[observed])
+    assert chi2.sf(statistic, np.sum(observed) - 1) > 0.001
+
+
+def test_sample_best_arm_draws_only_arms_which_can_win():
+    # given
+    drawn_arms = []
+    mean, std = np.concatenate([[10.], np.zeros(9999)]), np.full(10000, 0.1)
+    quantile = normal_quantile(mean, std)
+
+    def counting_quantile(arms: np.array, u: np.array) -> np.array:
+        drawn_arms.extend(arms)
+        return quantile(arms, u)
+
+    sampler = BoundPrunedSampler(10000, counting_quantile, 1e-6)
+    sampler.reset(np.arange(10000))
+    drawn_arms.clear()
+
+    # when
+    best_arms = [sampler.sample_best_arm(np.random.default_rng(seed)) for seed in range(10)]
+
+    # then
+    assert best_arms == [0] * 10
+    assert len(drawn_arms) < 10 * 100
+
+
+def test_arms_changed_updates_bounds():
+    # given
+    generator = np.random.default_rng(0)
+    mean, std = np.zeros(1000), np.full(1000, 0.1)
+    sampler = BoundPrunedSampler(1000, normal_quantile(mean, std), 1e-6)
+    sampler.reset(np.arange(1000))
+
+    # when
+    for arm in range(100):
+        mean[arm] = 10 + arm
+        sampler.arms_changed([arm])
+        # then
+        assert sampler.sample_best_arm(generator) == arm
+
+
+def test_arms_changed_keeps_the_same_order_as_reset():
+    # given
+    generator = np.random.default_rng(0)
+    mean, std = np.zeros(200), np.full(200, 0.1)
+    sampler = BoundPrunedSampler(200, normal_quantile(mean, std), 0.01)
+    reset_sampler = BoundPrunedSampler(200, normal_quantile(mean, std), 0.01)
+
+    # when
+    for _ in range(500):
+        arms = generator.integers(200, size=generator.integers(1, 4))
+        # rounded means give arms with equal bounds, which are ordered by their numbers
+        mean[arms] = np.round(generator.normal(size=len(arms)), 1)
+        sampler.arms_changed(np.unique(arms))
+        reset_sampler.reset(np.flatnonzero(sampler.observed))
+
+        # then
+        assert np.array_equal(sampler.indexed_arms, reset_sampler.indexed_arms)
+        assert np.array_equal(sampler.negative_sorted_bounds, reset_sampler.negative_sorted_bounds)
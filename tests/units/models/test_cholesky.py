@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from models.cholesky import cholesky_rank_one_update, cholesky_solve, sample_from_precision_factor
+
+
+@pytest.fixture
+def precision():
+    generator = np.random.default_rng(1)
+    M = generator.normal(size=(4, 4))
+    return M @ M.T + np.identity(4)
+
+
+@pytest.mark.parametrize("sign", [1, -1])
+def test_cholesky_rank_one_update(precision, sign):
+    # given
+    x = np.array([[0.3], [-0.2], [0.5], [0.1]])
+    L = np.linalg.cholesky(precision)
+
+    # when
+    cholesky_rank_one_update(L, x, sign)
+
+    # then
+    assert np.allclose(L, np.linalg.cholesky(precision + sign * x @ x.T))
+
+
+def test_cholesky_rank_one_update_not_positive_definite():
+    # given
+    L = np.identity(2)
+
+    # then
+    with pytest.raises(np.linalg.LinAlgError):
+        cholesky_rank_one_update(L, np.array([2, 0]), -1)
+
+
+def test_cholesky_solve(precision):
+    # given
+    b = np.array([[1], [2], [3], [4]])
+
+    # when
+    result = cholesky_solve(np.linalg.cholesky(precision), b)
+
+    # then
+    assert np.allclose(precision @ result, b)
+
+
+def test_sample_from_precision_factor(precision):
+    # given
+    generator = np.random.default_rng(1)
+    mean = np.array([[1], [0], [-1], [2]])
+    L = np.linalg.cholesky(precision)
+
+    # when
+    samples = np.hstack([sample_from_precision_factor(generator, mean, L, scale=2) for _ in range(10000)])
+
+    # then
+    assert np.allclose(samples.mean(axis=1, keepdims=True), mean, atol=0.1, rtol=0)
+    assert np.allclose(np.cov(samples), 4 * np.linalg.inv(precision), atol=0.1, rtol=0)
+
+
+def test_cholesky_rank_one_update_for_stacked_factors(precision):
+    # given
+    x = np.array([[0.3, -0.2, 0.5, 0.1], [1, 0, -1, 2]])
+    sign = np.array([-1, 1])
+    L = np.stack([np.linalg.cholesky(precision)] * 2)
+    expected_L = L.copy()
+
+    # when
+    cholesky_rank_one_update(L, x, sign)
+    for r in range(2):
+        cholesky_rank_one_update(expected_L[r], x[r], sign[r])
+
+    # then
+    assert np.array_equal(L, expected_L)
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+import scipy.sparse
+
+import models.context_features
+from models.context_features import dense_columns, left_multiply, max_column_norm, right_multiply, weighted_gram
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_chunked_operations_match_direct_ones(monkeypatch, dtype):
+    # given
+    generator = np.random.default_rng(0)
+    X = generator.uniform(size=(5, 1001)).astype(dtype)
+    X_64 = X.astype(np.float64)
+    A, weights, v = generator.normal(size=(3, 5)), generator.uniform(size=1001), generator.normal(size=(1001, 1))
+    monkeypatch.setattr(models.context_features, "CHUNK_ELEMENTS", 100)
+
+    # when
+    results = [left_multiply(A, X), weighted_gram(X, weights), right_multiply(X, v), max_column_norm(X)]
+
+    # then
+    expected_results = [A @ X_64, (X_64 * weights) @ X_64.T, X_64 @ v, np.linalg.norm(X_64, axis=0).max()]
+    for result, expected_result in zip(results, expected_results):
+        assert np.asarray(result).dtype == np.float64
+        assert np.allclose(result, expected_result, atol=1e-12, rtol=0)
+
+
+def test_linear_models_with_memory_mapped_float32_context_features(tmp_path, monkeypatch):
+    from models.linear_gaussian_sampling import LinearGaussianSampling
+    from models.linear_semi_parametric_sampling import LinearSemiParametricSampling
+
+    # given
+    X = np.random.default_rng(0).uniform(size=(5, 1000))
+    X_32 = np.lib.format.open_memmap(str(tmp_path / "X.npy"), mode="w+", dtype=np.float32, shape=X.shape)
+    X_32[:] = X
+    monkeypatch.setattr(models.context_features, "CHUNK_ELEMENTS", 700)
+
+    for model_class, kwargs in [(LinearGaussianSampling, {"v": 1}),
+                                (LinearSemiParametricSampling, {"sigma_1": 1, "sigma_2": 1, "sigma_3": 1})]:
+        model = model_class(1000, 5, X_32, seed=1, refresh_every=7, **kwargs)
+        reference_model = model_class(1000, 5, X_32.astype(np.float64), seed=1, refresh_every=7, **kwargs)
+
+        # when
+        for t in range(20):
+            arm = model.choose_arm()
+            model.observe_reward(arm, 1)
+            reference_model.choose_arm()
+            reference_model.observe_reward(arm, 1)
+
+        # then
+        assert np.allclose(model.L, reference_model.L)
+        assert model.choose_arms(3).shape == (3,)
+
+
+def test_operations_on_sparse_context_features_match_dense_ones():
+    # given
+    generator = np.random.default_rng(0)
+    X = scipy.sparse.random(5, 300, density=0.2, format="csc", random_state=generator)
+    X_dense = X.toarray()
+    A, weights, v = generator.normal(size=(3, 5)), generator.uniform(size=300), generator.normal(size=(300, 1))
+
+    # when
+    results = [left_multiply(A, X), left_multiply(A[0], X), weighted_gram(X, weights), right_multiply(X, v),
+               max_column_norm(X), dense_columns(X, [7, 3])]
+
+    # then
+    expected_results = [A @ X_dense, A[0] @ X_dense, (X_dense * weights) @ X_dense.T, X_dense @ v,
+                        np.linalg.norm(X_dense, axis=0).max(), X_dense[:, [7, 3]]]
+    for result, expected_result in zip(results, expected_results):
+        assert isinstance(result, (np.ndarray, float))
+        assert np.allclose(result, expected_result, atol=1e-12, rtol=0)
+
+
+@pytest.mark.parametrize("mips_clusters_nb", [None, 10])
+def test_linear_models_with_sparse_context_features_choose_the_same_arms_as_with_dense_ones(mips_clusters_nb):
+    from models.linear_gaussian_sampling import LinearGaussianSampling
+    from models.linear_semi_parametric_sampling import LinearSemiParametricSampling
+
+    # given
+    X = scipy.sparse.random(20, 200, density=0.1, format="csc", random_state=np.random.default_rng(0))
+
+    for model_class, kwargs in [(LinearGaussianSampling, {"v": 1}),
+                                (LinearSemiParametricSampling, {"sigma_1": 1, "sigma_2": 0.1, "sigma_3": 1})]:
+        model = model_class(200, 20, X, seed=1, refresh_every=7, mips_clusters_nb=mips_clusters_nb, **kwargs)
+        reference_model = model_class(200, 20, X.toarray(), seed=1, refresh_every=7,
+                                      mips_clusters_nb=mips_clusters_nb, **kwargs)
+
+        # when
+        arms, reference_arms = [], []
+        for t in range(30):
+            arms.append(model.choose_arm())
+            reference_arms.append(reference_model.choose_arm())
+            model.observe_reward(arms[-1], 1)
+            reference_model.observe_reward(arms[-1], 1)
+        chosen_arms = model.choose_arms(4)
+        model.observe_rewards(chosen_arms, np.ones(4))
+        reference_model.observe_rewards(chosen_arms, np.ones(4))
+
+        # then
+        assert arms == reference_arms
+        assert np.allclose(model.L, reference_model.L)
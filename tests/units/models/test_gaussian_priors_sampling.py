@@ -67,3 +67,22 @@ def test_sample_theta(setup):
     # then
     assert np.allclose(observed_theta_mean, setup.attributes['theta_mean'], atol=0.1, rtol=0)
     assert np.allclose(observed_var, setup.attributes['theta_var'], atol=0.1, rtol=0)
+
+
+def test_observe_rewards(setup):
+    from models.gaussian_priors_sampling import GaussianPriorsSampling
+
+    # given
+    model = setup.model
+    sequential_model = GaussianPriorsSampling(arms_nb=2, seed=1)
+    arms, rewards = np.array([0, 1, 0, 0]), np.array([1.5, -2, 0.5, 3])
+
+    # when
+    model.observe_rewards(arms, rewards)
+    for arm, reward in zip(arms, rewards):
+        sequential_model.observe_reward(arm, reward)
+
+    # then
+    assert np.allclose(model.k, sequential_model.k)
+    assert np.allclose(model.mi, sequential_model.mi)
+    assert model.choose_arms(5).shape == (5,)
@@ -106,3 +106,91 @@ def test_update_exp_reward(setup):
     assert np.allclose(observed_exp_rewards_cov, setup.attributes['observed_exp_rewards_cov'], atol=0.1, rtol=0)
 
 
+@pytest.mark.parametrize("refresh_every", [None, 7])
+def test_cholesky_factor_matches_refactorization(refresh_every):
+    from models.linear_gaussian_sampling import LinearGaussianSampling
+
+    # given
+    generator = np.random.default_rng(0)
+    X = generator.uniform(size=(5, 20))
+    model = LinearGaussianSampling(arms_nb=20, d=5, X=X, v=1, seed=1, refresh_every=refresh_every)
+
+    # when
+    for t in range(500):
+        model.observe_reward(i=generator.integers(20), r=generator.normal())
+
+    # then
+    assert np.allclose(model.L, np.linalg.cholesky(model.B), atol=1e-8, rtol=1e-8)
+    assert np.allclose(model.mi_dashed, np.linalg.inv(model.B) @ model.f, atol=1e-8, rtol=1e-8)
+
+
+@pytest.mark.parametrize("batch_size", [3, 10])
+def test_observe_rewards(batch_size):
+    from models.linear_gaussian_sampling import LinearGaussianSampling
+
+    # given
+    generator = np.random.default_rng(0)
+    X = generator.uniform(size=(5, 20))
+    model = LinearGaussianSampling(arms_nb=20, d=5, X=X, v=1, seed=1, refresh_every=7)
+    sequential_model = LinearGaussianSampling(arms_nb=20, d=5, X=X, v=1, seed=1, refresh_every=7)
+
+    # when
+    for t in range(20):
+        arms, rewards = generator.integers(20, size=batch_size), generator.normal(size=batch_size)
+        model.observe_rewards(arms, rewards)
+        for arm, reward in zip(arms, rewards):
+            sequential_model.observe_reward(arm, reward)
+
+    # then
+    assert np.allclose(model.B, sequential_model.B)
+    assert np.allclose(model.L, sequential_model.L)
+    assert np.allclose(model.mi_dashed, sequential_model.mi_dashed)
+    assert model.choose_arms(batch_size).shape == (batch_size,)
+
+
+def test_batched_model_with_v_per_replica_reproduces_single_models():
+    from models.linear_gaussian_sampling import LinearGaussianSampling, BatchedLinearGaussianSampling
+
+    # given
+    generator = np.random.default_rng(0)
+    X = generator.uniform(size=(5, 20))
+    rewards = generator.normal(size=(50, 20))
+    vs = [0.1, 1, 10]
+    batched_model = BatchedLinearGaussianSampling(20, 5, np.broadcast_to(X, (3, 5, 20)), vs, seeds=[1, 1, 1],
+                                                  refresh_every=7)
+    models = [LinearGaussianSampling(20, 5, X, v, seed=1, refresh_every=7) for v in vs]
+
+    # when
+    for t in range(50):
+        batched_arms = batched_model.choose_arm()
+        batched_model.observe_reward(batched_arms, rewards[t, batched_arms])
+        arms = [model.choose_arm() for model in models]
+        [model.observe_reward(arm, rewards[t, arm]) for model, arm in zip(models, arms)]
+
+        # then
+        assert np.array_equal(batched_arms, arms)
+    for r, model in enumerate(models):
+        assert np.array_equal(batched_model.L[r], model.L)
+
+
+def test_mips_index_gives_the_same_arms_as_scan_of_all_arms():
+    from models.linear_gaussian_sampling import LinearGaussianSampling
+
+    # given
+    generator = np.random.default_rng(0)
+    X = np.abs(generator.normal(size=(3, 500)))
+    scan_model = LinearGaussianSampling(arms_nb=500, d=3, X=X, v=1, seed=1)
+    index_model = LinearGaussianSampling(arms_nb=500, d=3, X=X, v=1, seed=1, mips_clusters_nb=20)
+
+    # when
+    arms, index_arms = [], []
+    for _ in range(50):
+        arms.append(scan_model.choose_arm())
+        index_arms.append(index_model.choose_arm())
+        reward = generator.normal(X[:, arms[-1]].sum())
+        scan_model.observe_reward(arms[-1], reward)
+        index_model.observe_reward(index_arms[-1], reward)
+
+    # then
+    assert index_arms == arms
+    assert np.array_equal(index_model.choose_arms(10), scan_model.choose_arms(10))
@@ -71,7 +71,9 @@ def test_sample_theta(lsps_setup):
     # when
     lsps.observe_reward(**lsps_setup.observe_reward_kwargs)
 
-    steps = 10000
+    # the greatest variance of theta is 4, its estimate from n draws has standard error 4 * sqrt(2 / n), so n = 40000
+    # keeps atol=0.1 at 3.5 standard errors (with 10000 draws it was only 1.8 and passed by chance of the stream)
+    steps = 40000
     observed_thetas = []
     for t in range(steps):
         lsps._sample_theta()
@@ -133,3 +135,158 @@ def test_sample_gamma(lsps_setup):
     assert np.allclose(observed_var, lsps_setup.attributes['gamma_var'], atol=0.1, rtol=0)
 
 
+@pytest.mark.parametrize("refresh_every", [None, 7])
+def test_incremental_update_matches_full_rebuild(refresh_every):
+    from models.linear_semi_parametric_sampling import LinearSemiParametricSampling
+
+    # given
+    generator = np.random.default_rng(0)
+    X = generator.uniform(size=(5, 20))
+    lsps = LinearSemiParametricSampling(arms_nb=20, d=5, X=X, sigma_1=0.1, sigma_2=1, sigma_3=10, seed=1,
+                                        refresh_every=refresh_every)
+
+    # when
+    for t in range(500):
+        lsps.observe_reward(i=generator.integers(20), r=generator.normal())
+    incremental_A, incremental_b, incremental_L = lsps.A.copy(), lsps.b.copy(), lsps.L.copy()
+    lsps._update_parameters()
+
+    # then
+    assert np.allclose(incremental_L, lsps.L, atol=1e-8, rtol=1e-8)
+    assert np.allclose(incremental_A, lsps.A, atol=1e-8, rtol=1e-8)
+    assert np.allclose(incremental_b, lsps.b, atol=1e-8, rtol=1e-8)
+
+
+def test_sample_gamma_matches_multivariate_normal():
+    from models.linear_semi_parametric_sampling import LinearSemiParametricSampling
+
+    # given
+    generator = np.random.default_rng(0)
+    N = 50
+    X = generator.uniform(size=(3, N))
+    lsps = LinearSemiParametricSampling(arms_nb=N, d=3, X=X, sigma_1=1, sigma_2=0.5, sigma_3=1, seed=1)
+    for t in range(200):
+        lsps.observe_reward(i=generator.integers(N), r=generator.normal())
+    lsps.theta = np.array([[0.5], [1], [-1]])
+    mean = lsps._estimate_gamma_mean().flatten()
+    var = lsps._estimate_gamma_var()
+
+    # when
+    steps = 5000
+    observed_gammas = []
+    for t in range(steps):
+        lsps._sample_gamma()
+        observed_gammas.append(lsps.gamma)
+    observed_gammas_array = np.vstack(observed_gammas)
+    reference_gammas_array = np.random.default_rng(1).multivariate_normal(mean, np.diag(var), size=steps)
+
+    # then
+    assert lsps.gamma.shape == (N,)
+    assert np.allclose(observed_gammas_array.mean(axis=0), reference_gammas_array.mean(axis=0), atol=0.1, rtol=0)
+    assert np.allclose(observed_gammas_array.var(axis=0), reference_gammas_array.var(axis=0), atol=0.1, rtol=0)
+
+
+@pytest.mark.parametrize("batch_size", [3, 10])
+def test_observe_rewards(batch_size):
+    from models.linear_semi_parametric_sampling import LinearSemiParametricSampling
+
+    # given
+    generator = np.random.default_rng(0)
+    X = generator.uniform(size=(5, 20))
+    kwargs = {"arms_nb": 20, "d": 5, "X": X, "sigma_1": 0.1, "sigma_2": 1, "sigma_3": 10, "seed": 1,
+              "refresh_every": 7}
+    lsps = LinearSemiParametricSampling(**kwargs)
+    sequential_lsps = LinearSemiParametricSampling(**kwargs)
+
+    # when
+    for t in range(20):
+        arms, rewards = generator.integers(20, size=batch_size), generator.normal(size=batch_size)
+        lsps.observe_rewards(arms, rewards)
+        for arm, reward in zip(arms, rewards):
+            sequential_lsps.observe_reward(arm, reward)
+
+    # then
+    assert np.allclose(lsps.n, sequential_lsps.n)
+    assert np.allclose(lsps.r_avg, sequential_lsps.r_avg)
+    assert np.allclose(lsps.A, sequential_lsps.A)
+    assert np.allclose(lsps.b, sequential_lsps.b)
+    assert np.allclose(lsps.L, sequential_lsps.L)
+    assert lsps.choose_arms(batch_size).shape == (batch_size,)
+
+
+def test_batched_model_with_hyperparameters_per_replica_reproduces_single_models():
+    from models.linear_semi_parametric_sampling import (LinearSemiParametricSampling,
+                                                        BatchedLinearSemiParametricSampling)
+
+    # given
+    generator = np.random.default_rng(0)
+    X = generator.uniform(size=(5, 20))
+    rewards = generator.normal(size=(50, 20))
+    sigmas = [(0.1, 1, 10), (1, 1, 1), (10, 0.1, 1)]
+    batched_model = BatchedLinearSemiParametricSampling(20, 5, np.broadcast_to(X, (3, 5, 20)), *zip(*sigmas),
+                                                        seeds=[1, 1, 1], refresh_every=7)
+    models = [LinearSemiParametricSampling(20, 5, X, *sigma, seed=1, refresh_every=7) for sigma in sigmas]
+
+    # when
+    for t in range(50):
+        batched_arms = batched_model.choose_arm()
+        batched_model.observe_reward(batched_arms, rewards[t, batched_arms])
+        arms = [model.choose_arm() for model in models]
+        [model.observe_reward(arm, rewards[t, arm]) for model, arm in zip(models, arms)]
+
+        # then
+        assert np.array_equal(batched_arms, arms)
+    for r, model in enumerate(models):
+        assert np.array_equal(batched_model.L[r], model.L)
+
+
+@pytest.mark.parametrize("gamma_tail_probability", [1e-3, 0.2])
+def test_mips_index_gives_distribution_of_argmax_of_all_gammas(monkeypatch, gamma_tail_probability):
+    import models.linear_semi_parametric_sampling
+    from scipy.stats import chi2_contingency
+    from models.linear_semi_parametric_sampling import LinearSemiParametricSampling
+
+    # given
+    monkeypatch.setattr(models.linear_semi_parametric_sampling, "GAMMA_TAIL_PROBABILITY", gamma_tail_probability)
+    generator = np.random.default_rng(0)
+    X = np.abs(generator.normal(size=(3, 40)))
+    scan_model = LinearSemiParametricSampling(40, 3, X, sigma_1=1, sigma_2=0.3, sigma_3=1, seed=1)
+    index_model = LinearSemiParametricSampling(40, 3, X, sigma_1=1, sigma_2=0.3, sigma_3=1, seed=2,
+                                               mips_clusters_nb=6)
+    for arm in generator.integers(10, size=30):
+        reward = generator.normal(X[:, arm].sum() * 0.2)
+        scan_model.observe_reward(arm, reward)
+        index_model.observe_reward(arm, reward)
+
+    # when
+    counts = np.bincount([scan_model.choose_arm() for _ in range(5000)], minlength=40)
+    index_counts = np.bincount(index_model.choose_arms(5000), minlength=40)
+
+    # then
+    chosen = (counts + index_counts) > 0
+    assert chi2_contingency(np.stack([counts[chosen], index_counts[chosen]]))[1] > 0.001
+
+
+def test_observed_arms_are_kept_for_searches_with_mips_index(monkeypatch):
+    from models.linear_semi_parametric_sampling import LinearSemiParametricSampling
+
+    # given
+    X = np.abs(np.random.default_rng(0).normal(size=(3, 40)))
+    model = LinearSemiParametricSampling(40, 3, X, sigma_1=1, sigma_2=0.3, sigma_3=1, seed=1, mips_clusters_nb=6)
+    restored_model = LinearSemiParametricSampling(40, 3, X, sigma_1=1, sigma_2=0.3, sigma_3=1, seed=1,
+                                                  mips_clusters_nb=6)
+
+    # when
+    model.observe_reward(3, 1.)
+    model.observe_rewards(np.array([7, 3, 1, 7]), np.array([0.5, 1., 0., 0.2]))
+    model.observe_reward(0, 0.1)
+    restored_model.n = model.n.copy()
+    restored_model.state_restored()
+    # searches do not compute variances of gammas of all arms
+    monkeypatch.setattr(model, "_estimate_gamma_var", None)
+    arm = model.choose_arm()
+
+    # then
+    assert model.observed_arms.tolist() == [0, 1, 3, 7]
+    assert restored_model.observed_arms.tolist() == [0, 1, 3, 7]
+    assert 0 <= arm < 40
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from models.mips_index import MipsIndex
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32])
+def test_max_score_finds_arm_with_maximal_inner_product(dtype):
+    # given
+    generator = np.random.default_rng(0)
+    X = np.abs(generator.normal(size=(4, 3000))).astype(dtype)
+    index = MipsIndex(X, clusters_nb=50)
+    thetas = generator.normal(size=(20, 4))
+
+    # when
+    arms = [index.max_score(theta)[0] for theta in thetas]
+
+    # then
+    assert arms == np.argmax(thetas @ X.astype(np.float64), axis=1).tolist()
+
+
+def test_max_score_with_max_clusters_scans_only_the_first_clusters():
+    # given
+    generator = np.random.default_rng(0)
+    X = generator.normal(size=(3, 1000))
+    theta = generator.normal(size=3)
+    index = MipsIndex(X, clusters_nb=20, max_clusters=1)
+
+    # when
+    arm, score = index.max_score(theta)
+
+    # then
+    best_cluster = np.argmax(index.cluster_bounds(theta))
+    cluster_arms = index.arms[index.offsets[best_cluster]:index.offsets[best_cluster + 1]]
+    assert arm in cluster_arms
+    assert score == pytest.approx((theta @ X[:, cluster_arms]).max())
+    assert score <= (theta @ X).max()
+
+
+def test_max_score_with_score_and_slack():
+    # given
+    generator = np.random.default_rng(0)
+    X = generator.normal(size=(3, 1000))
+    theta = generator.normal(size=3)
+    noise = generator.uniform(0, 0.5, size=1000)
+    index = MipsIndex(X, clusters_nb=20)
+
+    # when
+    arm, score = index.max_score(theta, lambda arms, values: values + noise[arms], slack=0.5)
+
+    # then
+    assert arm == np.argmax(theta @ X + noise)
+    assert score == pytest.approx((theta @ X + noise).max())
+
+
+def test_index_of_memory_mapped_X_does_not_copy_X(tmp_path):
+    # given
+    generator = np.random.default_rng(0)
+    X = np.lib.format.open_memmap(str(tmp_path / "X.npy"), mode="w+", shape=(3, 2000))
+    X[:] = generator.normal(size=(3, 2000))
+    thetas = generator.normal(size=(20, 3))
+
+    # when
+    index = MipsIndex(X, clusters_nb=30)
+    arms = [index.max_score(theta)[0] for theta in thetas]
+
+    # then
+    assert index.X is X
+    assert all(not isinstance(value, np.ndarray) or value.size < X.size for value in vars(index).values()
+               if value is not X)
+    assert arms == np.argmax(thetas @ X, axis=1).tolist()
@@ -0,0 +1,80 @@
+import sys
+import types
+
+import pytest
+
+import models.registry
+from models.registry import get_model_class, get_model_names, is_model_name
+
+
+class ThirdPartyModel:
+    pass
+
+
+class FakeEntryPoint:
+    def __init__(self, name: str, value: type):
+        self.name = name
+        self.value = value
+
+    def load(self) -> type:
+        return self.value
+
+
+def fail_to_load_entry_points(group):
+    raise AssertionError("entry points are loaded")
+
+
+def test_get_model_class_imports_builtin_models_without_entry_points(monkeypatch):
+    # given
+    monkeypatch.setattr(models.registry, "_entry_points", fail_to_load_entry_points)
+
+    # when
+    model_class = get_model_class("GaussianPriorsSampling")
+    batched_model_class = get_model_class("GaussianPriorsSampling", batched=True)
+
+    # then
+    assert is_model_name("GaussianPriorsSampling")
+    assert model_class.__name__ == "GaussianPriorsSampling"
+    assert batched_model_class.replica_class is model_class
+
+
+def test_models_registered_with_entry_points_are_available(monkeypatch):
+    # given
+    entry_points = {models.registry.ENTRY_POINT_GROUP: [FakeEntryPoint("ThirdPartyModel", ThirdPartyModel)]}
+    monkeypatch.setattr(models.registry, "_entry_points", lambda group: entry_points.get(group, []))
+
+    # when
+    model_names = get_model_names()
+    model_class = get_model_class("ThirdPartyModel")
+
+    # then
+    assert model_names == ["ThirdPartyModel", "LinearSemiParametricSampling", "BetaPriorsSampling",
+                           "GaussianPriorsSampling", "LinearGaussianSampling"]
+    assert is_model_name("ThirdPartyModel") and not is_model_name("UnknownModel")
+    assert model_class is ThirdPartyModel
+    with pytest.raises(ValueError, match="does not support --replicas"):
+        get_model_class("ThirdPartyModel", batched=True)
+    with pytest.raises(ValueError, match="Unknown model"):
+        get_model_class("UnknownModel")
+
+
+@pytest.mark.parametrize("entry_points_module", ["importlib_metadata", "pkg_resources"])
+def test_entry_points_without_importlib_metadata(monkeypatch, entry_points_module):
+    # given
+    entry_point = FakeEntryPoint("ThirdPartyModel", ThirdPartyModel)
+    module = types.ModuleType(entry_points_module)
+    # entry_points() of importlib.metadata before Python 3.10 (and of old backports) returns a dict of groups
+    module.entry_points = lambda: {models.registry.ENTRY_POINT_GROUP: [entry_point]}
+    module.iter_entry_points = lambda group: iter([entry_point] if group == models.registry.ENTRY_POINT_GROUP else [])
+    monkeypatch.setitem(sys.modules, "importlib.metadata", None)
+    if entry_points_module == "pkg_resources":
+        monkeypatch.setitem(sys.modules, "importlib_metadata", None)
+    monkeypatch.setitem(sys.modules, entry_points_module, module)
+
+    # when
+    entry_points = models.registry._entry_points(models.registry.ENTRY_POINT_GROUP)
+    other_entry_points = models.registry._entry_points("other_group")
+
+    # then
+    assert entry_points == [entry_point]
+    assert other_entry_points == []
@@ -0,0 +1,46 @@
+import numpy as np
+import scipy.stats
+
+from models.variate_pool import VariatePool
+
+
+def test_variates_do_not_depend_on_block_size():
+    # given
+    small_blocks_pool = VariatePool(1, block_size=7)
+    large_blocks_pool = VariatePool(1)
+
+    # when
+    small_blocks_variates = np.concatenate([small_blocks_pool.standard_normal(size) for size in [3, 12, 1, 30]])
+    large_blocks_variates = large_blocks_pool.standard_normal(46)
+
+    # then
+    assert np.array_equal(small_blocks_variates, large_blocks_variates)
+
+
+def test_pool_restored_from_state_continues_with_the_same_variates():
+    # given
+    pool = VariatePool(1, block_size=10)
+    pool.standard_normal(13)
+    pool.normal(np.zeros((2, 2)), 1.)
+    state = pool.get_state()
+    restored_pool = VariatePool(2, block_size=10)
+
+    # when
+    restored_pool.set_state(state)
+
+    # then
+    assert np.array_equal(restored_pool.standard_normal((3, 5)), pool.standard_normal((3, 5)))
+    assert np.array_equal(restored_pool.normal(np.ones(20), 2.), pool.normal(np.ones(20), 2.))
+
+
+def test_normal_has_given_distribution_and_broadcast_shape():
+    # given
+    pool = VariatePool(1)
+
+    # when
+    variates = pool.normal(np.full(20000, 2.), 3.)
+    broadcast_variates = pool.normal(np.zeros((3, 1)), np.ones(4))
+
+    # then
+    assert scipy.stats.kstest(variates, scipy.stats.norm(2, 3).cdf).pvalue > 0.01
+    assert broadcast_variates.shape == (3, 4)
@@ -0,0 +1,49 @@
+import asyncio
+
+import numpy as np
+
+from models.gaussian_priors_sampling import GaussianPriorsSampling
+from serving.bandit_server import BanditServer
+
+
+async def serve(server: BanditServer, clients_nb: int, requests_nb: int, reward_delay: float = 0) -> list:
+    async def client():
+        arms = []
+        for _ in range(requests_nb):
+            arm = await server.choose_arm()
+            # standing in for a client waiting for the reward
+            await asyncio.sleep(reward_delay)
+            await server.observe_reward(arm, 1.)
+            arms.append(arm)
+        return arms
+
+    async with server:
+        return sum(await asyncio.gather(*[client() for _ in range(clients_nb)]), [])
+
+
+def test_all_rewards_are_applied_in_batches():
+    # given
+    model = GaussianPriorsSampling(100, seed=1)
+    server = BanditServer(model, pool_size=16, batch_size=32)
+
+    # when
+    arms = asyncio.run(serve(server, clients_nb=8, requests_nb=50))
+
+    # then
+    assert len(arms) == 400
+    assert np.array_equal(model.k, np.bincount(arms, minlength=100))
+    assert server.pools_nb == 400 / 16
+    assert server.batches_nb < 400
+
+
+def test_pool_is_drawn_again_after_refresh_after_rewards():
+    # given
+    model = GaussianPriorsSampling(100, seed=1)
+    server = BanditServer(model, pool_size=1000, refresh_after_rewards=10, batch_size=10, batch_interval=0)
+
+    # when
+    arms = asyncio.run(serve(server, clients_nb=1, requests_nb=100, reward_delay=0.001))
+
+    # then
+    assert model.k.sum() == len(arms) == 100
+    assert server.pools_nb > 1
@@ -1,5 +1,5 @@
 import numpy as np
-from simulation.environment import Environment
+from simulation.environment import Environment, BatchedEnvironment
 
 
 def test_prepare_context_features():
@@ -72,4 +72,118 @@ def test_get_reward_binomial():
             average_observed_rewards[i] += reward / steps
 
     # then
-    assert np.allclose(env.expected_rewards, np.array([average_observed_rewards]), atol=0.1, rtol=0)
\ No newline at end of file
+    assert np.allclose(env.expected_rewards, np.array([average_observed_rewards]), atol=0.1, rtol=0)
+
+
+def test_batched_environment():
+    # given
+    seeds = [1, 2]
+    env = BatchedEnvironment(N=5, a=0.9, d=3, reward_distribution="normal", seeds=seeds)
+    single_envs = [Environment(N=5, a=0.9, d=3, reward_distribution="normal", seed=seed) for seed in seeds]
+    arms = np.array([0, 3])
+
+    # when
+    rewards = env.get_reward(arms)
+    regrets = env.get_regret(arms)
+
+    # then
+    assert env.X.shape == (2, 3, 5)
+    assert np.array_equal(env.X[1], single_envs[1].X)
+    assert np.array_equal(rewards, [single_env.get_reward(arm) for single_env, arm in zip(single_envs, arms)])
+    assert np.array_equal(regrets, [single_env.get_regret(arm) for single_env, arm in zip(single_envs, arms)])
+
+
+def test_get_rewards_does_not_depend_on_block_size():
+    # given
+    arms = np.array([3, 0, 3, 1, 3, 3, 0])
+    env_small_blocks = Environment(N=5, a=0.9, d=3, reward_distribution="normal", seed=1, reward_block_size=2)
+    env_big_blocks = Environment(N=5, a=0.9, d=3, reward_distribution="normal", seed=1, reward_block_size=1024)
+
+    # when
+    rewards_small_blocks = np.concatenate([env_small_blocks.get_rewards(arms[:3]),
+                                           env_small_blocks.get_rewards(arms[3:])])
+    rewards_big_blocks = env_big_blocks.get_rewards(arms)
+
+    # then
+    assert np.array_equal(rewards_small_blocks, rewards_big_blocks)
+
+
+def test_get_rewards_binomial():
+    # given
+    N = 5
+    env = Environment(N=N, a=0.9, d=3, reward_distribution="binomial", seed=1, reward_block_size=100)
+
+    # when
+    steps = 10000
+    rewards = env.get_rewards(np.repeat(np.arange(N), steps)).reshape(N, steps)
+
+    # then
+    assert set(np.unique(rewards)) <= {0, 1}
+    assert np.allclose(env.expected_rewards, rewards.mean(axis=1, keepdims=True).T, atol=0.1, rtol=0)
+
+
+def test_get_regrets():
+    # given
+    env = Environment(N=5, a=0.9, d=3, reward_distribution="normal", seed=1)
+    arms = np.array([4, 0, 2])
+
+    # when
+    regrets = env.get_regrets(arms)
+
+    # then
+    assert np.allclose(regrets, env.expected_rewards.max() - env.expected_rewards[0, arms])
+    assert np.allclose(regrets, [env.get_regret(arm) for arm in arms])
+
+
+def test_memory_mapped_and_chunked_context_features(tmp_path, monkeypatch):
+    import models.context_features
+
+    # given
+    environment = Environment(1000, 0.5, 7, "normal", 1)
+    monkeypatch.setattr(models.context_features, "CHUNK_ELEMENTS", 300)
+
+    # when
+    memory_mapped_environment = Environment(1000, 0.5, 7, "normal", 1, X_path=str(tmp_path / "X.npy"))
+    float32_environment = Environment(1000, 0.5, 7, "normal", 1, X_path=str(tmp_path / "X32.npy"), X_dtype="float32")
+
+    # then
+    assert isinstance(memory_mapped_environment.X, np.memmap)
+    assert np.array_equal(memory_mapped_environment.X, environment.X)
+    assert np.array_equal(np.load(tmp_path / "X.npy"), environment.X)
+    assert np.allclose(memory_mapped_environment.expected_rewards, environment.expected_rewards, atol=1e-15, rtol=0)
+    assert memory_mapped_environment.get_reward(3) == environment.get_reward(3)
+    assert float32_environment.X.dtype == np.float32
+    assert float32_environment.expected_rewards.dtype == np.float64
+    assert np.allclose(float32_environment.gaps, environment.gaps, atol=1e-7, rtol=0)
+
+
+def test_sparse_context_features():
+    import scipy.sparse
+
+    # when
+    environment = Environment(1000, 0.5, 50, "normal", 1, X_density=0.05)
+
+    # then
+    assert scipy.sparse.isspmatrix_csc(environment.X)
+    assert environment.X.nnz == 0.05 * 50 * 1000
+    X = environment.X.toarray()
+    assert (X >= 0).all()
+    assert np.isclose(np.linalg.norm(X, axis=0).max(), 1)
+    assert np.allclose(environment.expected_rewards, environment.theta.T @ X + environment.bias)
+
+
+def test_restored_environment_continues_reward_streams(tmp_path):
+    from simulation.log_saver import LogSaver, load_state, restore_state
+
+    # given
+    arms = np.array([3, 0, 3, 1, 3, 3, 0])
+    env = Environment(N=5, a=0.9, d=3, reward_distribution="binomial", seed=1, reward_block_size=2)
+    env.get_rewards(arms)
+    LogSaver("run", str(tmp_path), None).save_state(env, "environment")
+    restored_env = Environment(N=5, a=0.9, d=3, reward_distribution="binomial", seed=1, reward_block_size=2)
+
+    # when
+    restore_state(restored_env, load_state(str(tmp_path / "run" / "environment.npz")))
+
+    # then
+    assert np.array_equal(restored_env.get_rewards(arms), env.get_rewards(arms))
@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+
+from models.linear_semi_parametric_sampling import LinearSemiParametricSampling
+from simulation.log_saver import LogSaver, load_state, restore_state
+
+
+def test_save_state_and_restore_state(tmp_path):
+    # given
+    log_saver = LogSaver("test", str(tmp_path), None, save_every=2)
+    X = np.random.default_rng(0).uniform(size=(3, 100))
+    kwargs = {"arms_nb": 100, "d": 3, "X": X, "sigma_1": 1, "sigma_2": 1, "sigma_3": 1, "seed": 1}
+    model = LinearSemiParametricSampling(**kwargs)
+    for i in range(10):
+        model.observe_reward(i, 1)
+
+    # when
+    log_saver.save_array(X, "X")
+    log_saver.save_state_for_step(model, "LinearSemiParametricSampling", 1)
+    log_saver.save_state_for_step(model, "LinearSemiParametricSampling", 2)
+    state = load_state(os.path.join(log_saver.path, "LinearSemiParametricSampling_2.npz"))
+    restored_model = LinearSemiParametricSampling(**{**kwargs, "X": np.load(os.path.join(log_saver.path,
+                                                                                          state["X_file_name"]))})
+    restore_state(restored_model, state)
+
+    # then
+    assert not os.path.exists(os.path.join(log_saver.path, "LinearSemiParametricSampling_1.npz"))
+    assert "X" not in state
+    for attribute in model.state_attributes:
+        assert np.array_equal(getattr(restored_model, attribute), getattr(model, attribute))
+    assert restored_model.choose_arm() == model.choose_arm()
+    assert np.array_equal(restored_model.gamma, model.gamma)
+
+
+def test_files_are_uploaded_to_storage_and_deleted_locally(tmp_path):
+    # given
+    log_saver = LogSaver("test", str(tmp_path / "local"), str(tmp_path / "remote"), save_every=2)
+    model = LinearSemiParametricSampling(arms_nb=10, d=3, X=np.ones((3, 10)), sigma_1=1, sigma_2=1, sigma_3=1, seed=1)
+
+    # when
+    log_saver.save_dict({"seed": 1}, "environment_kwargs")
+    log_saver.save_array(model.X, "X")
+    for step in range(4):
+        log_saver.save_state_for_step(model, "LinearSemiParametricSampling", step)
+    log_saver.sync_with_gcs()
+
+    # then
+    assert os.listdir(log_saver.path) == []
+    assert sorted(os.listdir(tmp_path / "remote" / "test")) == ["LinearSemiParametricSampling_0.npz",
+                                                               "LinearSemiParametricSampling_2.npz", "X.npy",
+                                                               "environment_kwargs"]
+    state = load_state(str(tmp_path / "remote" / "test" / "LinearSemiParametricSampling_2.npz"))
+    assert np.array_equal(state["A"], model.A)
@@ -0,0 +1,33 @@
+import time
+
+from simulation.profiler import DisabledProfiler, Profiler
+
+
+def test_profiler_measures_phases():
+    # given
+    profiler = Profiler()
+
+    # when
+    for _ in range(3):
+        with profiler.measure("model", "choose_arm"):
+            time.sleep(0.002)
+    with profiler.measure("model", "observe_reward"):
+        pass
+    profiler.sample_memory(0)
+    summary = profiler.summary()
+
+    # then
+    choose_arm = summary["phases"]["model"]["choose_arm"]
+    assert choose_arm["calls_nb"] == 3
+    assert 0.006 <= choose_arm["total_seconds"] < summary["wall_time_seconds"]
+    assert sum(choose_arm["latency_histogram_us"].values()) == 3
+    assert all(int(bucket[1:]) > 2000 for bucket in choose_arm["latency_histogram_us"])
+    assert summary["phases"]["model"]["observe_reward"]["calls_nb"] == 1
+    assert summary["rss_samples"][0]["step"] == 0
+    assert summary["peak_rss_bytes"] >= summary["rss_samples"][0]["peak_rss_bytes"] > 0
+
+
+def test_disabled_profiler_measures_nothing():
+    profiler = DisabledProfiler()
+    with profiler.measure("model", "choose_arm"):
+        profiler.sample_memory(0)
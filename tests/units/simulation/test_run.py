@@ -1,3 +1,10 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
 from simulation.run import main
 
 
@@ -32,3 +39,386 @@ def test_main_for_all():
             "--arms_nb 10 --a 0.5 --d 100 --reward_distribution binomial --seed 1 --v 1 "
             "--sigma_1 1 --sigma_2 1 --sigma_3 1").split(" ")
     main(args)
+
+
+def test_run_batched_reproduces_single_seed_runs(tmp_path):
+    from models.beta_priors_sampling import BetaPriorsSampling, BatchedBetaPriorsSampling
+    from models.gaussian_priors_sampling import GaussianPriorsSampling, BatchedGaussianPriorsSampling
+    from models.linear_gaussian_sampling import LinearGaussianSampling, BatchedLinearGaussianSampling
+    from models.linear_semi_parametric_sampling import (LinearSemiParametricSampling,
+                                                        BatchedLinearSemiParametricSampling)
+    from simulation.log_saver import LogSaver
+    from simulation.runner import run, run_batched
+
+    # given
+    seeds = [1, 2, 3]
+    environment_kwargs = {"N": 10, "a": 0.5, "d": 5, "reward_distribution": "binomial"}
+    lsps_kwargs = {"arms_nb": 10, "d": 5, "X": None, "sigma_1": 1, "sigma_2": 1, "sigma_3": 1, "refresh_every": 50}
+    lgs_kwargs = {"arms_nb": 10, "d": 5, "X": None, "v": 1, "refresh_every": 50}
+
+    # when
+    batched_regrets = run_batched(150, {**environment_kwargs, "seeds": seeds},
+                                  {BatchedLinearSemiParametricSampling: {**lsps_kwargs, "seeds": seeds},
+                                   BatchedLinearGaussianSampling: {**lgs_kwargs, "seeds": seeds},
+                                   BatchedGaussianPriorsSampling: {"arms_nb": 10, "seeds": seeds},
+                                   BatchedBetaPriorsSampling: {"arms_nb": 10, "seeds": seeds}},
+                                  [LogSaver(f"batched_{seed}", str(tmp_path), None, 50) for seed in seeds])
+    single_regrets = [run(150, {**environment_kwargs, "seed": seed},
+                          {LinearSemiParametricSampling: {**lsps_kwargs, "seed": seed},
+                           LinearGaussianSampling: {**lgs_kwargs, "seed": seed},
+                           GaussianPriorsSampling: {"arms_nb": 10, "seed": seed},
+                           BetaPriorsSampling: {"arms_nb": 10, "seed": seed}},
+                          LogSaver(f"single_{seed}", str(tmp_path), None, 50)) for seed in seeds]
+
+    # then
+    for batched, single in zip(batched_regrets, single_regrets):
+        for model_name in single.keys():
+            assert np.array_equal(batched[model_name], single[model_name])
+    for seed in seeds:
+        for model_name in single_regrets[0].keys():
+            batched_arms = np.load(tmp_path / f"batched_{seed}" / f"arms_{model_name}.npy")
+            single_arms = np.load(tmp_path / f"single_{seed}" / f"arms_{model_name}.npy")
+            assert np.array_equal(batched_arms, single_arms)
+
+
+def test_main_for_replicas():
+    args = ("--models LinearSemiParametricSampling LinearGaussianSampling GaussianPriorsSampling BetaPriorsSampling "
+            "--name test_replicas --steps 50 --save_every 10 --replicas 3 "
+            "--arms_nb 10 --a 0.5 --d 100 --reward_distribution binomial --seed 1 --v 1 "
+            "--sigma_1 1 --sigma_2 1 --sigma_3 1").split(" ")
+    main(args)
+
+
+@pytest.mark.parametrize("batched_option", ["--replicas 2", "--sweep"])
+def test_main_with_bound_tail_probability_rejects_replicas_and_sweep(batched_option):
+    args = ("--models BetaPriorsSampling --name test_bound_tail_probability --steps 10 --save_every 10 --arms_nb 10 "
+            f"--a 0.5 --d 5 --reward_distribution binomial --seed 1 --bound_tail_probability 0.01 {batched_option}"
+            ).split(" ")
+    with pytest.raises(ValueError, match="--bound_tail_probability"):
+        main(args)
+
+
+def test_main_batched_does_not_change_arguments():
+    from simulation.run import get_args, main_batched
+
+    # given
+    args = get_args(("--models LinearGaussianSampling --name test_replicas_arguments --steps 10 --save_every 10 "
+                     "--replicas 2 --arms_nb 10 --a 0.5 --d 5 --reward_distribution binomial --seed 1 "
+                     "--v 1").split(" "))
+
+    # when
+    main_batched(args)
+
+    # then
+    assert args.seed == 1
+    assert not hasattr(args, "seeds")
+
+
+def test_main_for_delayed_feedback():
+    args = ("--models LinearSemiParametricSampling LinearGaussianSampling GaussianPriorsSampling BetaPriorsSampling "
+            "--name test_delayed_feedback --steps 200 --save_every 32 --batch_size 16 "
+            "--arms_nb 10 --a 0.5 --d 100 --reward_distribution binomial --seed 1 --v 1 "
+            "--sigma_1 1 --sigma_2 1 --sigma_3 1").split(" ")
+    main(args)
+
+
+def test_run_with_delayed_feedback_saves_states_between_batches(tmp_path):
+    from models.linear_gaussian_sampling import LinearGaussianSampling
+    from simulation.log_saver import LogSaver, load_state
+    from simulation.runner import run_with_delayed_feedback
+
+    # given
+    environment_kwargs = {"N": 10, "a": 0.5, "d": 5, "reward_distribution": "normal", "seed": 1}
+
+    def models():
+        return {LinearGaussianSampling: {"arms_nb": 10, "d": 5, "X": None, "v": 1, "seed": 1}}
+
+    # when
+    run_with_delayed_feedback(64, 16, environment_kwargs, models(), LogSaver("long", str(tmp_path), None, 32))
+    run_with_delayed_feedback(32, 16, environment_kwargs, models(), LogSaver("short", str(tmp_path), None, 32))
+
+    # then
+    checkpoint = load_state(str(tmp_path / "long" / "LinearGaussianSampling_32.npz"))
+    final_state = load_state(str(tmp_path / "short" / "LinearGaussianSampling_32.npz"))
+    assert sorted(path.name for path in (tmp_path / "long").glob("LinearGaussianSampling_*.npz")) == \
+        ["LinearGaussianSampling_0.npz", "LinearGaussianSampling_32.npz", "LinearGaussianSampling_64.npz"]
+    for key, value in final_state.items():
+        assert np.array_equal(checkpoint[key], value)
+    with pytest.raises(ValueError, match="multiple of --batch_size"):
+        run_with_delayed_feedback(64, 16, environment_kwargs, models(), LogSaver("wrong", str(tmp_path), None, 10))
+
+
+@pytest.mark.parametrize("environment_kwargs, models_kwargs, steps, save_every, record_checkpoints", [
+    ({"N": 10, "a": 0.5, "d": 5, "reward_distribution": "normal", "seed": 1},
+     {"LinearSemiParametricSampling": {"arms_nb": 10, "d": 5, "X": None, "sigma_1": 1, "sigma_2": 1, "sigma_3": 1,
+                                       "seed": 1, "refresh_every": None},
+      "GaussianPriorsSampling": {"arms_nb": 10, "seed": 1}}, 100, 20, None),
+    ({"N": 1000, "a": 0.5, "d": 5, "reward_distribution": "binomial", "seed": 1},
+     {"BetaPriorsSampling": {"arms_nb": 1000, "seed": 1, "bound_tail_probability": 0.001},
+      "GaussianPriorsSampling": {"arms_nb": 1000, "seed": 1, "bound_tail_probability": 0.001}}, 200, 40, None),
+    # blocks of the pool smaller than variates of a few steps, so checkpoints fall inside blocks
+    ({"N": 50, "a": 0.5, "d": 5, "reward_distribution": "binomial", "seed": 1},
+     {"GaussianPriorsSampling": {"arms_nb": 50, "seed": 1, "variate_pool_size": 64}}, 100, 20, None),
+    ({"N": 10, "a": 0.5, "d": 5, "reward_distribution": "normal", "seed": 1},
+     {"LinearGaussianSampling": {"arms_nb": 10, "d": 5, "X": None, "v": 1, "seed": 1, "refresh_every": None},
+      "GaussianPriorsSampling": {"arms_nb": 10, "seed": 1}}, 100, 20, [1, 10, 65, 300]),
+], ids=["linear_semi_parametric", "bound_tail_probability", "variate_pool", "record_checkpoints"])
+def test_run_resumed_from_checkpoint_gives_the_same_result(tmp_path, environment_kwargs, models_kwargs, steps,
+                                                           save_every, record_checkpoints):
+    from models.registry import get_model_class
+    from simulation.log_saver import LogSaver
+    from simulation.runner import run
+
+    # given
+    def models():
+        return {get_model_class(name): dict(kwargs) for name, kwargs in models_kwargs.items()}
+
+    # when
+    regrets = run(steps, environment_kwargs, models(), LogSaver("uninterrupted", str(tmp_path), None, save_every))
+    run(steps * 7 // 10, environment_kwargs, models(), LogSaver("interrupted", str(tmp_path), None, save_every),
+        record_checkpoints=record_checkpoints)
+    resumed_regrets = run(steps, environment_kwargs, models(),
+                          LogSaver("interrupted", str(tmp_path), None, save_every, resume=True), resume=True,
+                          record_checkpoints=record_checkpoints)
+
+    # then
+    for model_name in regrets.keys():
+        arms = np.load(tmp_path / "uninterrupted" / f"arms_{model_name}.npy")
+        if record_checkpoints is None:
+            assert np.array_equal(resumed_regrets[model_name], regrets[model_name])
+            assert np.array_equal(np.load(tmp_path / "interrupted" / f"arms_{model_name}.npy"), arms)
+        else:
+            checkpoint_steps = np.load(tmp_path / "interrupted" / "checkpoint_steps.npy")
+            assert checkpoint_steps.tolist() == [1, 10, 65, 100]
+            assert resumed_regrets[model_name].tolist() == np.cumsum(regrets[model_name])[checkpoint_steps - 1].tolist()
+            arm_counts = np.load(tmp_path / "interrupted" / f"arm_counts_{model_name}.npy")
+            assert np.array_equal(arm_counts, np.bincount(arms, minlength=environment_kwargs["N"]))
+    if record_checkpoints is not None:
+        assert not list((tmp_path / "interrupted").glob("arms_*.npy"))
+
+
+def test_run_resumed_with_fewer_or_more_steps_than_saved_gives_the_same_result(tmp_path):
+    from models.gaussian_priors_sampling import GaussianPriorsSampling
+    from simulation.log_saver import LogSaver
+    from simulation.runner import run
+
+    # given
+    environment_kwargs = {"N": 10, "a": 0.5, "d": 5, "reward_distribution": "normal", "seed": 1}
+
+    def models():
+        return {GaussianPriorsSampling: {"arms_nb": 10, "seed": 1}}
+
+    regrets = run(100, environment_kwargs, models(), LogSaver("uninterrupted", str(tmp_path), None, 20))
+    run(50, environment_kwargs, models(), LogSaver("extended", str(tmp_path), None, 20))
+
+    # when
+    # a checkpoint at step 40 is used, not the later ones
+    shortened_regrets = run(40, environment_kwargs, models(), LogSaver("uninterrupted", str(tmp_path), None, 20,
+                                                                       resume=True), resume=True)
+    # the state after the last step 50 is saved, though 50 is not a multiple of save_every
+    extended_log_saver = LogSaver("extended", str(tmp_path), None, 20, resume=True)
+    resume_step = extended_log_saver.latest_checkpoint_step(["environment", "GaussianPriorsSampling"])
+    extended_regrets = run(100, environment_kwargs, models(), extended_log_saver, resume=True)
+
+    # then
+    assert resume_step == 50
+    assert np.array_equal(shortened_regrets["GaussianPriorsSampling"], regrets["GaussianPriorsSampling"][:40])
+    assert np.array_equal(extended_regrets["GaussianPriorsSampling"], regrets["GaussianPriorsSampling"])
+
+
+def test_run_resumed_from_checkpoint_uploaded_to_storage_gives_the_same_result(tmp_path, monkeypatch):
+    import shutil
+    from models.linear_gaussian_sampling import LinearGaussianSampling
+    from simulation.log_saver import LogSaver
+    from simulation.runner import run
+    from simulation.storage import DirectoryStorage
+
+    # given
+    environment_kwargs = {"N": 10, "a": 0.5, "d": 5, "reward_distribution": "normal", "seed": 1}
+    storage_path = str(tmp_path / "bucket")
+
+    def models():
+        return {LinearGaussianSampling: {"arms_nb": 10, "d": 5, "X": None, "v": 1, "seed": 1}}
+
+    # when
+    regrets = run(100, environment_kwargs, models(), LogSaver("uninterrupted", str(tmp_path / "local"), None, 20))
+    log_saver = LogSaver("interrupted", str(tmp_path / "local"), storage_path, 20)
+    run(70, environment_kwargs, models(), log_saver)
+    log_saver.sync_with_gcs()
+    # local files of the run are gone, like on a rescheduled pod
+    shutil.rmtree(tmp_path / "local" / "interrupted")
+    downloaded_names = []
+    download = DirectoryStorage.download
+    monkeypatch.setattr(DirectoryStorage, "download", lambda storage, relative_path, local_path: (
+        downloaded_names.append(relative_path), download(storage, relative_path, local_path)))
+    resumed_log_saver = LogSaver("interrupted", str(tmp_path / "local"), storage_path, 20, resume=True)
+    resumed_regrets = run(100, environment_kwargs, models(), resumed_log_saver, resume=True)
+    resumed_log_saver.sync_with_gcs()
+
+    # then
+    # the state after the last step of the interrupted run is saved, though 70 is not a multiple of save_every
+    assert sorted(downloaded_names) == ["LinearGaussianSampling_70.npz", "environment_70.npz", "progress_70.npz"]
+    assert np.array_equal(resumed_regrets["LinearGaussianSampling"], regrets["LinearGaussianSampling"])
+
+
+def test_find_latest_experiment_name_in_storage(tmp_path):
+    from simulation.run import find_latest_experiment_name
+
+    # given
+    for name in ["job_20240101_000000000000", "job_20240102_000000000000", "other_20240103_000000000000"]:
+        os.makedirs(tmp_path / "bucket" / name)
+    os.makedirs(tmp_path / "local" / "job_20231231_000000000000")
+
+    # when
+    latest_local_name = find_latest_experiment_name("job", str(tmp_path / "local"))
+    latest_name = find_latest_experiment_name("job", str(tmp_path / "local"), str(tmp_path / "bucket"))
+
+    # then
+    assert latest_local_name == "job_20231231_000000000000"
+    assert latest_name == "job_20240102_000000000000"
+
+
+def test_main_with_resume():
+    from simulation.run import find_latest_experiment_name
+
+    args = ("--models GaussianPriorsSampling --name test_resume --steps 50 --save_every 20 "
+            "--arms_nb 10 --a 0.5 --d 100 --reward_distribution normal --seed 1").split(" ")
+    main(args)
+    experiment_name = find_latest_experiment_name("test_resume", "./logging")
+    main(args + ["--resume"])
+    assert find_latest_experiment_name("test_resume", "./logging") == experiment_name
+
+
+def test_main_with_yaml_output():
+    import yaml
+    from simulation.run import find_latest_experiment_name
+
+    args = ("--models GaussianPriorsSampling --name test_yaml_output --steps 50 --save_every 20 --yaml_output "
+            "--arms_nb 10 --a 0.5 --d 100 --reward_distribution normal --seed 1").split(" ")
+    main(args)
+    path = os.path.join("./logging", find_latest_experiment_name("test_yaml_output", "./logging"))
+    with open(os.path.join(path, "regrets"), "r") as f:
+        regrets = yaml.safe_load(f)
+    regrets_array = np.load(os.path.join(path, "regrets_GaussianPriorsSampling.npy"), mmap_mode="r")
+    assert regrets["GaussianPriorsSampling"] == regrets_array.tolist()
+
+
+def test_run_sweep_with_one_variant_per_model_reproduces_run(tmp_path):
+    from models.gaussian_priors_sampling import GaussianPriorsSampling, BatchedGaussianPriorsSampling
+    from models.linear_semi_parametric_sampling import (LinearSemiParametricSampling,
+                                                        BatchedLinearSemiParametricSampling)
+    from simulation.log_saver import LogSaver, load_state
+    from simulation.runner import run, run_sweep
+
+    # given
+    environment_kwargs = {"N": 10, "a": 0.5, "d": 5, "reward_distribution": "normal", "seed": 1}
+    lsps_kwargs = {"arms_nb": 10, "d": 5, "X": None, "sigma_1": 1, "sigma_2": 0.1, "sigma_3": 10, "refresh_every": 50}
+
+    # when
+    sweep_regrets = run_sweep(150, environment_kwargs,
+                              {BatchedLinearSemiParametricSampling: {**lsps_kwargs, "seeds": [1]},
+                               BatchedGaussianPriorsSampling: {"arms_nb": 10, "seeds": [1]}},
+                              {BatchedLinearSemiParametricSampling: [LogSaver("sweep_lsps", str(tmp_path), None, 50)],
+                               BatchedGaussianPriorsSampling: [LogSaver("sweep_gps", str(tmp_path), None, 50)]})
+    regrets = run(150, environment_kwargs, {LinearSemiParametricSampling: {**lsps_kwargs, "seed": 1},
+                                            GaussianPriorsSampling: {"arms_nb": 10, "seed": 1}},
+                  LogSaver("single", str(tmp_path), None, 50))
+
+    # then
+    assert np.array_equal(sweep_regrets[BatchedLinearSemiParametricSampling][0]["LinearSemiParametricSampling"],
+                          regrets["LinearSemiParametricSampling"])
+    assert np.array_equal(sweep_regrets[BatchedGaussianPriorsSampling][0]["GaussianPriorsSampling"],
+                          regrets["GaussianPriorsSampling"])
+    # X is saved once, checkpoints of the other variants refer to it
+    assert not (tmp_path / "sweep_gps" / "X.npy").exists()
+    X_file_name = load_state(str(tmp_path / "sweep_gps" / "environment_50.npz"))["X_file_name"]
+    assert np.array_equal(np.load(tmp_path / "sweep_gps" / X_file_name), np.load(tmp_path / "single" / "X.npy"))
+
+
+def test_main_for_sweep():
+    import yaml
+    from simulation.run import find_latest_experiment_name
+
+    args = ("--models LinearSemiParametricSampling LinearGaussianSampling GaussianPriorsSampling "
+            "--name test_sweep --steps 50 --save_every 10 --sweep "
+            "--arms_nb 10 --a 0.5 --d 100 --reward_distribution normal --seed 1 --v 0.1 1 10 "
+            "--sigma_1 0.1 1 --sigma_2 1 --sigma_3 1 10").split(" ")
+    main(args)
+    for model_name, variants_nb in [("LinearSemiParametricSampling", 4), ("LinearGaussianSampling", 3),
+                                    ("GaussianPriorsSampling", 1)]:
+        for i in range(variants_nb):
+            path = os.path.join("./logging", find_latest_experiment_name(f"test_sweep_{model_name}_{i}", "./logging"))
+            assert os.path.exists(os.path.join(path, f"regrets_{model_name}.npy"))
+    path = os.path.join("./logging", find_latest_experiment_name("test_sweep_LinearSemiParametricSampling_1",
+                                                                 "./logging"))
+    with open(os.path.join(path, "LinearSemiParametricSampling_kwargs"), "r") as f:
+        kwargs = yaml.safe_load(f)
+    assert (kwargs["sigma_1"], kwargs["sigma_2"], kwargs["sigma_3"]) == (0.1, 1, 10)
+    assert not os.path.exists(os.path.join(path, "X.npy"))
+    assert os.path.exists(os.path.join("./logging", find_latest_experiment_name("test_sweep", "./logging"), "X.npy"))
+
+
+def test_main_with_profile():
+    import yaml
+    from simulation.run import find_latest_experiment_name
+
+    args = ("--models GaussianPriorsSampling BetaPriorsSampling --name test_profile --steps 50 --save_every 20 "
+            "--profile --arms_nb 10 --a 0.5 --d 100 --reward_distribution binomial --seed 1").split(" ")
+    main(args)
+    path = os.path.join("./logging", find_latest_experiment_name("test_profile", "./logging"))
+    with open(os.path.join(path, "profile"), "r") as f:
+        profile = yaml.safe_load(f)
+    for model_name in ["GaussianPriorsSampling", "BetaPriorsSampling"]:
+        assert profile["phases"][model_name]["choose_arm"]["calls_nb"] == 50
+        assert profile["phases"][model_name]["observe_reward"]["calls_nb"] == 50
+    assert profile["phases"]["environment"]["get_reward"]["calls_nb"] == 50
+    assert [sample["step"] for sample in profile["rss_samples"]] == [0, 20, 40]
+
+
+def test_main_for_delayed_feedback_with_record_checkpoints():
+    from simulation.run import find_latest_experiment_name
+
+    args = ("--models LinearGaussianSampling BetaPriorsSampling --name test_record_checkpoints --steps 200 "
+            "--save_every 32 --batch_size 16 --record checkpoints --arms_nb 10 --a 0.5 --d 100 "
+            "--reward_distribution binomial --seed 1 --v 1").split(" ")
+    main(args)
+    path = os.path.join("./logging", find_latest_experiment_name("test_record_checkpoints", "./logging"))
+    checkpoint_steps = np.load(os.path.join(path, "checkpoint_steps.npy"))
+    assert checkpoint_steps[0] == 1 and checkpoint_steps[-1] == 200
+    for model_name in ["LinearGaussianSampling", "BetaPriorsSampling"]:
+        assert np.load(os.path.join(path, f"arm_counts_{model_name}.npy")).sum() == 200
+        assert len(np.load(os.path.join(path, f"cumulative_regrets_{model_name}.npy"))) == len(checkpoint_steps)
+
+
+def test_main_with_sparse_context_features():
+    import scipy.sparse
+    from simulation.run import find_latest_experiment_name
+
+    args = ("--models LinearSemiParametricSampling LinearGaussianSampling --name test_sparse_X --steps 40 "
+            "--save_every 20 --arms_nb 100 --a 0.5 --d 50 --reward_distribution normal --seed 1 --v 1 "
+            "--sigma_1 1 --sigma_2 1 --sigma_3 1 --X_density 0.1 --mips_clusters_nb 10").split(" ")
+    main(args)
+    path = os.path.join("./logging", find_latest_experiment_name("test_sparse_X", "./logging"))
+    assert scipy.sparse.load_npz(os.path.join(path, "X.npz")).nnz == 500
+    assert len(np.load(os.path.join(path, "regrets_LinearGaussianSampling.npy"))) == 40
+
+
+def test_help_and_validation_of_arguments_do_not_import_numpy():
+    # given
+    script = ("import runpy, sys\n"
+              "sys.argv = ['run.py'] + sys.argv[1:]\n"
+              "try:\n"
+              "    runpy.run_path('simulation/run.py', run_name='__main__')\n"
+              "except (SystemExit, ValueError) as e:\n"
+              "    print(type(e).__name__, 'numpy' in sys.modules, file=sys.stderr)\n")
+    root = os.path.join(os.path.dirname(__file__), "..", "..", "..")
+    invalid_args = ("--models BetaPriorsSampling --name test --steps 10 --save_every 10 --arms_nb 10 --a 0.5 --d 5 "
+                    "--reward_distribution binomial --seed 1 --replicas 2 --record checkpoints").split(" ")
+
+    # when
+    outputs = [subprocess.run([sys.executable, "-c", script] + args, cwd=root, capture_output=True, text=True)
+               for args in [["--help"], invalid_args]]
+
+    # then
+    assert "--models" in outputs[0].stdout
+    assert [output.stderr.splitlines()[-1] for output in outputs] == ["SystemExit False", "ValueError False"]
@@ -0,0 +1,82 @@
+import os
+
+import pytest
+
+from simulation.storage import BackgroundUploader, DirectoryStorage, GCSStorage, get_storage
+
+
+class FlakyStorage(DirectoryStorage):
+    def __init__(self, directory: str, failures_nb: int) -> None:
+        super().__init__(directory)
+        self.failures_nb = failures_nb
+
+    def upload(self, local_path: str, relative_path: str) -> None:
+        if self.failures_nb > 0:
+            self.failures_nb -= 1
+            raise OSError("Temporary failure")
+        super().upload(local_path, relative_path)
+
+
+def write_files(directory, files_nb: int):
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(files_nb):
+        path = os.path.join(directory, f"file_{i}")
+        with open(path, "w") as f:
+            f.write(str(i))
+        paths.append(path)
+    return paths
+
+
+def test_get_storage():
+    assert isinstance(get_storage("gs://bucket/run"), GCSStorage)
+    assert isinstance(get_storage("/tmp/run"), DirectoryStorage)
+
+
+def test_background_uploader_uploads_and_deletes_files(tmp_path):
+    # given
+    paths = write_files(tmp_path / "local", 10)
+    uploader = BackgroundUploader(FlakyStorage(str(tmp_path / "remote"), failures_nb=2), queue_size=2, retry_delay=0)
+
+    # when
+    for path in paths:
+        uploader.submit(path, os.path.basename(path))
+    uploader.close()
+
+    # then
+    assert os.listdir(tmp_path / "local") == []
+    for i in range(10):
+        assert (tmp_path / "remote" / f"file_{i}").read_text() == str(i)
+
+
+def test_background_uploader_keeps_files_which_failed_to_upload(tmp_path):
+    # given
+    paths = write_files(tmp_path / "local", 2)
+    uploader = BackgroundUploader(FlakyStorage(str(tmp_path / "remote"), failures_nb=3), retries=2, retry_delay=0)
+
+    # when
+    for path in paths:
+        uploader.submit(path, os.path.basename(path))
+
+    # then
+    with pytest.raises(RuntimeError, match="file_0"):
+        uploader.close()
+    assert os.listdir(tmp_path / "local") == ["file_0"]
+    assert os.listdir(tmp_path / "remote") == ["file_1"]
+
+
+def test_directory_storage_lists_and_downloads_files(tmp_path):
+    # given
+    storage = DirectoryStorage(str(tmp_path / "remote"))
+    paths = write_files(tmp_path / "local", 2)
+
+    # when
+    names_before_upload = storage.list_names()
+    for path in paths:
+        storage.upload(path, os.path.basename(path))
+    storage.download("file_1", str(tmp_path / "downloaded"))
+
+    # then
+    assert names_before_upload == []
+    assert sorted(storage.list_names()) == ["file_0", "file_1"]
+    assert (tmp_path / "downloaded").read_text() == "1"